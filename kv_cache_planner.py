@@ -0,0 +1,328 @@
+"""
+vLLM KV Cache 容量规划 - 启动前算出 max_model_len、并发数与显存划分
+
+读取模型目录（model_download.py 下载到 cache_dir/<组织>/<模型名>）中的 config.json，
+按 vLLM 的显存分配方式估算:
+
+    可用于 KV Cache 的显存 = 显存总量 × gpu_memory_utilization − 模型权重 − 运行开销
+    每个 token 的 KV Cache  = 2 × 层数 × KV 头数 × head_dim × dtype 字节数
+    （DeepSeek 的 MLA 结构：层数 × (kv_lora_rank + qk_rope_head_dim) × dtype 字节数）
+
+KV Cache 按 block_size 个 token 一块分配，据此给出:
+    - 能启动的最大 max_model_len（单条序列占满上下文也放得下）
+    - 目标上下文长度下的最大并发序列数（max_num_seqs 的参考值）
+    - 权重 / KV Cache / 开销的显存划分
+    - 可以直接使用的 vllm serve 命令行与 LLM(...) 参数
+
+模型权重按目录中 *.safetensors / *.bin 文件的大小计算（没有权重文件时按参数量估算）；
+运行开销（激活峰值、CUDA 上下文等）默认 1.8 GiB，由 KV_Cache_显存不足错误解决方案.md
+中的启动日志反推（24G 显卡、gpu_memory_utilization=0.9、权重 15.27 GiB、可用 KV Cache 4.50 GiB），
+可用 --overhead-gib 调整。
+
+使用方法:
+    python kv_cache_planner.py /root/autodl-tmp/vllm/zpeng1989/Medical_Qwen3_8B_Large_Language_Model \\
+        --gpu-memory-gib 24 --gpu-memory-utilization 0.9
+
+    # fp8 KV Cache，查看 8K 上下文下能同时处理多少条序列
+    python kv_cache_planner.py /root/autodl-tmp/vllm/Qwen/Qwen3-4B --kv-cache-dtype fp8 --target-len 8192
+
+    # 检查某个 max_model_len 能否启动，不能时给出所需的 gpu_memory_utilization
+    python kv_cache_planner.py <模型目录> --max-model-len 40960
+"""
+
+import argparse
+import json
+import math
+import subprocess
+from pathlib import Path
+from typing import Dict, Optional
+
+GiB = 1024 ** 3
+
+# KV Cache dtype 的字节数（auto 表示与模型权重相同）
+DTYPE_BYTES = {
+    'float32': 4, 'float16': 2, 'bfloat16': 2, 'half': 2,
+    'bf16': 2, 'fp16': 2, 'fp8': 1, 'fp8_e4m3': 1, 'fp8_e5m2': 1,
+}
+
+# 运行开销默认值（GiB）：激活峰值 + CUDA 上下文等非 PyTorch 显存
+DEFAULT_OVERHEAD_GIB = 1.8
+
+
+# ============ 读取模型信息 ============
+
+def load_model_config(model_dir: Path) -> Dict:
+    """
+    读取 config.json；多模态模型取其中的语言模型部分（text_config / llm_config）
+
+    Raises:
+        FileNotFoundError: 目录中没有 config.json
+    """
+    with open(Path(model_dir) / 'config.json', 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    for key in ('text_config', 'llm_config', 'language_config'):
+        if isinstance(config.get(key), dict) and 'num_hidden_layers' in config[key]:
+            merged = dict(config[key])
+            merged.setdefault('torch_dtype', config.get('torch_dtype'))
+            return merged
+    return config
+
+
+def kv_bytes_per_token(config: Dict, kv_dtype: str = 'auto', tensor_parallel_size: int = 1) -> int:
+    """
+    单个 token 在单张 GPU 上占用的 KV Cache 字节数
+
+    Args:
+        config: config.json 内容
+        kv_dtype: 'auto' / 'bf16' / 'fp16' / 'fp8'
+        tensor_parallel_size: 张量并行度（KV 头在各卡之间切分，头数少于卡数时每卡至少一个头）
+    """
+    if kv_dtype == 'auto':
+        kv_dtype = config.get('torch_dtype') or 'bfloat16'
+    dtype_bytes = DTYPE_BYTES[kv_dtype]
+    layers = config['num_hidden_layers']
+
+    if config.get('kv_lora_rank'):
+        # MLA：每层缓存压缩后的 latent 向量与 rope 部分，不随头数增长，也不在各卡之间切分
+        return layers * (config['kv_lora_rank'] + config.get('qk_rope_head_dim', 0)) * dtype_bytes
+
+    heads = config['num_attention_heads']
+    kv_heads = config.get('num_key_value_heads') or heads
+    head_dim = config.get('head_dim') or config['hidden_size'] // heads
+    kv_heads_per_gpu = max(1, math.ceil(kv_heads / tensor_parallel_size))
+    return 2 * layers * kv_heads_per_gpu * head_dim * dtype_bytes
+
+
+def estimate_parameters(config: Dict) -> int:
+    """按结构估算参数量（目录中没有权重文件时使用；MoE 模型按全部专家计）"""
+    hidden = config['hidden_size']
+    layers = config['num_hidden_layers']
+    heads = config['num_attention_heads']
+    kv_heads = config.get('num_key_value_heads') or heads
+    head_dim = config.get('head_dim') or hidden // heads
+    intermediate = config.get('moe_intermediate_size') or config.get('intermediate_size', 4 * hidden)
+    experts = config.get('num_experts') or config.get('n_routed_experts') or 1
+    vocab = config.get('vocab_size', 0)
+
+    attention = hidden * head_dim * (2 * heads + 2 * kv_heads)
+    mlp = 3 * hidden * intermediate * experts
+    embeddings = vocab * hidden * (1 if config.get('tie_word_embeddings') else 2)
+    return layers * (attention + mlp) + embeddings
+
+
+def weight_bytes(model_dir: Path, config: Dict, tensor_parallel_size: int = 1) -> int:
+    """单张 GPU 上的模型权重字节数：优先按权重文件大小，否则按参数量估算"""
+    model_dir = Path(model_dir)
+    files = list(model_dir.glob('*.safetensors')) or list(model_dir.glob('*.bin'))
+    if files:
+        total = sum(f.stat().st_size for f in files)
+    else:
+        dtype = config.get('torch_dtype') or 'bfloat16'
+        total = estimate_parameters(config) * DTYPE_BYTES.get(dtype, 2)
+    return total // tensor_parallel_size
+
+
+def detect_gpu_memory_gib() -> Optional[float]:
+    """通过 nvidia-smi 读取第一张 GPU 的显存总量；不可用时返回 None"""
+    try:
+        output = subprocess.run(
+            ['nvidia-smi', '--query-gpu=memory.total', '--format=csv,noheader,nounits'],
+            capture_output=True, text=True, timeout=5, check=True
+        ).stdout
+        return int(output.splitlines()[0]) / 1024
+    except (OSError, subprocess.SubprocessError, ValueError, IndexError):
+        return None
+
+
+# ============ 规划 ============
+
+def plan(
+    config: Dict,
+    weights: int,
+    gpu_memory_gib: float,
+    gpu_memory_utilization: float = 0.9,
+    kv_dtype: str = 'auto',
+    block_size: int = 16,
+    tensor_parallel_size: int = 1,
+    overhead_gib: float = DEFAULT_OVERHEAD_GIB,
+    target_len: Optional[int] = None,
+    max_model_len: Optional[int] = None
+) -> Dict:
+    """
+    计算显存划分与容量
+
+    Args:
+        config: config.json 内容
+        weights: 单卡权重字节数
+        gpu_memory_gib: 单卡显存（GiB）
+        gpu_memory_utilization: vLLM 可使用的显存比例
+        kv_dtype: KV Cache dtype
+        block_size: KV Cache 块大小（token）
+        tensor_parallel_size: 张量并行度
+        overhead_gib: 激活峰值与 CUDA 上下文等开销（GiB）
+        target_len: 计算并发数时假设的每条序列长度，默认取可行的 max_model_len
+        max_model_len: 希望使用的 max_model_len（检查能否启动）
+
+    Returns:
+        规划结果（字节数与 token 数）
+    """
+    per_token = kv_bytes_per_token(config, kv_dtype, tensor_parallel_size)
+    budget = gpu_memory_gib * GiB * gpu_memory_utilization
+    overhead = overhead_gib * GiB
+    kv_memory = max(0, int(budget - weights - overhead))
+    num_blocks = kv_memory // (per_token * block_size)
+    capacity = num_blocks * block_size
+    position_limit = config.get('max_position_embeddings') or capacity
+
+    feasible = min(capacity, position_limit)
+    # 取 1024 的整数倍作为推荐值（不足 1024 时按块对齐）
+    recommended = feasible // 1024 * 1024 or feasible // block_size * block_size
+
+    requested = max_model_len or recommended
+    target = target_len or requested
+    blocks_per_seq = math.ceil(target / block_size) if target else 0
+    max_seqs = num_blocks // blocks_per_seq if blocks_per_seq else 0
+
+    # 让 requested 刚好能启动所需的 gpu_memory_utilization
+    need_kv = math.ceil(requested / block_size) * block_size * per_token
+    required_utilization = (weights + overhead + need_kv) / (gpu_memory_gib * GiB)
+
+    return {
+        'kv_bytes_per_token': per_token,
+        'weights': weights,
+        'overhead': int(overhead),
+        'kv_cache': kv_memory,
+        'unused': int(gpu_memory_gib * GiB - budget),
+        'num_blocks': num_blocks,
+        'kv_capacity_tokens': capacity,
+        'max_position_embeddings': position_limit,
+        'max_feasible_len': feasible,
+        'recommended_len': recommended,
+        'max_model_len': requested,
+        'fits': requested <= capacity,
+        'exceeds_position_limit': requested > position_limit,
+        'required_utilization': required_utilization,
+        'target_len': target,
+        'max_num_seqs': max_seqs,
+    }
+
+
+def serve_args(model_dir: Path, result: Dict, args: argparse.Namespace) -> str:
+    """生成 vllm serve 命令行"""
+    parts = [
+        f"vllm serve {model_dir}",
+        f"--max-model-len {result['max_model_len']}",
+        f"--gpu-memory-utilization {args.gpu_memory_utilization}",
+        f"--block-size {args.block_size}",
+        f"--max-num-seqs {max(1, result['max_num_seqs'])}",
+        f"--tensor-parallel-size {args.tensor_parallel_size}",
+        "--trust-remote-code",
+    ]
+    if args.kv_cache_dtype != 'auto':
+        parts.insert(3, f"--kv-cache-dtype {args.kv_cache_dtype}")
+    return " \\\n    ".join(parts)
+
+
+def llm_kwargs(model_dir: Path, result: Dict, args: argparse.Namespace) -> Dict:
+    """生成 LLM(...) 的参数"""
+    kwargs = {
+        'model': str(model_dir),
+        'max_model_len': result['max_model_len'],
+        'gpu_memory_utilization': args.gpu_memory_utilization,
+        'block_size': args.block_size,
+        'max_num_seqs': max(1, result['max_num_seqs']),
+        'tensor_parallel_size': args.tensor_parallel_size,
+        'trust_remote_code': True,
+    }
+    if args.kv_cache_dtype != 'auto':
+        kwargs['kv_cache_dtype'] = args.kv_cache_dtype
+    return kwargs
+
+
+def print_report(model_dir: Path, config: Dict, result: Dict, args: argparse.Namespace):
+    def gib(value: float) -> str:
+        return f"{value / GiB:.2f} GiB"
+
+    print("=" * 60)
+    print(f"模型: {model_dir}")
+    print(f"结构: {config['num_hidden_layers']} 层, "
+          f"KV Cache {result['kv_bytes_per_token'] / 1024:.1f} KiB/token "
+          f"(dtype={args.kv_cache_dtype}, TP={args.tensor_parallel_size})")
+    print("-" * 60)
+    print(f"显存: {args.gpu_memory_gib:.1f} GiB × {args.gpu_memory_utilization}")
+    print(f"  模型权重   {gib(result['weights'])}")
+    print(f"  运行开销   {gib(result['overhead'])}")
+    print(f"  KV Cache   {gib(result['kv_cache'])}  "
+          f"({result['num_blocks']} 块 × {args.block_size} token = {result['kv_capacity_tokens']} token)")
+    print(f"  未使用     {gib(result['unused'])}  (1 - gpu_memory_utilization)")
+    print("-" * 60)
+    print(f"模型支持的最大长度 (max_position_embeddings): {result['max_position_embeddings']}")
+    print(f"可启动的最大 max_model_len: {result['max_feasible_len']}"
+          f"（推荐 {result['recommended_len']}）")
+    if not result['fits']:
+        print(f"⚠️  max_model_len={result['max_model_len']} 无法启动："
+              f"需要 {result['max_model_len'] * result['kv_bytes_per_token'] / GiB:.2f} GiB KV Cache，"
+              f"至少需要 gpu_memory_utilization={result['required_utilization']:.2f}")
+    if result['exceeds_position_limit']:
+        print(f"⚠️  max_model_len={result['max_model_len']} 超过模型支持的最大长度 "
+              f"{result['max_position_embeddings']}，vLLM 会拒绝启动")
+    print(f"每条序列 {result['target_len']} token 时最多并发 {result['max_num_seqs']} 条")
+    print("=" * 60)
+    if result['fits'] and not result['exceeds_position_limit'] and result['max_num_seqs'] > 0:
+        print("\nvllm serve 参数:\n")
+        print(serve_args(model_dir, result, args))
+        print("\nLLM(...) 参数:\n")
+        print(json.dumps(llm_kwargs(model_dir, result, args), ensure_ascii=False, indent=2))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="vLLM KV Cache 容量规划")
+    parser.add_argument("model_dir", help="模型目录（包含 config.json）")
+    parser.add_argument("--gpu-memory-gib", type=float,
+                        help="单卡显存 GiB；不指定时通过 nvidia-smi 读取")
+    parser.add_argument("--gpu-memory-utilization", type=float, default=0.9)
+    parser.add_argument("--kv-cache-dtype", default="auto", choices=["auto", "bf16", "fp16", "fp8"])
+    parser.add_argument("--block-size", type=int, default=16)
+    parser.add_argument("--tensor-parallel-size", type=int, default=1)
+    parser.add_argument("--overhead-gib", type=float, default=DEFAULT_OVERHEAD_GIB,
+                        help="激活峰值与 CUDA 上下文等开销")
+    parser.add_argument("--weights-gib", type=float, help="单卡权重大小（覆盖按文件计算的值）")
+    parser.add_argument("--max-model-len", type=int, help="检查该长度能否启动")
+    parser.add_argument("--target-len", type=int, help="计算并发数时每条序列的长度")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出规划结果")
+    args = parser.parse_args()
+    if args.gpu_memory_gib is None:
+        args.gpu_memory_gib = detect_gpu_memory_gib()
+        if args.gpu_memory_gib is None:
+            parser.error("无法通过 nvidia-smi 读取显存，请指定 --gpu-memory-gib")
+    return args
+
+
+def main():
+    args = parse_args()
+    model_dir = Path(args.model_dir)
+    config = load_model_config(model_dir)
+    weights = (int(args.weights_gib * GiB) if args.weights_gib is not None
+               else weight_bytes(model_dir, config, args.tensor_parallel_size))
+    result = plan(
+        config,
+        weights,
+        args.gpu_memory_gib,
+        gpu_memory_utilization=args.gpu_memory_utilization,
+        kv_dtype=args.kv_cache_dtype,
+        block_size=args.block_size,
+        tensor_parallel_size=args.tensor_parallel_size,
+        overhead_gib=args.overhead_gib,
+        target_len=args.target_len,
+        max_model_len=args.max_model_len,
+    )
+    if args.json:
+        result['vllm_serve'] = serve_args(model_dir, result, args)
+        result['llm_kwargs'] = llm_kwargs(model_dir, result, args)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print_report(model_dir, config, result, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,578 @@
-#模型下载
-from modelscope import snapshot_download
-# model_dir = snapshot_download('deepseek-ai/DeepSeek-R1-Distill-Qwen-1.5B', cache_dir='/root/autodl-tmp/vllm', revision='master')
+"""
+模型下载 - 按清单并行下载、断点续传，本地索引记录已完成文件的大小与校验和
 
-# model_dir = snapshot_download('Qwen/Qwen3-4B', cache_dir='/root/autodl-tmp/vllm', revision='master')
+清单（models.yaml，也支持 .toml / .json）列出要下载的模型与版本:
+    cache_dir: /root/autodl-tmp/vllm
+    hub: modelscope                  # 或 huggingface
+    max_bandwidth: 50M               # 可选：总带宽上限（字节/秒）
+    models:
+      - id: Qwen/Qwen3-4B
+        revision: master
+      - id: deepseek-ai/DeepSeek-OCR
+        allow: ["*.json", "*.safetensors"]     # 可选：只下载匹配的文件
+        ignore: ["*.pth"]                      # 可选：跳过匹配的文件
 
-# model_dir = snapshot_download('zpeng1989/Medical_Qwen3_8B_Large_Language_Model', cache_dir='/root/autodl-tmp/vllm', revision='master')
+下载方式:
+    - 所有模型的所有文件放进同一个线程池并发下载（大文件先开始），--max-bandwidth 限制总带宽
+    - 文件先写入 <文件名>.incomplete，中断后重跑按已有大小发送 Range 请求续传
+    - 下载过程中边写边计算 sha256，完成后与仓库给出的大小 / sha256 比对，再改名为正式文件
+    - cache_dir/.download_index.json 记录每个已完成文件的大小、sha256 与 mtime；
+      重跑时大小、mtime 与仓库信息都一致的文件直接跳过，不重新计算多 GB 分片的哈希
 
+目录结构与 modelscope 的 snapshot_download 相同（cache_dir/<组织>/<模型名>，模型名中的 "." 写作 "___"），
+已有的 vllm serve 路径不需要修改。仓库后端可替换：ModelScope、Hugging Face（支持 HF_ENDPOINT 镜像），
+或任何实现同样接口的本地 HTTP 服务（endpoint 指向它即可）。
 
-model_dir = snapshot_download('deepseek-ai/DeepSeek-OCR', cache_dir='/root/autodl-tmp/vllm', revision='master')
+使用方法:
+    python model_download.py                                  # 下载 models.yaml 中的全部模型
+    python model_download.py my_models.yaml --jobs 8 --max-bandwidth 50M
+    python model_download.py --model Qwen/Qwen3-4B@master --cache-dir /root/autodl-tmp/vllm
+    python model_download.py --verify                         # 重新计算全部文件的 sha256
 
+    # 程序中使用（与原来的 modelscope 调用方式相同）
+    from model_download import snapshot_download
+    model_dir = snapshot_download('Qwen/Qwen3-4B', cache_dir='/root/autodl-tmp/vllm', revision='master')
+"""
+
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import requests
+
+DEFAULT_CACHE_DIR = '/root/autodl-tmp/vllm'
+DEFAULT_MANIFEST = Path(__file__).resolve().parent / 'models.yaml'
+INDEX_NAME = '.download_index.json'
+PART_SUFFIX = '.incomplete'
+CHUNK_SIZE = 1024 * 1024
+
+
+# ============ 仓库后端 ============
+
+@dataclass
+class RemoteFile:
+    """仓库中的一个文件"""
+    path: str                           # 仓库内的相对路径
+    size: int
+    sha256: Optional[str] = None        # 仓库没有给出时为 None（只校验大小）
+
+
+class HubBackend:
+    """
+    模型仓库后端：列出文件并给出下载地址，下载本身（续传、限速、校验）由下载器完成
+    """
+
+    name = ''
+    default_endpoint = ''
+    default_revision = 'master'
+
+    def __init__(self, endpoint: Optional[str] = None, token: Optional[str] = None):
+        """
+        Args:
+            endpoint: 仓库地址（镜像站或本地 HTTP 服务）；不指定时使用官方地址
+            token: 访问私有模型的令牌
+        """
+        self.endpoint = (endpoint or self.default_endpoint).rstrip('/')
+        self.token = token
+
+    def headers(self) -> Dict[str, str]:
+        return {'Authorization': f'Bearer {self.token}'} if self.token else {}
+
+    def list_files(self, session: requests.Session, model_id: str, revision: str) -> List[RemoteFile]:
+        raise NotImplementedError
+
+    def file_url(self, model_id: str, revision: str, path: str) -> str:
+        raise NotImplementedError
+
+    def local_dir(self, cache_dir: Path, model_id: str) -> Path:
+        """模型的本地目录"""
+        return cache_dir / model_id
+
+
+class ModelScopeBackend(HubBackend):
+    """ModelScope（魔搭）仓库"""
+
+    name = 'modelscope'
+    default_endpoint = 'https://www.modelscope.cn'
+
+    def list_files(self, session: requests.Session, model_id: str, revision: str) -> List[RemoteFile]:
+        response = session.get(
+            f"{self.endpoint}/api/v1/models/{model_id}/repo/files",
+            params={'Revision': revision, 'Recursive': 'True'},
+            headers=self.headers(),
+            timeout=30
+        )
+        response.raise_for_status()
+        files = (response.json().get('Data') or {}).get('Files') or []
+        return [
+            RemoteFile(item['Path'], int(item.get('Size') or 0), item.get('Sha256') or None)
+            for item in files if item.get('Type') != 'tree'
+        ]
+
+    def file_url(self, model_id: str, revision: str, path: str) -> str:
+        return f"{self.endpoint}/api/v1/models/{model_id}/repo?Revision={revision}&FilePath={path}"
+
+    def local_dir(self, cache_dir: Path, model_id: str) -> Path:
+        # 与 modelscope.snapshot_download 相同：Qwen2.5 → Qwen2___5
+        return cache_dir / model_id.replace('.', '___')
+
+
+class HuggingFaceBackend(HubBackend):
+    """Hugging Face 仓库（HF_ENDPOINT 环境变量可指定镜像站）"""
+
+    name = 'huggingface'
+    default_endpoint = 'https://huggingface.co'
+    default_revision = 'main'
+
+    def __init__(self, endpoint: Optional[str] = None, token: Optional[str] = None):
+        super().__init__(endpoint or os.environ.get('HF_ENDPOINT'), token or os.environ.get('HF_TOKEN'))
+
+    def list_files(self, session: requests.Session, model_id: str, revision: str) -> List[RemoteFile]:
+        files = []
+        url = f"{self.endpoint}/api/models/{model_id}/tree/{revision}?recursive=true"
+        while url:
+            response = session.get(url, headers=self.headers(), timeout=30)
+            response.raise_for_status()
+            for item in response.json():
+                if item.get('type') != 'file':
+                    continue
+                lfs = item.get('lfs') or {}
+                files.append(RemoteFile(item['path'], int(item.get('size') or 0), lfs.get('oid')))
+            url = response.links.get('next', {}).get('url')     # 文件较多时分页
+        return files
+
+    def file_url(self, model_id: str, revision: str, path: str) -> str:
+        return f"{self.endpoint}/{model_id}/resolve/{revision}/{path}"
+
+
+BACKENDS = {
+    ModelScopeBackend.name: ModelScopeBackend,
+    HuggingFaceBackend.name: HuggingFaceBackend,
+}
+
+
+# ============ 带宽限制与完整性索引 ============
+
+class Throttle:
+    """
+    全局带宽上限（令牌桶，所有下载线程共享）；bytes_per_second 为 None 时不限速
+    """
+
+    def __init__(self, bytes_per_second: Optional[float] = None):
+        self.rate = bytes_per_second
+        self._allowance = bytes_per_second or 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, size: int):
+        """记录 size 字节，超出速率时阻塞相应的时间"""
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._allowance = min(self.rate, self._allowance + (now - self._updated) * self.rate)
+            self._updated = now
+            self._allowance -= size
+            delay = -self._allowance / self.rate if self._allowance < 0 else 0.0
+        if delay:
+            time.sleep(delay)
+
+
+class DownloadIndex:
+    """
+    cache_dir/.download_index.json：已完成文件的大小、sha256、mtime（线程安全）
+    """
+
+    def __init__(self, cache_dir: Path):
+        self.path = cache_dir / INDEX_NAME
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = {}
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+
+    def is_complete(self, key: str, local: Path, remote: RemoteFile, revision: str) -> bool:
+        """索引中的记录与本地文件、仓库信息（含版本）都一致（不读取文件内容）"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return False
+        try:
+            stat = local.stat()
+        except FileNotFoundError:
+            return False
+        return (entry.get('revision') == revision
+                and entry['size'] == stat.st_size == remote.size
+                and entry['mtime_ns'] == stat.st_mtime_ns
+                and (remote.sha256 is None or entry['sha256'] == remote.sha256))
+
+    def matches(self, key: str, sha256: str, revision: str) -> bool:
+        """索引中有同一版本、同一 sha256 的记录（仓库没有给出 sha256 时据此判断本地文件是否可用）"""
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry is not None and entry.get('revision') == revision and entry['sha256'] == sha256
+
+    def record(self, key: str, local: Path, sha256: str, revision: str):
+        """记录一个已完成的文件，并立即写回磁盘（中途中断也不会丢失已完成的记录）"""
+        stat = local.stat()
+        with self._lock:
+            self._entries[key] = {
+                'size': stat.st_size,
+                'sha256': sha256,
+                'mtime_ns': stat.st_mtime_ns,
+                'revision': revision,
+            }
+            temp = self.path.with_name(self.path.name + '.tmp')
+            with open(temp, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False, indent=1)
+            os.replace(temp, self.path)
+
+
+def sha256_file(path: Path, hasher=None):
+    """逐块计算文件的 sha256（可在已有 hasher 上继续）"""
+    hasher = hasher or hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(CHUNK_SIZE)
+            if not block:
+                return hasher
+            hasher.update(block)
+
+
+# ============ 下载 ============
+
+class IntegrityError(Exception):
+    """下载完成的文件与仓库给出的大小或 sha256 不一致"""
+
+
+@dataclass
+class FileTask:
+    """一个待处理的文件"""
+    model_id: str
+    revision: str
+    backend: HubBackend
+    remote: RemoteFile
+    local: Path
+    key: str                            # 索引键：相对 cache_dir 的路径
+
+
+def parse_size(text: Union[str, int, float, None]) -> Optional[float]:
+    """解析 "50M"、"1.5G"、"800K"、"1048576" 形式的字节数（1K = 1024）"""
+    if text is None or isinstance(text, (int, float)):
+        return text
+    text = text.strip().upper().rstrip('B').rstrip('I')
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+
+def _selected(path: str, allow: Optional[List[str]], ignore: Optional[List[str]]) -> bool:
+    if allow and not any(fnmatch.fnmatch(path, pattern) for pattern in allow):
+        return False
+    return not (ignore and any(fnmatch.fnmatch(path, pattern) for pattern in ignore))
+
+
+def _entry_backend(entry: Dict, default: HubBackend) -> HubBackend:
+    """清单条目使用的后端（条目可以单独指定 hub / endpoint）"""
+    if not (entry.get('hub') or entry.get('endpoint')):
+        return default
+    return BACKENDS[entry.get('hub', default.name)](entry.get('endpoint'))
+
+
+class Downloader:
+    """
+    并行、可续传的模型下载器
+    """
+
+    def __init__(
+        self,
+        cache_dir: Union[str, Path] = DEFAULT_CACHE_DIR,
+        jobs: int = 8,
+        max_bandwidth: Optional[float] = None,
+        retries: int = 3,
+        verify: bool = False,
+        timeout: float = 60.0
+    ):
+        """
+        Args:
+            cache_dir: 下载目录
+            jobs: 同时下载的文件数
+            max_bandwidth: 总带宽上限（字节/秒），None 表示不限
+            retries: 单个文件失败后的重试次数（每次从已下载的位置续传）
+            verify: 忽略索引，重新计算全部已有文件的 sha256
+            timeout: HTTP 连接 / 读取超时（秒）
+        """
+        self.cache_dir = Path(cache_dir)
+        self.jobs = jobs
+        self.retries = retries
+        self.verify = verify
+        self.timeout = timeout
+        self.throttle = Throttle(max_bandwidth)
+        self.index = DownloadIndex(self.cache_dir) if self.cache_dir.exists() else None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._downloaded = 0            # 本次实际下载的字节数（进度显示用）
+
+    def _session(self) -> requests.Session:
+        """每个线程一个会话（复用连接）"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def plan(self, models: List[Dict], default_backend: HubBackend) -> List[FileTask]:
+        """
+        列出全部模型的文件
+
+        Args:
+            models: 清单中的模型条目（id、revision、allow、ignore、hub、endpoint）
+            default_backend: 条目没有指定 hub 时使用的后端
+        """
+        tasks = []
+        session = self._session()
+        for entry in models:
+            backend = _entry_backend(entry, default_backend)
+            model_id = entry['id']
+            revision = str(entry.get('revision') or backend.default_revision)
+            local_dir = backend.local_dir(self.cache_dir, model_id)
+            for remote in backend.list_files(session, model_id, revision):
+                if not _selected(remote.path, entry.get('allow'), entry.get('ignore')):
+                    continue
+                local = local_dir / remote.path
+                tasks.append(FileTask(
+                    model_id, revision, backend, remote, local,
+                    local.relative_to(self.cache_dir).as_posix()
+                ))
+        return tasks
+
+    def _is_complete(self, task: FileTask) -> bool:
+        """
+        文件已完整：先查索引（不读文件），索引中没有时按大小与 sha256 校验一次并补记索引
+        仓库没有给出 sha256 时（config.json 等非 LFS 文件）大小相同不足以说明内容相同，
+        只有索引中同一版本记录的 sha256 与本地文件一致才跳过，否则重新下载
+        """
+        if not self.verify and self.index.is_complete(task.key, task.local, task.remote, task.revision):
+            return True
+        if not task.local.exists() or task.local.stat().st_size != task.remote.size:
+            return False
+        digest = sha256_file(task.local).hexdigest()
+        if task.remote.sha256 is None:
+            if not self.index.matches(task.key, digest, task.revision):
+                return False
+        elif digest != task.remote.sha256:
+            return False
+        self.index.record(task.key, task.local, digest, task.revision)
+        return True
+
+    def _fetch(self, task: FileTask):
+        """下载一个文件到 .incomplete（续传），校验后改名"""
+        part = task.local.with_name(task.local.name + PART_SUFFIX)
+        part.parent.mkdir(parents=True, exist_ok=True)
+        offset = part.stat().st_size if part.exists() else 0
+        if offset > task.remote.size:
+            part.unlink()
+            offset = 0
+        hasher = sha256_file(part) if offset else hashlib.sha256()
+
+        headers = dict(task.backend.headers())
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+        url = task.backend.file_url(task.model_id, task.revision, task.remote.path)
+        with self._session().get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 416 and offset == task.remote.size:
+                pass    # 上次已经下载完，只差校验与改名
+            else:
+                response.raise_for_status()
+                if offset and response.status_code != 206:
+                    # 服务端不支持 Range：从头下载
+                    offset = 0
+                    hasher = hashlib.sha256()
+                with open(part, 'ab' if offset else 'wb') as f:
+                    for block in response.iter_content(CHUNK_SIZE):
+                        self.throttle.consume(len(block))
+                        f.write(block)
+                        hasher.update(block)
+                        with self._lock:
+                            self._downloaded += len(block)
+
+        size = part.stat().st_size
+        digest = hasher.hexdigest()
+        if size != task.remote.size or (task.remote.sha256 is not None and digest != task.remote.sha256):
+            part.unlink()
+            raise IntegrityError(
+                f"{task.key}: 大小 {size} / sha256 {digest[:12]}… 与仓库不一致"
+                f"（{task.remote.size} / {(task.remote.sha256 or '-')[:12]}…）"
+            )
+        os.replace(part, task.local)
+        self.index.record(task.key, task.local, digest, task.revision)
+
+    def _run(self, task: FileTask) -> Tuple[FileTask, str]:
+        """处理一个文件，返回 (任务, 'skipped' / 'downloaded')；重试用完后抛出最后一次的异常"""
+        if self._is_complete(task):
+            return task, 'skipped'
+        for attempt in range(self.retries + 1):
+            try:
+                self._fetch(task)
+                return task, 'downloaded'
+            except (requests.RequestException, IntegrityError, OSError):
+                if attempt == self.retries:
+                    raise
+                time.sleep(min(30.0, 2 ** attempt))
+
+    def download(
+        self,
+        models: List[Dict],
+        backend: Optional[HubBackend] = None,
+        progress_interval: float = 5.0
+    ) -> Dict[str, Path]:
+        """
+        下载清单中的全部模型
+
+        Args:
+            models: [{'id': 'Qwen/Qwen3-4B', 'revision': 'master'}, ...]
+            backend: 默认后端，不指定时使用 ModelScope
+            progress_interval: 进度输出间隔（秒）
+
+        Returns:
+            {模型 ID: 本地目录}
+
+        Raises:
+            RuntimeError: 有文件在重试后仍然失败（其余文件照常完成）
+        """
+        backend = backend or ModelScopeBackend()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        if self.index is None:
+            self.index = DownloadIndex(self.cache_dir)
+
+        tasks = self.plan(models, backend)
+        tasks.sort(key=lambda t: t.remote.size, reverse=True)     # 大文件先开始，缩短总耗时
+        total = sum(t.remote.size for t in tasks)
+        print(f"共 {len(models)} 个模型、{len(tasks)} 个文件、{total / 1024 ** 3:.2f} GiB，"
+              f"{self.jobs} 个并发" + (f"，限速 {self.throttle.rate / 1024 ** 2:.1f} MiB/s"
+                                      if self.throttle.rate else ""))
+
+        start = time.perf_counter()
+        counts = {'skipped': 0, 'downloaded': 0}
+        failures = []
+        with ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="model-download") as pool:
+            pending = {pool.submit(self._run, task): task for task in tasks}
+            while pending:
+                done, _ = wait(pending, timeout=progress_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = pending.pop(future)
+                    try:
+                        _, status = future.result()
+                        counts[status] += 1
+                        if status == 'downloaded':
+                            print(f"✅ {task.key} ({task.remote.size / 1024 ** 2:.1f} MiB)")
+                    except Exception as e:
+                        failures.append((task, e))
+                        print(f"❌ {task.key}: {e}")
+                if not done:
+                    elapsed = time.perf_counter() - start
+                    print(f"   已下载 {self._downloaded / 1024 ** 3:.2f} GiB，"
+                          f"{self._downloaded / 1024 ** 2 / elapsed:.1f} MiB/s，剩余 {len(pending)} 个文件")
+
+        elapsed = time.perf_counter() - start
+        print(f"完成：下载 {counts['downloaded']} 个、跳过 {counts['skipped']} 个已完整的文件，"
+              f"{self._downloaded / 1024 ** 3:.2f} GiB / {elapsed:.1f}s"
+              f"（{self._downloaded / 1024 ** 2 / max(elapsed, 1e-9):.1f} MiB/s）")
+        if failures:
+            raise RuntimeError(f"{len(failures)} 个文件下载失败，重新运行会从断点续传")
+
+        return {
+            entry['id']: _entry_backend(entry, backend).local_dir(self.cache_dir, entry['id'])
+            for entry in models
+        }
+
+
+# ============ 清单与命令行 ============
+
+def load_manifest(path: Path) -> Dict:
+    """读取下载清单（.yaml / .yml、.toml 或 .json）"""
+    if path.suffix == '.toml':
+        import tomllib
+        with open(path, 'rb') as f:
+            manifest = tomllib.load(f)
+    elif path.suffix == '.json':
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    else:
+        import yaml
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = yaml.safe_load(f) or {}
+    manifest['models'] = [
+        {'id': entry} if isinstance(entry, str) else entry
+        for entry in manifest.get('models') or []
+    ]
+    return manifest
+
+
+def snapshot_download(
+    model_id: str,
+    cache_dir: Union[str, Path] = DEFAULT_CACHE_DIR,
+    revision: Optional[str] = None,
+    hub: str = 'modelscope',
+    **kwargs
+) -> str:
+    """
+    下载单个模型并返回本地目录（与 modelscope.snapshot_download 的常用参数相同）
+
+    Example:
+        >>> model_dir = snapshot_download('Qwen/Qwen3-4B', cache_dir='/root/autodl-tmp/vllm', revision='master')
+    """
+    backend = BACKENDS[hub]()
+    dirs = Downloader(cache_dir, **kwargs).download([{'id': model_id, 'revision': revision}], backend)
+    return str(dirs[model_id])
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="按清单并行下载模型（断点续传、完整性索引）")
+    parser.add_argument("manifest", nargs="?", default=str(DEFAULT_MANIFEST), help="下载清单（.yaml / .toml / .json）")
+    parser.add_argument("--model", action="append", default=[], metavar="ID[@REVISION]",
+                        help="直接指定模型（可重复），指定时不读取清单")
+    parser.add_argument("--cache-dir", help="下载目录（覆盖清单中的 cache_dir）")
+    parser.add_argument("--hub", choices=sorted(BACKENDS), help="仓库后端（覆盖清单中的 hub）")
+    parser.add_argument("--endpoint", help="仓库地址：镜像站或本地 HTTP 服务")
+    parser.add_argument("--jobs", type=int, default=8, help="同时下载的文件数")
+    parser.add_argument("--max-bandwidth", help="总带宽上限，例如 50M（字节/秒）")
+    parser.add_argument("--retries", type=int, default=3, help="单个文件的重试次数")
+    parser.add_argument("--verify", action="store_true", help="忽略索引，重新计算全部文件的 sha256")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    if args.model:
+        manifest = {'models': []}
+        for item in args.model:
+            model_id, _, revision = item.partition('@')
+            manifest['models'].append({'id': model_id, 'revision': revision or None})
+    else:
+        manifest = load_manifest(Path(args.manifest))
+    if not manifest['models']:
+        raise SystemExit("清单中没有模型")
+
+    backend = BACKENDS[args.hub or manifest.get('hub', 'modelscope')](args.endpoint or manifest.get('endpoint'))
+    downloader = Downloader(
+        args.cache_dir or manifest.get('cache_dir', DEFAULT_CACHE_DIR),
+        jobs=args.jobs,
+        max_bandwidth=parse_size(args.max_bandwidth or manifest.get('max_bandwidth')),
+        retries=args.retries,
+        verify=args.verify
+    )
+    for model_id, model_dir in downloader.download(manifest['models'], backend).items():
+        print(f"{model_id} -> {model_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+"""
+vLLM 异步客户端 - 基于 httpx.AsyncClient / AsyncOpenAI
+与 VLLMClient 接口一一对应，单个事件循环即可驱动数百个并发请求（含流式输出）
+
+与同步客户端的区别:
+    - 所有请求共享一个有上限的连接池，TCP 连接在请求之间复用，
+      不再每次调用都经过 SSH 隧道重新握手
+    - 连接池满时请求排队等待空闲连接（pool 超时为 None），而不是报错
+    - 复用连接经过与同步客户端相同的隧道安全处理（空闲超时、存活探测、一次性重连），
+      见 connection_pool.py
+    - 可选传入 limiter=AdaptiveLimiter()：每个请求先取得许可，在途请求数随 TTFT 与服务端
+      压力自动调整，而不是一次把上千个协程全部压到服务端排队（见 concurrency_limiter.py）
+
+使用方法:
+    import asyncio
+    from async_vllm_client import AsyncVLLMClient
+
+    async def main():
+        async with AsyncVLLMClient(max_connections=256) as client:
+            answers = await asyncio.gather(
+                *(client.chat(f"用一句话介绍数字 {i}") for i in range(100))
+            )
+
+            stream = client.chat_stream("讲个故事")
+            async for chunk in stream:
+                print(chunk, end="", flush=True)
+            print(stream.meta.ttft, answers[0].meta.completion_tokens)
+
+    asyncio.run(main())
+"""
+
+import asyncio
+import time
+from typing import AsyncIterator, Dict, List, Literal, Optional
+
+# AsyncOpenAI 只在 backend='openai' 时导入（见 __init__），默认的 httpx 后端不增加启动时间
+import httpx
+
+from chat_result import AsyncChatStream, ChatMeta, ChatResult
+from concurrency_limiter import AdaptiveLimiter, is_overload, latency_signal
+from connection_pool_httpx import TunnelSafeAsyncTransport
+from sse_stream import SSEChatParser, aiter_sse_data
+
+
+class AsyncVLLMClient:
+    """
+    vLLM 异步客户端
+    支持两种后端：'httpx'（直接发 HTTP 请求，开销最小）或 'openai'（AsyncOpenAI SDK）
+    两种后端共用同一个 httpx 连接池
+    """
+
+    def __init__(
+        self,
+        base_url: str = "http://localhost:9000",
+        api_key: str = "muyu",
+        model: str = "Medical_Qwen3_8B_Large_Language_Model",
+        backend: Literal['httpx', 'openai'] = 'httpx',
+        timeout: float = 120.0,
+        max_connections: int = 512,
+        max_keepalive_connections: int = 64,
+        keepalive_expiry: float = 5.0,
+        limiter: Optional[AdaptiveLimiter] = None
+    ):
+        """
+        初始化异步客户端
+
+        Args:
+            base_url: vLLM API 服务地址
+            api_key: API 密钥
+            model: 模型名称
+            backend: 后端实现 ('httpx' 或 'openai')
+            timeout: 单次请求的读写超时时间（秒）
+            max_connections: 连接池最大连接数，即同时在途的请求上限
+            max_keepalive_connections: 空闲时保留的长连接数
+            keepalive_expiry: 空闲连接的最长保留时间（秒），
+                取值较短可避免复用已被 SSH 隧道悄悄断开的连接
+            limiter: 自适应并发限制器；给出时每个请求先取得许可，
+                流式请求以 TTFT、非流式请求以 总耗时 / 输出 token 数 作为延迟信号
+
+        Example:
+            >>> client = AsyncVLLMClient(max_connections=256)
+            >>> client = AsyncVLLMClient(backend='openai')
+            >>> client = AsyncVLLMClient(limiter=AdaptiveLimiter(initial=16, max_limit=256))
+        """
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.model = model
+        self.backend = backend
+        self.timeout = timeout
+        self.limiter = limiter
+
+        self._http = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {api_key}"
+            },
+            # pool=None：连接池满时排队等待，而不是抛出 PoolTimeout
+            timeout=httpx.Timeout(timeout, connect=10.0, pool=None),
+            transport=TunnelSafeAsyncTransport(
+                max_idle=keepalive_expiry,
+                pool_size=max_keepalive_connections,
+                max_connections=max_connections
+            )
+        )
+
+        if backend == 'openai':
+            from openai import AsyncOpenAI
+            self._openai_client = AsyncOpenAI(
+                base_url=f"{self.base_url}/v1",
+                api_key=api_key,
+                http_client=self._http,
+                max_retries=0
+            )
+
+    def _build_payload(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        top_p: float,
+        **kwargs
+    ) -> Dict:
+        """构造 /v1/chat/completions 请求体"""
+        return {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "top_p": top_p,
+            **kwargs
+        }
+
+    async def chat(
+        self,
+        message: str,
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        top_p: float = 0.95,
+        **kwargs
+    ) -> ChatResult:
+        """
+        简单对话接口
+
+        Args:
+            message: 用户输入
+            max_tokens: 最大生成token数
+            temperature: 温度参数（0-2）
+            top_p: top_p采样参数（0-1）
+            **kwargs: 其他API参数
+
+        Returns:
+            模型回复内容（str 子类，.meta 为本次调用的用量与时延）
+
+        Example:
+            >>> response = await client.chat("你好，请介绍一下你自己")
+        """
+        messages = [{"role": "user", "content": message}]
+        return await self.chat_with_history(messages, max_tokens, temperature, top_p, **kwargs)
+
+    async def chat_with_history(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        top_p: float = 0.95,
+        **kwargs
+    ) -> ChatResult:
+        """
+        多轮对话接口
+
+        Args:
+            messages: 对话历史列表
+            max_tokens: 最大生成token数
+            temperature: 温度参数
+            top_p: top_p采样参数
+            **kwargs: 其他API参数
+
+        Returns:
+            模型回复内容（str 子类，.meta 为本次调用的用量与时延）
+        """
+        if self.limiter is None:
+            return await self._complete(messages, max_tokens, temperature, top_p, **kwargs)
+
+        await self.limiter.acquire_async()
+        try:
+            result = await self._complete(messages, max_tokens, temperature, top_p, **kwargs)
+        except BaseException as e:
+            self.limiter.release(overload=is_overload(e))
+            raise
+        self.limiter.release(latency_signal(result.meta))
+        return result
+
+    async def _complete(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        top_p: float,
+        **kwargs
+    ) -> ChatResult:
+        """发送非流式请求"""
+        meta = ChatMeta()
+        start = time.perf_counter()
+        if self.backend == 'openai':
+            completion = await self._openai_client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                **kwargs
+            )
+            choice = completion.choices[0]
+            meta.finish_reason = choice.finish_reason
+            if completion.usage is not None:
+                meta.update_usage(completion.usage.model_dump())
+            meta.latency = time.perf_counter() - start
+            return ChatResult(choice.message.content or '', meta)
+
+        data = self._build_payload(messages, max_tokens, temperature, top_p, **kwargs)
+        response = await self._http.post("/v1/chat/completions", json=data)
+        response.raise_for_status()
+        body = response.json()
+        choice = body['choices'][0]
+        meta.finish_reason = choice.get('finish_reason')
+        meta.update_usage(body.get('usage'))
+        meta.latency = time.perf_counter() - start
+        return ChatResult(choice['message']['content'] or '', meta)
+
+    def chat_stream(
+        self,
+        message: str,
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        top_p: float = 0.95,
+        **kwargs
+    ) -> AsyncChatStream:
+        """
+        流式对话接口
+
+        Returns:
+            异步文本片段迭代器；迭代结束后 .meta 为本次调用的用量与时延
+
+        Example:
+            >>> async for chunk in client.chat_stream("讲个故事"):
+            ...     print(chunk, end="", flush=True)
+        """
+        messages = [{"role": "user", "content": message}]
+        return self.chat_stream_with_history(messages, max_tokens, temperature, top_p, **kwargs)
+
+    def chat_stream_with_history(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        top_p: float = 0.95,
+        **kwargs
+    ) -> AsyncChatStream:
+        """
+        流式多轮对话接口
+        默认请求 stream_options.include_usage，由最后一个 chunk 得到 token 用量
+
+        Args:
+            messages: 对话历史列表
+            max_tokens: 最大生成token数
+            temperature: 温度参数
+            top_p: top_p采样参数
+            **kwargs: 其他API参数
+
+        Returns:
+            异步文本片段迭代器；迭代结束后 .meta 为本次调用的用量与时延
+        """
+        kwargs.setdefault('stream_options', {'include_usage': True})
+        meta = ChatMeta()
+        chunks = self._stream(messages, max_tokens, temperature, top_p, meta, **kwargs)
+        if self.limiter is not None:
+            chunks = self._limited(chunks)
+        return AsyncChatStream(chunks, meta)
+
+    async def _limited(self, chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+        """流式请求在第一次读取时取得许可，流结束（或提前关闭）时归还，以 TTFT 作为延迟信号"""
+        await self.limiter.acquire_async()
+        start = time.perf_counter()
+        ttft = None
+        try:
+            async for chunk in chunks:
+                if ttft is None:
+                    # 不含等待许可的时间，只反映服务端的排队与 prefill
+                    ttft = time.perf_counter() - start
+                yield chunk
+        except BaseException as e:
+            await chunks.aclose()
+            self.limiter.release(ttft, overload=ttft is None and is_overload(e))
+            raise
+        self.limiter.release(ttft)
+
+    async def _stream(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        top_p: float,
+        meta: ChatMeta,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """发送流式请求，逐个产出文本片段；流结束时把 usage 与 finish_reason 写入 meta"""
+        if self.backend == 'openai':
+            stream = await self._openai_client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                stream=True,
+                **kwargs
+            )
+            async with stream:
+                async for chunk in stream:
+                    if chunk.usage is not None:
+                        meta.update_usage(chunk.usage.model_dump())
+                    if not chunk.choices:
+                        continue
+                    choice = chunk.choices[0]
+                    if choice.finish_reason:
+                        meta.finish_reason = choice.finish_reason
+                    if choice.delta.content:
+                        yield choice.delta.content
+            return
+
+        data = self._build_payload(messages, max_tokens, temperature, top_p, stream=True, **kwargs)
+        parser = SSEChatParser()
+        async with self._http.stream("POST", "/v1/chat/completions", json=data) as response:
+            response.raise_for_status()
+            async for payload in aiter_sse_data(response.aiter_lines()):
+                content = parser.feed(payload)
+                if parser.done:
+                    break
+                if content:
+                    yield content
+        meta.finish_reason = parser.finish_reason
+        meta.update_usage(parser.usage)
+
+    async def get_models(self) -> List[str]:
+        """
+        获取可用模型列表
+
+        Returns:
+            模型ID列表
+        """
+        if self.backend == 'openai':
+            models = await self._openai_client.models.list()
+            return [model.id for model in models.data]
+
+        response = await self._http.get("/v1/models", timeout=10)
+        response.raise_for_status()
+        return [model['id'] for model in response.json()['data']]
+
+    async def aclose(self):
+        """关闭连接池"""
+        await self._http.aclose()
+
+    async def __aenter__(self):
+        """支持异步上下文管理器"""
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """自动关闭连接池"""
+        await self.aclose()
+
+
+# ============ 使用示例 ============
+
+async def example_concurrent():
+    """示例1：并发对话"""
+    print("=" * 60)
+    print("示例1：100 个并发请求（共享一个连接池）")
+    print("=" * 60)
+
+    async with AsyncVLLMClient() as client:
+        questions = [f"用一句话解释数字 {i} 的含义" for i in range(100)]
+        answers = await asyncio.gather(
+            *(client.chat(q, max_tokens=64) for q in questions)
+        )
+        for q, a in list(zip(questions, answers))[:3]:
+            print(f"{q} -> {a}")
+        print(f"... 共 {len(answers)} 条回复\n")
+
+
+async def example_stream():
+    """示例2：流式输出"""
+    print("=" * 60)
+    print("示例2：流式输出")
+    print("=" * 60)
+
+    async with AsyncVLLMClient() as client:
+        print("回复: ", end="", flush=True)
+        async for chunk in client.chat_stream("用一句话介绍Python编程语言", max_tokens=200):
+            print(chunk, end="", flush=True)
+        print("\n")
+
+
+async def main():
+    """运行所有示例"""
+    try:
+        await example_concurrent()
+        await example_stream()
+    except Exception as e:
+        print(f"\n❌ 错误: {e}")
+        print("\n提示：请确保 vLLM 服务已启动、SSH 隧道已建立、端口 9000 可访问")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,124 @@
+"""
+流式解析 CPU 开销基准
+对比三种方式解析同一段 vLLM 流式响应时，每个 token 消耗的 CPU 时间：
+    1. sse_stream.SSEChatStream（requests 后端使用的轻量解析器）
+    2. 每个 chunk 做一次 json.loads
+    3. OpenAI SDK：json.loads + 构造 ChatCompletionChunk 对象（openai 后端的做法）
+
+只测量解析本身（不含网络），数据为按 vLLM 输出格式合成的 SSE 行
+
+使用方法:
+    python bench_sse_stream.py
+    python bench_sse_stream.py --tokens 20000 --repeat 5
+"""
+
+import argparse
+import json
+import time
+from typing import Callable, List
+
+from sse_stream import SSEChatStream
+
+
+def build_sse_lines(num_tokens: int) -> List[bytes]:
+    """按 vLLM 的 chunk 格式合成一段 SSE 响应（含 role chunk、usage chunk 与 [DONE]）"""
+    base = {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion.chunk",
+        "created": 1760000000,
+        "model": "Medical_Qwen3_8B_Large_Language_Model",
+    }
+
+    def line(choices, **extra) -> bytes:
+        chunk = {**base, "choices": choices, **extra}
+        return b"data: " + json.dumps(chunk, ensure_ascii=False, separators=(",", ":")).encode()
+
+    lines = [line([{"index": 0, "delta": {"role": "assistant", "content": ""},
+                    "logprobs": None, "finish_reason": None}])]
+    for i in range(num_tokens):
+        finish = "length" if i == num_tokens - 1 else None
+        lines.append(line([{"index": 0, "delta": {"content": f"词{i % 10}"},
+                            "logprobs": None, "finish_reason": finish}]))
+    lines.append(line([], usage={"prompt_tokens": 32, "total_tokens": 32 + num_tokens,
+                                 "completion_tokens": num_tokens}))
+    lines.append(b"data: [DONE]")
+    return lines
+
+
+def parse_fast(lines: List[bytes]) -> str:
+    """SSEChatStream"""
+    return "".join(SSEChatStream(lines))
+
+
+def parse_json(lines: List[bytes]) -> str:
+    """逐 chunk json.loads"""
+    parts = []
+    for raw in lines:
+        data = raw[6:]
+        if data == b"[DONE]":
+            break
+        choices = json.loads(data)["choices"]
+        if choices and choices[0]["delta"].get("content"):
+            parts.append(choices[0]["delta"]["content"])
+    return "".join(parts)
+
+
+def parse_openai(lines: List[bytes]) -> str:
+    """json.loads + ChatCompletionChunk 对象"""
+    from openai.types.chat import ChatCompletionChunk
+
+    parts = []
+    for raw in lines:
+        data = raw[6:]
+        if data == b"[DONE]":
+            break
+        chunk = ChatCompletionChunk.model_validate(json.loads(data))
+        if chunk.choices and chunk.choices[0].delta.content:
+            parts.append(chunk.choices[0].delta.content)
+    return "".join(parts)
+
+
+def measure(parser: Callable[[List[bytes]], str], lines: List[bytes], repeat: int) -> float:
+    """返回多次运行中最小的 CPU 时间（秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.process_time()
+        parser(lines)
+        best = min(best, time.process_time() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式解析 CPU 开销基准")
+    parser.add_argument("--tokens", type=int, default=10000, help="每个响应的 token 数")
+    parser.add_argument("--repeat", type=int, default=5, help="重复次数（取最小值）")
+    args = parser.parse_args()
+
+    lines = build_sse_lines(args.tokens)
+    expected = parse_json(lines)
+
+    candidates = [
+        ("SSEChatStream", parse_fast),
+        ("json.loads", parse_json),
+    ]
+    try:
+        import openai  # noqa: F401
+        candidates.append(("OpenAI SDK", parse_openai))
+    except ImportError:
+        print("⚠️  未安装 openai，跳过 OpenAI SDK 对比")
+
+    print(f"{'解析方式':<16}{'总 CPU (ms)':>14}{'每 token (µs)':>16}{'相对 SDK':>10}")
+    print("-" * 56)
+    results = []
+    for name, func in candidates:
+        assert func(lines) == expected, f"{name} 解析结果不一致"
+        results.append((name, measure(func, lines, args.repeat)))
+
+    sdk_cost = results[-1][1]
+    for name, cost in results:
+        per_token = cost / args.tokens * 1e6
+        print(f"{name:<16}{cost * 1e3:>14.2f}{per_token:>16.2f}{cost / sdk_cost:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+启动时间基准
+测量交互脚本从启动到可以输入的时间，以及客户端模块的导入时间：
+    1. 导入时间：每次在新的解释器进程中导入模块，在进程内计时（不含解释器启动）
+    2. 到提示符的时间：启动 智能对话脚本.py，直到输出中出现 "你:" 提示符
+
+连接检查在后台进行，到提示符的时间不受服务端是否可达影响。
+可设置阈值，超出时以非 0 状态码退出，用于发现启动时间退化
+
+使用方法:
+    python bench_startup.py
+    python bench_startup.py --repeat 10 --max-import-ms 150 --max-prompt-ms 500
+    python bench_startup.py --modules vllm_client openai --output-json startup.json
+"""
+
+import argparse
+import json
+import os
+import selectors
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+HERE = Path(__file__).resolve().parent
+DEFAULT_MODULES = ["vllm_client", "async_vllm_client", "openai"]
+PROMPT_MARKER = "你:".encode("utf-8")
+
+
+def measure_import(module: str, repeat: int) -> List[float]:
+    """在新的解释器进程中导入模块，返回每次的导入耗时（秒）"""
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"import {module}; print(time.perf_counter() - start)"
+    )
+    samples = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", code], cwd=HERE, check=True,
+            capture_output=True, text=True
+        ).stdout
+        samples.append(float(output.strip().splitlines()[-1]))
+    return samples
+
+
+def measure_interpreter(repeat: int) -> List[float]:
+    """空解释器的启动耗时（秒），作为到提示符时间的参照"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def time_to_prompt(script: Path, timeout: float) -> float:
+    """
+    启动脚本并计时，直到标准输出中出现输入提示符，随后关闭标准输入让脚本退出
+
+    Returns:
+        到提示符的耗时（秒）
+
+    Raises:
+        TimeoutError: 超时仍未出现提示符
+    """
+    env = dict(os.environ, PYTHONUNBUFFERED="1", PYTHONIOENCODING="utf-8")
+    # 在临时目录中运行，会话日志与连接缓存不会写入当前目录
+    with tempfile.TemporaryDirectory() as workdir:
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, str(script)], cwd=workdir, env=env,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        selector = selectors.DefaultSelector()
+        selector.register(proc.stdout, selectors.EVENT_READ)
+        output = b""
+        try:
+            while PROMPT_MARKER not in output:
+                remaining = timeout - (time.perf_counter() - start)
+                if remaining <= 0 or not selector.select(remaining):
+                    raise TimeoutError(f"{timeout:.0f}s 内没有出现提示符")
+                chunk = os.read(proc.stdout.fileno(), 65536)
+                if not chunk:
+                    raise RuntimeError(f"脚本在显示提示符之前退出（状态码 {proc.wait()}）")
+                output += chunk
+            elapsed = time.perf_counter() - start
+        finally:
+            selector.close()
+            proc.stdin.close()    # EOF：脚本退出主循环
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
+    return elapsed
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """毫秒为单位的中位数 / 最小值 / 最大值"""
+    return {
+        "median_ms": round(statistics.median(samples) * 1e3, 2),
+        "min_ms": round(min(samples) * 1e3, 2),
+        "max_ms": round(max(samples) * 1e3, 2),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="交互脚本启动时间基准")
+    parser.add_argument("--repeat", type=int, default=5, help="重复次数（取中位数）")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES, help="测量导入时间的模块")
+    parser.add_argument("--script", default=str(HERE / "智能对话脚本.py"), help="测量到提示符时间的脚本")
+    parser.add_argument("--timeout", type=float, default=60.0, help="等待提示符的最长时间（秒）")
+    parser.add_argument("--max-import-ms", type=float, default=None,
+                        help="第一个模块导入时间中位数的上限，超出时退出码为 1")
+    parser.add_argument("--max-prompt-ms", type=float, default=None,
+                        help="到提示符时间中位数的上限，超出时退出码为 1")
+    parser.add_argument("--output-json", default=None, help="结果写入 JSON 文件")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, Dict[str, float]] = {}
+    baseline = summarize(measure_interpreter(args.repeat))
+    results["interpreter"] = baseline
+
+    print(f"{'项目':<24}{'中位数 (ms)':>14}{'最小 (ms)':>12}{'最大 (ms)':>12}")
+    print("-" * 62)
+    print(f"{'空解释器启动':<20}{baseline['median_ms']:>16.1f}{baseline['min_ms']:>12.1f}{baseline['max_ms']:>12.1f}")
+
+    for module in args.modules:
+        try:
+            stats = summarize(measure_import(module, args.repeat))
+        except subprocess.CalledProcessError:
+            print(f"⚠️  无法导入 {module}，跳过")
+            continue
+        results[f"import:{module}"] = stats
+        print(f"{'import ' + module:<24}{stats['median_ms']:>14.1f}{stats['min_ms']:>12.1f}{stats['max_ms']:>12.1f}")
+
+    prompt = summarize([time_to_prompt(Path(args.script).resolve(), args.timeout) for _ in range(args.repeat)])
+    results["time_to_prompt"] = prompt
+    print(f"{'到提示符':<20}{prompt['median_ms']:>16.1f}{prompt['min_ms']:>12.1f}{prompt['max_ms']:>12.1f}")
+
+    if args.output_json:
+        with open(args.output_json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    failed = False
+    first_import = results.get(f"import:{args.modules[0]}")
+    if args.max_import_ms is not None and first_import and first_import["median_ms"] > args.max_import_ms:
+        print(f"❌ import {args.modules[0]} {first_import['median_ms']:.1f}ms 超过上限 {args.max_import_ms:.0f}ms")
+        failed = True
+    if args.max_prompt_ms is not None and prompt["median_ms"] > args.max_prompt_ms:
+        print(f"❌ 到提示符 {prompt['median_ms']:.1f}ms 超过上限 {args.max_prompt_ms:.0f}ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
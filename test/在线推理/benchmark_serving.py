@@ -0,0 +1,310 @@
+"""
+vLLM 在线服务压测工具
+按给定并发向 OpenAI 兼容接口发送流式请求，统计:
+    - TTFT   首 token 延迟（time to first token）
+    - TPOT   每个输出 token 的平均耗时（不含首 token）
+    - ITL    相邻两个 token 的间隔（inter-token latency）
+    - E2E    端到端延迟
+    - 请求吞吐（req/s）与输出 token 吞吐（tok/s）
+各延迟指标输出 mean / p50 / p90 / p99，并可写出 JSON 汇总，方便对比调整
+gpu_memory_utilization、max_model_len 等服务端参数前后的效果
+
+使用方法:
+    # 合成 prompt：200 个请求，32 并发，输入约 512 token，输出 128 token
+    python benchmark_serving.py --num-prompts 200 --concurrency 32 \\
+        --input-len 512 --max-tokens 128 --ignore-eos
+
+    # 数据集 prompt（JSONL 的 "prompt" 字段，或 ShareGPT 格式 JSON），写出汇总
+    python benchmark_serving.py --dataset prompts.jsonl --concurrency 64 \\
+        --output-json results/gmu0.9.json --metadata gpu_memory_utilization=0.9
+
+    # 对比两次结果
+    diff <(jq .metrics results/gmu0.8.json) <(jq .metrics results/gmu0.9.json)
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import httpx
+
+from connection_pool_httpx import TunnelSafeAsyncTransport
+from sse_stream import aiter_sse_data, extract_delta_content, extract_delta_reasoning
+
+# 合成 prompt 使用的词表（英文单词大致一个词一个 token）
+_WORDS = (
+    "model server token cache batch memory latency request stream answer "
+    "question system python vector layer head block prefix decode prefill"
+).split()
+
+
+@dataclass
+class RequestRecord:
+    """单个请求的测量结果"""
+    prompt_len: int = 0                 # 输入 token 数（来自服务端 usage）
+    output_tokens: int = 0              # 输出 token 数
+    ttft: Optional[float] = None        # 首 token 延迟（秒），没有收到任何 token 时为 None
+    e2e: float = 0.0                    # 端到端延迟（秒）
+    itl: List[float] = field(default_factory=list)   # token 间隔（秒）
+    error: Optional[str] = None
+
+    @property
+    def tpot(self) -> Optional[float]:
+        if self.output_tokens <= 1 or self.ttft is None:
+            return None
+        return (self.e2e - self.ttft) / (self.output_tokens - 1)
+
+
+# ============ 数据准备 ============
+
+def synthetic_prompts(num_prompts: int, input_len: int, seed: int = 0) -> List[str]:
+    """生成长度约为 input_len 个 token 的随机 prompt（每条不同，避免命中前缀缓存）"""
+    rng = random.Random(seed)
+    return [
+        f"[{i}] " + " ".join(rng.choice(_WORDS) for _ in range(input_len))
+        for i in range(num_prompts)
+    ]
+
+
+def load_dataset(path: str, num_prompts: int) -> List[str]:
+    """
+    读取数据集 prompt
+
+    支持两种格式:
+        - JSONL：每行一个对象，取 "prompt" 字段
+        - ShareGPT JSON：取每条 conversations 的第一轮内容
+    """
+    path = Path(path)
+    prompts = []
+    if path.suffix == '.jsonl':
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    prompts.append(json.loads(line)['prompt'])
+                if len(prompts) >= num_prompts:
+                    break
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            for item in json.load(f):
+                conversations = item.get('conversations') or []
+                if conversations:
+                    prompts.append(conversations[0]['value'])
+                if len(prompts) >= num_prompts:
+                    break
+    if not prompts:
+        raise ValueError(f"数据集中没有可用的 prompt: {path}")
+    return prompts
+
+
+# ============ 统计 ============
+
+def percentile(values: List[float], q: float) -> float:
+    """线性插值百分位数（q 取 0-100）"""
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q / 100
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """mean / p50 / p90 / p99，单位毫秒"""
+    if not values:
+        return {}
+    return {
+        'mean_ms': sum(values) / len(values) * 1000,
+        'p50_ms': percentile(values, 50) * 1000,
+        'p90_ms': percentile(values, 90) * 1000,
+        'p99_ms': percentile(values, 99) * 1000,
+    }
+
+
+def build_report(records: List[RequestRecord], duration: float) -> Dict:
+    """汇总所有请求的测量结果"""
+    ok = [r for r in records if r.error is None]
+    output_tokens = sum(r.output_tokens for r in ok)
+    return {
+        'completed': len(ok),
+        'failed': len(records) - len(ok),
+        'duration_s': duration,
+        'request_throughput': len(ok) / duration if duration else 0.0,
+        'output_token_throughput': output_tokens / duration if duration else 0.0,
+        'total_input_tokens': sum(r.prompt_len for r in ok),
+        'total_output_tokens': output_tokens,
+        'ttft': summarize([r.ttft for r in ok if r.ttft is not None]),
+        'tpot': summarize([r.tpot for r in ok if r.tpot is not None]),
+        'itl': summarize([gap for r in ok for gap in r.itl]),
+        'e2e': summarize([r.e2e for r in ok]),
+        'errors': sorted({r.error for r in records if r.error})[:10],
+    }
+
+
+# ============ 压测 ============
+
+async def send_request(
+    http: httpx.AsyncClient,
+    payload: Dict,
+    prompt: Union[str, List[Dict[str, str]]]
+) -> RequestRecord:
+    """发送一个流式请求并记录每个 token 的到达时间（prompt 为字符串或完整的 messages）"""
+    record = RequestRecord()
+    messages = [{"role": "user", "content": prompt}] if isinstance(prompt, str) else prompt
+    data = {**payload, "messages": messages}
+    start = time.perf_counter()
+    last = start
+    try:
+        async with http.stream("POST", "/v1/chat/completions", json=data) as response:
+            response.raise_for_status()
+            async for chunk in aiter_sse_data(response.aiter_lines()):
+                if chunk == '[DONE]':
+                    break
+                # 思考过程也是生成的 token，TTFT 从第一个 token 算起，不论它是回答还是思考
+                if extract_delta_content(chunk) or extract_delta_reasoning(chunk):
+                    now = time.perf_counter()
+                    if record.output_tokens == 0:
+                        record.ttft = now - start
+                    else:
+                        record.itl.append(now - last)
+                    last = now
+                    record.output_tokens += 1
+                elif '"usage"' in chunk:
+                    usage = json.loads(chunk).get('usage') or {}
+                    record.prompt_len = usage.get('prompt_tokens', 0)
+                    # 一个 chunk 可能包含多个 token，以服务端统计为准
+                    record.output_tokens = usage.get('completion_tokens', record.output_tokens)
+        record.e2e = time.perf_counter() - start
+    except Exception as e:
+        record.error = f"{type(e).__name__}: {e}"
+    return record
+
+
+async def run_benchmark(args, prompts: List[str]) -> Dict:
+    """按并发上限（以及可选的到达速率）发送全部请求"""
+    payload = {
+        "model": args.model,
+        "max_tokens": args.max_tokens,
+        "temperature": args.temperature,
+        "stream": True,
+        "stream_options": {"include_usage": True},
+    }
+    if args.ignore_eos:
+        payload["ignore_eos"] = True   # vLLM 扩展参数：固定生成 max_tokens 个 token
+
+    http = httpx.AsyncClient(
+        base_url=args.base_url.rstrip('/'),
+        headers={"Authorization": f"Bearer {args.api_key}"},
+        timeout=httpx.Timeout(args.timeout, connect=10.0, pool=None),
+        transport=TunnelSafeAsyncTransport(
+            pool_size=args.concurrency, max_connections=args.concurrency
+        )
+    )
+    semaphore = asyncio.Semaphore(args.concurrency)
+    rng = random.Random(args.seed)
+
+    async def limited(prompt: str) -> RequestRecord:
+        async with semaphore:
+            return await send_request(http, payload, prompt)
+
+    async with http:
+        start = time.perf_counter()
+        tasks = []
+        for prompt in prompts:
+            tasks.append(asyncio.create_task(limited(prompt)))
+            if args.request_rate != float('inf'):
+                # 泊松到达
+                await asyncio.sleep(rng.expovariate(args.request_rate))
+        records = await asyncio.gather(*tasks)
+        duration = time.perf_counter() - start
+
+    return build_report(records, duration)
+
+
+def print_report(report: Dict):
+    """打印汇总表"""
+    print("=" * 60)
+    print(f"成功/失败请求:   {report['completed']} / {report['failed']}")
+    print(f"总耗时:          {report['duration_s']:.2f} s")
+    print(f"请求吞吐:        {report['request_throughput']:.2f} req/s")
+    print(f"输出 token 吞吐: {report['output_token_throughput']:.2f} tok/s")
+    print(f"输入/输出 token: {report['total_input_tokens']} / {report['total_output_tokens']}")
+    print("-" * 60)
+    print(f"{'指标':<8}{'mean':>12}{'p50':>12}{'p90':>12}{'p99':>12}   (ms)")
+    for name in ('ttft', 'tpot', 'itl', 'e2e'):
+        stats = report[name]
+        if stats:
+            print(f"{name.upper():<8}" + "".join(
+                f"{stats[k]:>12.2f}" for k in ('mean_ms', 'p50_ms', 'p90_ms', 'p99_ms')
+            ))
+    for error in report['errors']:
+        print(f"❌ {error}")
+    print("=" * 60)
+
+
+def metadata_item(text: str) -> Tuple[str, str]:
+    """--metadata 的 key=value 解析"""
+    key, sep, value = text.partition('=')
+    if not sep or not key:
+        raise argparse.ArgumentTypeError(f"需要 key=value 格式，收到 {text!r}")
+    return key, value
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="vLLM 在线服务压测")
+    parser.add_argument("--base-url", default="http://localhost:9000")
+    parser.add_argument("--api-key", default="muyu")
+    parser.add_argument("--model", default="Medical_Qwen3_8B_Large_Language_Model")
+    parser.add_argument("--dataset", help="JSONL（prompt 字段）或 ShareGPT JSON；不指定则使用合成 prompt")
+    parser.add_argument("--num-prompts", type=int, default=200)
+    parser.add_argument("--input-len", type=int, default=512, help="合成 prompt 的大致 token 数")
+    parser.add_argument("--max-tokens", type=int, default=128)
+    parser.add_argument("--temperature", type=float, default=0.0)
+    parser.add_argument("--ignore-eos", action="store_true", help="固定输出长度为 max-tokens")
+    parser.add_argument("--concurrency", type=int, default=32, help="最大在途请求数")
+    parser.add_argument("--request-rate", type=float, default=float('inf'),
+                        help="平均到达速率 req/s（泊松分布），默认一次性全部发出")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output-json", help="写出 JSON 汇总的路径")
+    parser.add_argument("--metadata", nargs="*", default=[], type=metadata_item,
+                        help="附加到 JSON 汇总中的 key=value，例如 gpu_memory_utilization=0.9")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.dataset:
+        prompts = load_dataset(args.dataset, args.num_prompts)
+    else:
+        prompts = synthetic_prompts(args.num_prompts, args.input_len, args.seed)
+
+    print(f"🚀 压测 {args.base_url}：{len(prompts)} 个请求，并发 {args.concurrency}")
+    report = asyncio.run(run_benchmark(args, prompts))
+    print_report(report)
+
+    if args.output_json:
+        summary = {
+            'timestamp': datetime.now().isoformat(),
+            'config': {
+                k: (None if v == float('inf') else v)
+                for k, v in vars(args).items() if k not in ('api_key', 'metadata')
+            },
+            'metadata': dict(args.metadata),
+            'metrics': report,
+        }
+        output = Path(args.output_json)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"✅ 汇总已写入: {output}")
+
+
+if __name__ == "__main__":
+    main()
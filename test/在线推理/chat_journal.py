@@ -0,0 +1,243 @@
+"""
+对话历史的追加式日志与索引
+
+每个会话对应 chat_history/<会话ID>.jsonl：
+    第一行   {"type": "meta", "id": ..., "created": ..., "config": {...}}
+    之后每行 {"type": "message", "role": ..., "content": ..., "ts": ...}
+每轮对话结束只追加两行，不再重写整个文件。
+
+所有会话的摘要（标题、修改时间、消息数、token 数）记录在 chat_history/index.jsonl，
+同样只追加，同一会话以最后一行为准。启动时读取一次并在内存中按修改时间排序，
+之后 /list 只取末尾几项，不再逐个 stat 历史文件；冗余行过多时自动压缩。
+
+加载大会话时可以只读取最近 N 轮：从文件末尾按块向前读取，不解析整个文件。
+
+使用方法:
+    journal = ChatJournal(Path("chat_history"))
+    session_id = journal.new_session(config={"max_tokens": 512})
+    journal.append(session_id, {"role": "user", "content": "你好"})
+    journal.append(session_id, {"role": "assistant", "content": "你好！"}, tokens=42)
+    journal.recent(10)
+    journal.load(session_id, last_turns=20)
+"""
+
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Dict, List, Optional
+
+INDEX_FILE = "index.jsonl"
+# 标题取第一条用户消息的前若干个字符
+TITLE_CHARS = 30
+# 反向读取的块大小
+_TAIL_BLOCK = 64 * 1024
+
+
+def tail_lines(path: Path, n: int) -> List[bytes]:
+    """读取文件最后 n 行（从末尾按块向前读，开销与 n 成正比，与文件大小无关）"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        buffer = b''
+        while pos > 0 and buffer.count(b'\n') <= n:
+            step = min(_TAIL_BLOCK, pos)
+            pos -= step
+            f.seek(pos)
+            buffer = f.read(step) + buffer
+    lines = buffer.splitlines()
+    if pos > 0:
+        lines = lines[1:]   # 第一行可能只读到了一半
+    return lines[-n:] if n > 0 else []
+
+
+class ChatJournal:
+    """
+    会话日志与索引
+    """
+
+    def __init__(self, history_dir: Path):
+        self.history_dir = Path(history_dir)
+        self.history_dir.mkdir(exist_ok=True)
+        self._index_path = self.history_dir / INDEX_FILE
+        # 会话ID -> 摘要，按最近修改时间排序（最新的在末尾）
+        self._index: "OrderedDict[str, Dict]" = OrderedDict()
+        self._writers: Dict[str, IO] = {}
+        self._pending_meta: Dict[str, Dict] = {}
+        self._load_index()
+
+    # ============ 索引 ============
+
+    def _load_index(self):
+        """读取索引日志；冗余行超过会话数的两倍时压缩"""
+        if not self._index_path.exists():
+            return
+        lines = 0
+        with open(self._index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue   # 上次写入被中断留下的半行
+                lines += 1
+                self._index[entry['id']] = entry
+                self._index.move_to_end(entry['id'])
+        if lines > 2 * len(self._index) + 100:
+            self._compact_index()
+
+    def _compact_index(self):
+        """每个会话只保留最新一行，原子替换索引文件"""
+        tmp_path = self._index_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in self._index.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self._index_path)
+
+    def _update_index(self, session_id: str, **changes):
+        entry = self._index.setdefault(session_id, {
+            'id': session_id,
+            'title': '',
+            'created': time.time(),
+            'messages': 0,
+            'tokens': 0,
+        })
+        entry.update(changes)
+        entry['mtime'] = time.time()
+        self._index.move_to_end(session_id)
+        with open(self._index_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def recent(self, limit: int = 10) -> List[Dict]:
+        """最近修改的若干个会话摘要（最新的在前）"""
+        entries = []
+        for session_id in reversed(self._index):
+            entries.append(self._index[session_id])
+            if len(entries) >= limit:
+                break
+        return entries
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        """会话摘要；不存在时返回 None"""
+        return self._index.get(session_id)
+
+    # ============ 日志 ============
+
+    def path(self, session_id: str) -> Path:
+        return self.history_dir / f"{session_id}.jsonl"
+
+    def new_session(self, config: Optional[Dict] = None) -> str:
+        """
+        创建新会话（文件在第一次追加消息时才写入，空会话不留下文件）
+        同一时间通常只有一个活跃会话，这里会关闭之前打开的日志文件
+
+        Returns:
+            会话ID
+        """
+        self.close()
+        session_id = f"chat_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        self._pending_meta[session_id] = {
+            'type': 'meta',
+            'id': session_id,
+            'created': datetime.now().isoformat(),
+            'config': config or {},
+        }
+        return session_id
+
+    def _writer(self, session_id: str) -> IO:
+        writer = self._writers.get(session_id)
+        if writer is None:
+            writer = open(self.path(session_id), 'a', encoding='utf-8')
+            meta = self._pending_meta.pop(session_id, None)
+            if meta is not None:
+                writer.write(json.dumps(meta, ensure_ascii=False) + '\n')
+            self._writers[session_id] = writer
+        return writer
+
+    def append(
+        self,
+        session_id: str,
+        message: Dict[str, str],
+        tokens: int = 0,
+        meta: Optional[Dict] = None,
+        usage: Optional[Dict] = None
+    ):
+        """
+        追加一条消息并更新索引
+
+        Args:
+            session_id: 会话ID
+            message: {"role": ..., "content": ...}
+            tokens: 本条消息计入会话的 token 数
+            meta: 随消息保存的调用元数据（token 用量、时延等）
+            usage: 会话的累计用量，保存在索引中，加载会话时恢复
+        """
+        writer = self._writer(session_id)
+        record = {'type': 'message', **message, 'ts': time.time()}
+        if meta is not None:
+            record['meta'] = meta
+        writer.write(json.dumps(record, ensure_ascii=False) + '\n')
+        writer.flush()
+
+        entry = self._index.get(session_id) or {}
+        changes = {
+            'messages': entry.get('messages', 0) + 1,
+            'tokens': entry.get('tokens', 0) + tokens,
+        }
+        if not entry.get('title') and message.get('role') == 'user':
+            changes['title'] = message.get('content', '')[:TITLE_CHARS]
+        if usage is not None:
+            changes['usage'] = usage
+        self._update_index(session_id, **changes)
+
+    def set_title(self, session_id: str, title: str):
+        """设置会话标题"""
+        self._update_index(session_id, title=title)
+
+    def load(self, session_id: str, last_turns: Optional[int] = None) -> List[Dict[str, str]]:
+        """
+        读取会话消息
+
+        Args:
+            session_id: 会话ID
+            last_turns: 只读取最近多少轮（一轮 = 用户 + 助手两条消息），None 表示全部
+
+        Returns:
+            消息列表
+
+        Raises:
+            FileNotFoundError: 会话不存在
+        """
+        path = self.path(session_id)
+        if not path.exists():
+            raise FileNotFoundError(path)
+
+        if last_turns is None:
+            with open(path, 'rb') as f:
+                lines = f.readlines()
+        else:
+            lines = tail_lines(path, 2 * last_turns)
+
+        messages = []
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get('type') == 'message':
+                messages.append({'role': record['role'], 'content': record['content']})
+        # 截取最近 N 轮时保证以用户消息开头
+        if last_turns is not None:
+            while messages and messages[0]['role'] != 'user':
+                messages.pop(0)
+        return messages
+
+    def close(self):
+        """关闭所有打开的日志文件"""
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
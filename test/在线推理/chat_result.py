@@ -0,0 +1,226 @@
+"""
+对话结果的元数据 - token 用量与时延
+
+VLLMClient / AsyncVLLMClient 的每次调用都附带一份 ChatMeta：
+    - prompt / completion / 命中前缀缓存的 token 数（来自服务端返回的 usage）
+    - finish_reason（stop / length ...）
+    - TTFT（仅流式）、总耗时、解码速度 tokens/s
+
+非流式接口返回 ChatResult：它就是回复字符串本身（str 的子类），额外带一个 .meta 属性，
+原有把返回值当字符串使用的代码不受影响。
+流式接口返回 ChatStream：照常逐个产出文本片段，迭代结束后 .meta 填充完毕。
+流式请求默认带上 stream_options.include_usage，服务端会在最后一个 chunk 中返回 usage。
+
+使用方法:
+    response = client.chat("你好")
+    print(response, response.meta.completion_tokens, response.meta.latency)
+
+    stream = client.chat_stream("讲个故事")
+    for chunk in stream:
+        print(chunk, end="", flush=True)
+    print(stream.meta.ttft, stream.meta.decode_tokens_per_s)
+
+    totals = UsageTotals()
+    totals.add(stream.meta)
+"""
+
+import time
+from dataclasses import asdict, dataclass
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+
+@dataclass
+class ChatMeta:
+    """单次调用的用量与时延"""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0              # prompt 中命中服务端前缀缓存的 token 数
+    finish_reason: Optional[str] = None
+    ttft: Optional[float] = None        # 首 token 延迟（秒），非流式调用为 None
+    latency: float = 0.0                # 总耗时（秒）
+    chunks: int = 0                     # 流式调用收到的文本片段数
+    from_cache: bool = False            # 是否由客户端响应缓存直接返回
+    shared: bool = False                # 是否与同时进行的相同请求合并（见 single_flight.py）
+
+    def update_usage(self, usage: Optional[Dict]):
+        """从服务端返回的 usage 字段更新 token 数"""
+        if not usage:
+            return
+        self.prompt_tokens = usage.get('prompt_tokens') or 0
+        self.completion_tokens = usage.get('completion_tokens') or 0
+        details = usage.get('prompt_tokens_details') or {}
+        self.cached_tokens = details.get('cached_tokens') or 0
+
+    def adopt(self, other: "ChatMeta"):
+        """复制另一份元数据中由服务端返回的部分（token 用量与 finish_reason）"""
+        self.prompt_tokens = other.prompt_tokens
+        self.completion_tokens = other.completion_tokens
+        self.cached_tokens = other.cached_tokens
+        self.finish_reason = other.finish_reason
+
+    @property
+    def decode_tokens_per_s(self) -> float:
+        """
+        解码速度：流式调用按首 token 之后的时间计算；
+        非流式调用无法区分 prefill 与 decode，按总耗时计算（偏低）
+        """
+        tokens = self.completion_tokens or self.chunks
+        if self.ttft is not None:
+            decode = self.latency - self.ttft
+            return (tokens - 1) / decode if tokens > 1 and decode > 0 else 0.0
+        return tokens / self.latency if self.latency > 0 else 0.0
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        data['decode_tokens_per_s'] = self.decode_tokens_per_s
+        return data
+
+
+class ChatResult(str):
+    """非流式调用的返回值：回复文本 + .meta"""
+
+    meta: ChatMeta
+
+    def __new__(cls, text: str, meta: Optional[ChatMeta] = None):
+        if not isinstance(text, str):
+            # 防止 None 等被 str() 转成 'None' 写入缓存与历史
+            raise TypeError(f"ChatResult 需要 str，收到 {type(text).__name__}")
+        result = super().__new__(cls, text)
+        result.meta = meta or ChatMeta()
+        return result
+
+
+class ChatStream:
+    """
+    流式调用的返回值：文本片段迭代器 + .meta
+    TTFT 与总耗时从第一次取片段（即真正发出请求）开始计时
+    """
+
+    def __init__(self, chunks: Iterator[str], meta: ChatMeta):
+        """
+        Args:
+            chunks: 底层片段生成器（负责填充 meta 中的 usage 与 finish_reason）
+            meta: 与底层生成器共享的元数据对象
+        """
+        self.meta = meta
+        self._chunks = chunks
+        self._start: Optional[float] = None
+
+    def __iter__(self) -> "ChatStream":
+        return self
+
+    def __next__(self) -> str:
+        if self._start is None:
+            self._start = time.perf_counter()
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self.meta.latency = time.perf_counter() - self._start
+            raise
+        if self.meta.ttft is None:
+            self.meta.ttft = time.perf_counter() - self._start
+        self.meta.chunks += 1
+        return chunk
+
+    def close(self):
+        """提前结束流并释放连接"""
+        self._chunks.close()
+
+
+class AsyncChatStream:
+    """异步流式调用的返回值，与 ChatStream 相同，使用 async for 迭代"""
+
+    def __init__(self, chunks: AsyncIterator[str], meta: ChatMeta):
+        self.meta = meta
+        self._chunks = chunks
+        self._start: Optional[float] = None
+
+    def __aiter__(self) -> "AsyncChatStream":
+        return self
+
+    async def __anext__(self) -> str:
+        if self._start is None:
+            self._start = time.perf_counter()
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            self.meta.latency = time.perf_counter() - self._start
+            raise
+        if self.meta.ttft is None:
+            self.meta.ttft = time.perf_counter() - self._start
+        self.meta.chunks += 1
+        return chunk
+
+    async def aclose(self):
+        """提前结束流并释放连接"""
+        await self._chunks.aclose()
+
+
+class UsageTotals:
+    """
+    多次调用的累计统计（例如一个会话）
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.total_latency = 0.0        # 所有调用的耗时之和
+        self.total_ttft = 0.0           # 流式调用的 TTFT 之和
+        self.streamed = 0               # 流式调用次数
+        self.decode_time = 0.0          # 流式调用首 token 之后的耗时之和
+        self.decode_tokens = 0          # 对应的生成 token 数
+        self.truncated = 0              # finish_reason == 'length' 的次数
+
+    def add(self, meta: ChatMeta):
+        """计入一次调用（命中客户端响应缓存或与其他请求合并的调用不消耗服务端 token，不计入）"""
+        if meta.from_cache or meta.shared:
+            return
+        self.requests += 1
+        self.prompt_tokens += meta.prompt_tokens
+        self.completion_tokens += meta.completion_tokens
+        self.cached_tokens += meta.cached_tokens
+        self.total_latency += meta.latency
+        if meta.finish_reason == 'length':
+            self.truncated += 1
+        if meta.ttft is not None:
+            self.streamed += 1
+            self.total_ttft += meta.ttft
+            tokens = meta.completion_tokens or meta.chunks
+            if tokens > 1:
+                self.decode_time += meta.latency - meta.ttft
+                self.decode_tokens += tokens - 1
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def summary(self) -> Dict:
+        """汇总指标（平均 TTFT、平均耗时、解码速度、前缀缓存命中率）"""
+        return {
+            'requests': self.requests,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'cached_tokens': self.cached_tokens,
+            'total_tokens': self.total_tokens,
+            'prefix_cache_hit_rate':
+                self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+            'avg_ttft': self.total_ttft / self.streamed if self.streamed else None,
+            'avg_latency': self.total_latency / self.requests if self.requests else None,
+            'decode_tokens_per_s':
+                self.decode_tokens / self.decode_time if self.decode_time > 0 else None,
+            'truncated': self.truncated,
+        }
+
+    def to_dict(self) -> Dict:
+        """可序列化的原始计数（用于保存到对话历史）"""
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "UsageTotals":
+        totals = cls()
+        for key, value in (data or {}).items():
+            if hasattr(totals, key):
+                setattr(totals, key, value)
+        return totals
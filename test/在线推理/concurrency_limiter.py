@@ -0,0 +1,437 @@
+"""
+自适应并发控制 - 按延迟与服务端压力自动调整同时在途的请求数
+
+固定并发数两头都不对：太低时 vLLM 的 continuous batching 凑不满批，GPU 空转；
+太高时请求在服务端排队，TTFT 随排队时间一起上涨。AdaptiveLimiter 采用 AIMD（加性增、乘性减）:
+
+    加性增   并发上限已被用满、延迟没有明显高于基线、服务端没有排队时，
+             每完成一个请求上限增加 1/limit（大约每完成一轮增加 1）
+    乘性减   出现以下任一信号时上限乘以 backoff:
+                 - 最近延迟（指数滑动平均）超过基线的 tolerance 倍
+                   （TTFT 包含服务端排队时间，排队变长会直接体现在这里）
+                 - 服务端返回 429 / 503
+                 - KV cache 占用超过 kv_high，或服务端发生抢占（preemption）
+             两次减小至少间隔 cooldown 秒，同一波拥塞只惩罚一次
+
+基线是延迟滑动平均的历史最小值，并缓慢向当前值漂移（适应输入长度等负载变化），代表不排队时的延迟。
+延迟信号由调用方给出：流式请求用 TTFT；非流式请求没有 TTFT，用 总耗时 / 输出 token 数（见 latency_signal）。
+同一个限流器只应接收同一种信号。
+
+服务端压力由 watch_server() 在后台定期抓取 vLLM 的 /metrics 获得:
+    vllm:kv_cache_usage_perc（旧版为 vllm:gpu_cache_usage_perc）   KV cache 占用
+    vllm:num_requests_waiting                                        排队中的请求数（>0 时不再加并发）
+    vllm:num_preemptions_total                                       抢占次数（增加时减小并发）
+
+使用方法:
+    limiter = AdaptiveLimiter(initial=8, max_limit=256)
+    limiter.watch_server("http://localhost:9000")          # 可选
+
+    # 同步批量：并发数由限流器决定
+    for result in client.chat_batch_iter(batch, limiter=limiter):
+        ...
+
+    # 异步客户端：每个请求先取得许可
+    client = AsyncVLLMClient(limiter=limiter)
+
+    print(limiter.limit, limiter.stats())
+    for timestamp, limit, reason in limiter.history():
+        ...
+
+    # 直接使用
+    with limiter.slot() as slot:
+        response = client.chat("你好")
+        slot.latency = latency_signal(response.meta)
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+# asyncio / requests 只在异步获取许可、抓取 /metrics 时导入，同步客户端启动时不加载
+
+from metrics import parse_samples
+
+KV_USAGE_METRICS = ('vllm:kv_cache_usage_perc', 'vllm:gpu_cache_usage_perc')
+WAITING_METRIC = 'vllm:num_requests_waiting'
+PREEMPTIONS_METRIC = 'vllm:num_preemptions_total'
+_PRESSURE_METRICS = frozenset(KV_USAGE_METRICS + (WAITING_METRIC, PREEMPTIONS_METRIC))
+
+# 表示服务端过载的 HTTP 状态码
+OVERLOAD_STATUS = (429, 503)
+
+# 延迟样本少于这个数时只增不减（基线还不可靠）
+_WARMUP_SAMPLES = 5
+# 每个样本让基线向当前延迟靠近的比例
+_BASELINE_DRIFT = 0.001
+
+
+def is_overload(error: BaseException) -> bool:
+    """异常是否为服务端过载（HTTP 429 / 503），适用于 requests、httpx 与 openai 的异常"""
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None) or getattr(error, 'status_code', None)
+    return status in OVERLOAD_STATUS
+
+
+def latency_signal(meta) -> Optional[float]:
+    """
+    从一次调用的 ChatMeta 得到延迟信号
+
+    Returns:
+        流式为 TTFT；非流式为 总耗时 / 输出 token 数；缓存命中或合并的调用没有经过服务端，返回 None
+    """
+    if meta.from_cache or meta.shared:
+        return None
+    if meta.ttft is not None:
+        return meta.ttft
+    return meta.latency / max(1, meta.completion_tokens)
+
+
+def read_server_pressure(lines: Iterable[Union[str, bytes]]) -> Dict[str, Optional[float]]:
+    """
+    从 vLLM /metrics 文本中读取压力指标（多个模型时 KV 占用取最大值，其余求和）
+
+    Returns:
+        {'kv_usage': 0-1 或 None, 'waiting': 排队请求数, 'preemptions': 累计抢占次数或 None}
+    """
+    pressure = {'kv_usage': None, 'waiting': 0.0, 'preemptions': None}
+    for name, _, value in parse_samples(lines, _PRESSURE_METRICS):
+        if name in KV_USAGE_METRICS:
+            pressure['kv_usage'] = max(pressure['kv_usage'] or 0.0, value)
+        elif name == WAITING_METRIC:
+            pressure['waiting'] += value
+        elif name == PREEMPTIONS_METRIC:
+            pressure['preemptions'] = (pressure['preemptions'] or 0.0) + value
+    return pressure
+
+
+class _Slot:
+    """slot() 返回的许可：在退出前把延迟信号写入 latency"""
+
+    __slots__ = ('latency',)
+
+    def __init__(self):
+        self.latency: Optional[float] = None
+
+
+class AdaptiveLimiter:
+    """
+    AIMD 自适应并发限制器（线程安全，同步线程与 asyncio 都可以使用）
+    """
+
+    def __init__(
+        self,
+        initial: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 256,
+        backoff: float = 0.7,
+        tolerance: float = 1.5,
+        smoothing: float = 0.2,
+        cooldown: float = 1.0,
+        kv_high: float = 0.95,
+        history_size: int = 1000
+    ):
+        """
+        Args:
+            initial: 初始并发上限
+            min_limit: 并发上限的下限
+            max_limit: 并发上限的上限（批量接口的线程数也按它创建）
+            backoff: 乘性减的系数
+            tolerance: 最近延迟超过基线的多少倍时认为开始排队
+            smoothing: 延迟指数滑动平均的系数（越大越灵敏）
+            cooldown: 两次减小之间的最短间隔（秒）
+            kv_high: KV cache 占用达到该比例时减小并发
+            history_size: 保留的上限变化记录条数
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.cooldown = cooldown
+        self.kv_high = kv_high
+
+        self._limit = float(min(max_limit, max(min_limit, initial)))
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._async_waiters: deque = deque()     # (事件循环, future)
+        self._recent: Optional[float] = None
+        self._baseline: Optional[float] = None
+        self._last_decrease = float('-inf')
+        self._server: Dict[str, Optional[float]] = {'kv_usage': None, 'waiting': 0.0, 'preemptions': None}
+        self._history: deque = deque(maxlen=history_size)
+        self._history.append((time.time(), self.limit, 'initial'))
+        self._counters = {
+            'samples': 0,
+            'increases': 0,
+            'decreases': 0,
+            'latency': 0,           # 因延迟上升减小
+            'overload': 0,          # 因 429 / 503 减小
+            'kv_cache': 0,          # 因 KV cache 压力 / 抢占减小
+            'scrape_errors': 0,
+        }
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def limit(self) -> int:
+        """当前并发上限"""
+        return max(self.min_limit, int(self._limit))
+
+    @property
+    def in_flight(self) -> int:
+        """当前持有许可的请求数"""
+        return self._in_flight
+
+    # ============ 取得 / 归还许可 ============
+
+    def try_acquire(self) -> bool:
+        """不等待地取得许可；已达上限时返回 False"""
+        with self._lock:
+            if self._in_flight < self.limit:
+                self._in_flight += 1
+                return True
+            return False
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        阻塞直到取得许可
+
+        Returns:
+            是否取得（只有给出 timeout 时可能为 False）
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._in_flight < self.limit, timeout):
+                return False
+            self._in_flight += 1
+            return True
+
+    async def acquire_async(self):
+        """在事件循环中等待许可（不阻塞事件循环）"""
+        import asyncio
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._in_flight < self.limit and not self._async_waiters:
+                self._in_flight += 1
+                return
+            future = loop.create_future()
+            self._async_waiters.append((loop, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._async_waiters.remove((loop, future))
+                except ValueError:
+                    pass
+            # 许可已经分配、任务却在恢复前被取消：归还许可
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def _grant(self, future: 'asyncio.Future'):
+        """在等待者的事件循环中执行：交付许可"""
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+    def _wake(self):
+        """把空出的许可分给等待者（调用方持有锁）"""
+        while self._async_waiters and self._in_flight < self.limit:
+            loop, future = self._async_waiters.popleft()
+            self._in_flight += 1
+            try:
+                loop.call_soon_threadsafe(self._grant, future)
+            except RuntimeError:
+                self._in_flight -= 1     # 事件循环已关闭
+        self._cond.notify_all()
+
+    def release(self, latency: Optional[float] = None, overload: bool = False):
+        """
+        归还许可
+
+        Args:
+            latency: 本次请求的延迟信号（见 latency_signal）；None 表示不计入样本（出错、缓存命中等）
+            overload: 本次请求是否收到 429 / 503
+        """
+        with self._lock:
+            self._in_flight -= 1
+            if overload:
+                self._decrease('overload')
+            elif latency is not None:
+                self._observe(latency)
+            self._wake()
+
+    @contextmanager
+    def slot(self):
+        """
+        同步上下文管理器：进入时取得许可，退出时归还；抛出 429 / 503 时按过载处理
+
+        Example:
+            >>> with limiter.slot() as slot:
+            ...     response = client.chat("你好")
+            ...     slot.latency = latency_signal(response.meta)
+        """
+        self.acquire()
+        slot = _Slot()
+        try:
+            yield slot
+        except BaseException as e:
+            self.release(overload=is_overload(e))
+            raise
+        self.release(slot.latency)
+
+    @asynccontextmanager
+    async def aslot(self):
+        """slot() 的异步版本：async with limiter.aslot() as slot: ..."""
+        await self.acquire_async()
+        slot = _Slot()
+        try:
+            yield slot
+        except BaseException as e:
+            self.release(overload=is_overload(e))
+            raise
+        self.release(slot.latency)
+
+    # ============ AIMD ============
+
+    def _set_limit(self, value: float, reason: str):
+        """修改上限并记录变化（调用方持有锁）"""
+        before = self.limit
+        self._limit = min(float(self.max_limit), max(float(self.min_limit), value))
+        if self.limit != before:
+            self._history.append((time.time(), self.limit, reason))
+
+    def _decrease(self, reason: str):
+        """乘性减（调用方持有锁）；冷却期内忽略"""
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self._counters['decreases'] += 1
+        self._counters[reason] += 1
+        self._set_limit(self._limit * self.backoff, reason)
+
+    def _server_busy(self) -> bool:
+        kv_usage = self._server['kv_usage']
+        return self._server['waiting'] > 0 or (kv_usage is not None and kv_usage >= self.kv_high)
+
+    def _observe(self, latency: float):
+        """记录一个延迟样本并调整上限（调用方持有锁，已减去本请求的在途计数）"""
+        self._counters['samples'] += 1
+        if self._recent is None:
+            self._recent = latency
+        else:
+            self._recent += self.smoothing * (latency - self._recent)
+        if self._baseline is None or self._recent < self._baseline:
+            self._baseline = self._recent
+        else:
+            self._baseline += _BASELINE_DRIFT * (self._recent - self._baseline)
+
+        if (self._counters['samples'] >= _WARMUP_SAMPLES
+                and self._recent > self.tolerance * self._baseline):
+            self._decrease('latency')
+        elif self._in_flight + 1 >= self.limit and not self._server_busy():
+            # 只在上限确实被用满时增加，需求不足时上限不会无限增长
+            self._counters['increases'] += 1
+            self._set_limit(self._limit + 1.0 / self._limit, 'increase')
+
+    def observe_server(
+        self,
+        kv_usage: Optional[float] = None,
+        waiting: float = 0.0,
+        preemptions: Optional[float] = None
+    ):
+        """
+        记录一次服务端压力（watch_server 自动调用，也可以由调用方从其他来源传入）
+
+        Args:
+            kv_usage: KV cache 占用（0-1）
+            waiting: 服务端排队中的请求数
+            preemptions: 累计抢占次数（与上一次相比增加时减小并发）
+        """
+        with self._lock:
+            previous = self._server['preemptions']
+            self._server = {'kv_usage': kv_usage, 'waiting': waiting, 'preemptions': preemptions}
+            preempted = previous is not None and preemptions is not None and preemptions > previous
+            if preempted or (kv_usage is not None and kv_usage >= self.kv_high):
+                self._decrease('kv_cache')
+
+    # ============ 抓取服务端 /metrics ============
+
+    def scrape(self, base_url: Union[str, List[str]], timeout: float = 5.0) -> Dict[str, Optional[float]]:
+        """
+        抓取一次服务端 /metrics 并记录压力（多个副本时 KV 占用取最大值，其余求和）
+
+        Returns:
+            read_server_pressure 的结果
+        """
+        import requests
+        urls = [base_url] if isinstance(base_url, str) else base_url
+        total = {'kv_usage': None, 'waiting': 0.0, 'preemptions': None}
+        for url in urls:
+            with requests.get(f"{url.rstrip('/')}/metrics", timeout=timeout, stream=True) as response:
+                response.raise_for_status()
+                pressure = read_server_pressure(response.iter_lines())
+            if pressure['kv_usage'] is not None:
+                total['kv_usage'] = max(total['kv_usage'] or 0.0, pressure['kv_usage'])
+            total['waiting'] += pressure['waiting']
+            if pressure['preemptions'] is not None:
+                total['preemptions'] = (total['preemptions'] or 0.0) + pressure['preemptions']
+        self.observe_server(**total)
+        return total
+
+    def watch_server(self, base_url: Union[str, List[str]], interval: float = 2.0, timeout: float = 5.0):
+        """
+        启动后台线程，每 interval 秒抓取一次服务端 /metrics
+
+        Args:
+            base_url: vLLM 服务地址（或多个副本的地址列表），与客户端的 base_url 相同
+            interval: 抓取间隔（秒）
+            timeout: 单次抓取的超时（秒）
+        """
+        if self._watcher is not None:
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.scrape(base_url, timeout)
+                except Exception:
+                    with self._lock:
+                        self._counters['scrape_errors'] += 1
+                self._stop.wait(interval)
+
+        self._watcher = threading.Thread(target=loop, name="vllm-limiter-watch", daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        """停止后台抓取"""
+        if self._watcher is not None:
+            self._stop.set()
+            self._watcher.join()
+            self._watcher = None
+
+    # ============ 观测 ============
+
+    def history(self) -> List[Tuple[float, int, str]]:
+        """上限变化记录 [(时间戳, 新上限, 原因), ...]，原因为 initial / increase / latency / overload / kv_cache"""
+        with self._lock:
+            return list(self._history)
+
+    def stats(self) -> Dict:
+        """当前上限、在途数、延迟基线与最近值、服务端压力和各类计数"""
+        with self._lock:
+            return {
+                'limit': self.limit,
+                'in_flight': self._in_flight,
+                'async_waiting': len(self._async_waiters),
+                'baseline': self._baseline,
+                'recent': self._recent,
+                'server': dict(self._server),
+                **self._counters,
+            }
@@ -0,0 +1,243 @@
+"""
+后台连接检查 - 交互脚本不必等待连接检查就能显示输入提示符
+
+智能对话脚本启动时原本要依次完成：导入 openai / httpx（约 0.5s）、创建客户端、
+请求 /v1/models（经 SSH 隧道时还要加上往返时间），之后才显示第一个输入提示符。
+这里把这些工作放到后台线程中，与用户输入第一条消息同时进行：
+
+    - 客户端在后台线程中创建（后端模块也在那里导入）
+    - /v1/models 的检查结果按 base_url + model 缓存到本地 JSON 文件，
+      TTL 内重启脚本时不再请求服务端；只缓存成功的结果
+    - 真正需要客户端时（发送第一条消息）才等待后台线程
+
+使用方法:
+    check = ConnectionCheck(
+        lambda: VLLMClient(base_url="http://localhost:9000"),
+        key="http://localhost:9000|Qwen3-4B",
+        cache_path="chat_history/.connection_cache.json",
+    ).start()
+
+    # ... 显示提示符、读取用户输入 ...
+    if check.done():
+        result = check.result()
+        print(result.ok, result.models, result.cached)
+
+    client = check.client()     # 后台线程尚未完成时在这里等待
+"""
+
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+
+# 检查结果的默认有效期（秒）：短到服务端重启后很快会重新检查，长到连续重启脚本时不必等待
+DEFAULT_TTL = 300.0
+
+
+@dataclass
+class CheckResult:
+    """一次连接检查的结果"""
+    ok: bool
+    models: List[str] = field(default_factory=list)
+    error: Optional[BaseException] = None
+    elapsed: float = 0.0        # 本次检查耗时（秒），命中缓存时为读缓存的耗时
+    cached: bool = False        # 是否来自本地缓存
+    checked_at: float = 0.0     # 检查时间（time.time()）
+
+    @property
+    def age(self) -> float:
+        """距离检查过去的秒数"""
+        return max(0.0, time.time() - self.checked_at)
+
+
+class ConnectionCache:
+    """
+    连接检查结果的本地缓存（JSON 文件，按 key 存放，写入时原子替换）
+    """
+
+    def __init__(self, path: Union[str, Path], ttl: float = DEFAULT_TTL):
+        """
+        Args:
+            path: 缓存文件路径
+            ttl: 结果的有效期（秒），0 表示不使用缓存
+        """
+        self.path = Path(path)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, data: Dict[str, Dict[str, Any]]):
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass   # 缓存只是加速，写不了就不写
+
+    def get(self, key: str) -> Optional[CheckResult]:
+        """读取未过期的检查结果，没有时返回 None"""
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._read().get(key)
+        if not entry:
+            return None
+        checked_at = float(entry.get('checked_at', 0))
+        if not 0 <= time.time() - checked_at < self.ttl:
+            return None
+        return CheckResult(ok=True, models=list(entry.get('models', [])),
+                           cached=True, checked_at=checked_at)
+
+    def put(self, key: str, result: CheckResult):
+        """保存成功的检查结果，同时清理已过期的条目"""
+        if self.ttl <= 0 or not result.ok:
+            return
+        now = time.time()
+        with self._lock:
+            data = {k: v for k, v in self._read().items()
+                    if now - float(v.get('checked_at', 0)) < self.ttl}
+            data[key] = {'models': result.models, 'checked_at': result.checked_at,
+                         'elapsed': round(result.elapsed, 4)}
+            self._write(data)
+
+    def invalidate(self, key: str):
+        """删除一个条目（之后的请求失败时调用，下次启动会重新检查）"""
+        with self._lock:
+            data = self._read()
+            if data.pop(key, None) is not None:
+                self._write(data)
+
+
+class ConnectionCheck:
+    """
+    在后台线程中创建客户端并检查服务端连接
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        key: str,
+        cache_path: Optional[Union[str, Path]] = None,
+        ttl: float = DEFAULT_TTL
+    ):
+        """
+        Args:
+            factory: 创建客户端的函数（在后台线程中调用），客户端需提供 get_models() 与 close()
+            key: 缓存键，通常为 base_url + model
+            cache_path: 缓存文件路径，None 表示不缓存
+            ttl: 缓存有效期（秒）
+        """
+        self.key = key
+        self._factory = factory
+        self._cache = ConnectionCache(cache_path, ttl) if cache_path else None
+        self._client = None
+        self._client_error: Optional[BaseException] = None
+        self._result: Optional[CheckResult] = None
+        self._client_ready = threading.Event()
+        self._done = threading.Event()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'ConnectionCheck':
+        """启动后台线程（返回自身，便于链式调用）"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="vllm-connection-check", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        start = time.perf_counter()
+        # 缓存在创建客户端之前读取：命中时结果立即可用，不必等待后端模块导入
+        cached = self._cache.get(self.key) if self._cache else None
+        if cached is not None:
+            cached.elapsed = time.perf_counter() - start
+            self._result = cached
+            self._done.set()
+
+        try:
+            client = self._factory()
+        except BaseException as e:
+            self._client_error = e
+            client = None
+        with self._lock:
+            if self._closed and client is not None:
+                client.close()    # 检查完成前就已退出
+                client = None
+            self._client = client
+        self._client_ready.set()
+        if cached is not None:
+            return
+
+        if client is None:
+            result = CheckResult(ok=False, error=self._client_error)
+        else:
+            try:
+                models = client.get_models()
+                result = CheckResult(ok=True, models=models)
+            except Exception as e:
+                result = CheckResult(ok=False, error=e)
+        result.elapsed = time.perf_counter() - start
+        result.checked_at = time.time()
+        if self._cache:
+            self._cache.put(self.key, result)
+        self._result = result
+        self._done.set()
+
+    def done(self) -> bool:
+        """检查结果是否已经可用（不阻塞）"""
+        return self._done.is_set()
+
+    def result(self, timeout: Optional[float] = None) -> Optional[CheckResult]:
+        """
+        等待检查结果
+
+        Args:
+            timeout: 最长等待时间（秒），None 表示一直等待
+
+        Returns:
+            检查结果，超时返回 None
+        """
+        self.start()
+        self._done.wait(timeout)
+        return self._result
+
+    def client(self, timeout: Optional[float] = None):
+        """
+        获取客户端（后台线程仍在创建时等待）
+
+        Raises:
+            TimeoutError: 超时仍未创建完成
+            创建客户端时的异常
+        """
+        self.start()
+        if not self._client_ready.wait(timeout):
+            raise TimeoutError("客户端仍在创建中")
+        if self._client is None:
+            raise self._client_error or RuntimeError("连接检查已关闭")
+        return self._client
+
+    def invalidate(self):
+        """删除缓存的检查结果（请求失败时调用）"""
+        if self._cache:
+            self._cache.invalidate(self.key)
+
+    def close(self):
+        """关闭客户端；后台线程仍在创建客户端时，由它在创建完成后关闭"""
+        with self._lock:
+            self._closed = True
+            client, self._client = self._client, None
+        if client is not None:
+            client.close()
@@ -0,0 +1,49 @@
+"""
+SSH 隧道安全的长连接池
+为 requests 与 httpx（OpenAI SDK）两种后端提供可复用的连接，同时避免隧道环境下的"僵死连接"
+
+背景:
+    经 SSH 隧道访问 vLLM 时，服务端或隧道可能悄悄关闭空闲连接。
+    直接开启 keep-alive 会复用这些已失效的 socket，请求随之挂起或被重置，
+    因此 VLLMClient 默认关闭了 keep-alive 与重试。这里用三道防线让复用变得安全：
+
+    1. 空闲时长上限：单个连接空闲超过 max_idle 秒即丢弃，不再复用（按连接计时，
+       访问一个副本不会让到其他副本的旧连接显得"新鲜"）
+    2. 存活探测：从池中取出连接前检查 socket 是否已可读（对端已发 FIN / RST），
+       由 urllib3（is_connection_dropped）与 httpcore（has_expired）在取连接时完成
+    3. 一次性透明重连：只在复用的连接上、确定服务端没有开始处理时，在新连接上重发一次
+           - 请求还没有完整发出（发送时出错）：任何方法都重发，服务端收不到完整的请求体
+           - 请求已发出、响应头之前出错：只重发幂等方法（GET / HEAD / OPTIONS / PUT / DELETE）
+       新建连接上的失败、已发出的 POST（如 /v1/chat/completions）不重发，
+       避免同一次生成在服务端跑两遍；这些错误交给上层（换副本重试等）处理
+
+两种后端分别实现在 connection_pool_requests.py 与 connection_pool_httpx.py 中，
+只用其中一种后端时不会导入另一种（requests / urllib3 与 httpx 都有可观的导入时间）；
+本模块只包含两者共用的重发规则，不导入任何 HTTP 库
+
+使用方法:
+    from connection_pool_requests import TunnelSafeSession
+    session = TunnelSafeSession(max_idle=15.0)
+    session.post(url, json=data)
+
+    from connection_pool_httpx import TunnelSafeTransport
+    http_client = httpx.Client(transport=TunnelSafeTransport(max_idle=15.0))
+"""
+
+# 重复执行不改变结果的方法：已发出、尚未收到响应时也可以重发
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+
+
+def can_resend(method: str, reused: bool, sent: bool, responded: bool) -> bool:
+    """
+    连接出错后能否在新连接上重发
+
+    Args:
+        method: HTTP 方法
+        reused: 出错的连接是否为从池中复用的连接
+        sent: 请求是否已完整发出
+        responded: 是否已开始收到响应
+    """
+    if not reused or responded:
+        return False
+    return not sent or method.upper() in IDEMPOTENT_METHODS
@@ -0,0 +1,111 @@
+"""
+隧道安全的长连接池 - httpx / httpcore 后端，同步与异步两种传输层（规则见 connection_pool.py）
+
+使用方法:
+    http_client = httpx.Client(transport=TunnelSafeTransport(max_idle=15.0))
+    async_client = httpx.AsyncClient(transport=TunnelSafeAsyncTransport(max_idle=15.0))
+"""
+
+import threading
+from typing import Dict
+
+import httpx
+
+from connection_pool import can_resend
+
+# 复用连接在收到响应前就断开时 httpx 抛出的异常（是否重发还要看连接是否复用、请求是否已发出）
+_HTTPX_RESET_ERRORS = (httpx.RemoteProtocolError, httpx.ReadError, httpx.WriteError)
+
+
+def _traced(request: httpx.Request, state: Dict[str, bool], is_async: bool = False) -> httpx.Request:
+    """
+    通过 httpcore 的 trace 扩展记录连接状态：出现 connect_tcp 说明是新建连接，
+    send_request_body.complete 说明请求已完整发出，receive_response_headers.complete 说明已收到响应头
+    """
+    previous = request.extensions.get('trace')
+
+    def record(name: str):
+        if name.endswith('connect_tcp.started'):
+            state['reused'] = False
+        elif name.endswith('send_request_body.complete'):
+            state['sent'] = True
+        elif name.endswith('receive_response_headers.complete'):
+            state['responded'] = True
+
+    if is_async:
+        async def trace(name, info):
+            record(name)
+            if previous is not None:
+                await previous(name, info)
+    else:
+        def trace(name, info):
+            record(name)
+            if previous is not None:
+                previous(name, info)
+    request.extensions['trace'] = trace
+    return request
+
+
+class TunnelSafeTransport(httpx.HTTPTransport):
+    """
+    带空闲时长上限与一次性重连的 httpx 同步传输层
+    空闲时长上限由 keepalive_expiry 实现（httpcore 按连接计时），存活探测由 httpcore 在取连接时完成
+    """
+
+    def __init__(self, max_idle: float = 15.0, pool_size: int = 100):
+        super().__init__(
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+                keepalive_expiry=max_idle
+            ),
+            retries=0
+        )
+        self.reconnects = 0
+        self._lock = threading.Lock()   # 传输层可被多个线程（chat_batch）与事件循环共用
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        state = {'reused': True, 'sent': False, 'responded': False}
+        try:
+            return super().handle_request(_traced(request, state))
+        except _HTTPX_RESET_ERRORS:
+            if not can_resend(request.method, **state):
+                raise
+            # 失效连接已被 httpcore 移出连接池，重发时会新建连接
+            with self._lock:
+                self.reconnects += 1
+            return super().handle_request(request)
+
+
+class TunnelSafeAsyncTransport(httpx.AsyncHTTPTransport):
+    """
+    TunnelSafeTransport 的异步版本
+    """
+
+    def __init__(
+        self,
+        max_idle: float = 15.0,
+        pool_size: int = 100,
+        max_connections: int = 100
+    ):
+        super().__init__(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=pool_size,
+                keepalive_expiry=max_idle
+            ),
+            retries=0
+        )
+        self.reconnects = 0
+        self._lock = threading.Lock()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        state = {'reused': True, 'sent': False, 'responded': False}
+        try:
+            return await super().handle_async_request(_traced(request, state, is_async=True))
+        except _HTTPX_RESET_ERRORS:
+            if not can_resend(request.method, **state):
+                raise
+            with self._lock:
+                self.reconnects += 1
+            return await super().handle_async_request(request)
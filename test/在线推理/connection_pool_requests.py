@@ -0,0 +1,117 @@
+"""
+隧道安全的长连接池 - requests / urllib3 后端（规则见 connection_pool.py）
+
+使用方法:
+    session = TunnelSafeSession(max_idle=15.0)
+    session.post(url, json=data)
+"""
+
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from connection_pool import can_resend
+
+# 当前线程最近一次请求的连接状态（urllib3 在同一线程中完成取连接、发送与读取响应头）
+_attempt = threading.local()
+
+
+class _TrackedConnectionMixin:
+    """记录请求是否已完整发出、是否已收到响应头"""
+
+    def request(self, *args, **kwargs):
+        super().request(*args, **kwargs)
+        _attempt.state['sent'] = True
+
+    def getresponse(self, *args, **kwargs):
+        response = super().getresponse(*args, **kwargs)
+        _attempt.state['responded'] = True
+        return response
+
+
+class _TrackedHTTPConnection(_TrackedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TrackedHTTPSConnection(_TrackedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TrackedPoolMixin:
+    """按连接记录空闲时间：取出时丢弃空闲过久的 socket，并记录这次使用的是否为复用连接"""
+
+    max_idle = 15.0
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        idle_since = getattr(conn, 'idle_since', None)
+        if conn.sock is not None and idle_since is not None and time.monotonic() - idle_since > self.max_idle:
+            conn.close()   # 下次发送时自动重新建立连接
+        _attempt.state = {'reused': conn.sock is not None, 'sent': False, 'responded': False}
+        return conn
+
+    def _put_conn(self, conn):
+        if conn is not None:
+            conn.idle_since = time.monotonic()
+        super()._put_conn(conn)
+
+
+class _TrackedHTTPConnectionPool(_TrackedPoolMixin, HTTPConnectionPool):
+    ConnectionCls = _TrackedHTTPConnection
+
+
+class _TrackedHTTPSConnectionPool(_TrackedPoolMixin, HTTPSConnectionPool):
+    ConnectionCls = _TrackedHTTPSConnection
+
+
+class _TunnelSafeAdapter(HTTPAdapter):
+    """使用上面的连接池类，并把 max_idle 传给各个连接池"""
+
+    def __init__(self, max_idle: float, **kwargs):
+        self.max_idle = max_idle
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        pool_http = type('Pool', (_TrackedHTTPConnectionPool,), {'max_idle': self.max_idle})
+        pool_https = type('Pool', (_TrackedHTTPSConnectionPool,), {'max_idle': self.max_idle})
+        self.poolmanager.pool_classes_by_scheme = {'http': pool_http, 'https': pool_https}
+
+
+class TunnelSafeSession(requests.Session):
+    """
+    带空闲时长上限与一次性重连的 requests.Session
+    """
+
+    def __init__(self, max_idle: float = 15.0, pool_size: int = 100):
+        """
+        Args:
+            max_idle: 单个连接的最长空闲时间（秒），超过后关闭该连接并重新建立
+            pool_size: 每个主机保留的最大连接数
+        """
+        super().__init__()
+        adapter = _TunnelSafeAdapter(max_idle, pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+        self.max_idle = max_idle
+        self.reconnects = 0
+        self._lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        _attempt.state = None
+        try:
+            return super().request(method, url, **kwargs)
+        except requests.ConnectionError as e:
+            # 超时不重试：说明服务端在处理，重发只会加重负载
+            state = _attempt.state
+            if isinstance(e, requests.Timeout) or state is None or not can_resend(method, **state):
+                raise
+            with self._lock:
+                self.reconnects += 1
+            # 出错的连接已被 urllib3 关闭，重发时取到的是其他空闲连接或新连接
+            return super().request(method, url, **kwargs)
@@ -0,0 +1,191 @@
+"""
+对话上下文预算管理 - 保证 prompt + max_tokens 不超过服务端的 max_model_len
+
+SmartChat 每轮都会重发完整历史。会话变长后，要么触发服务端的上下文长度错误，
+要么窗口的大部分都被陈旧的轮次占据。这里在发送前裁剪最早的轮次：
+
+    - token 数按消息缓存：每轮只需要对新增的消息分词，而不是重新分词整个历史
+    - 优先使用本地模型目录中的分词器（tokenizers / transformers），
+      都不可用时按字符粗略估计（中文约 1 字 1 token，其他约 3.5 字符 1 token）
+    - background=True 时分词器在后台线程中加载（交互脚本不必等待），第一次计数时才等待
+    - 超出预算时一次裁剪到预算的 trim_target 比例，之后若干轮保持发送的前缀不变，
+      不会每轮都移动起点而让服务端的前缀缓存失效
+
+使用方法:
+    counter = TokenCounter("/root/autodl-tmp/vllm/Qwen/Qwen3-4B")
+    budget = ContextBudget(counter, max_model_len=4096)
+    messages_to_send = budget.fit(history, max_tokens=512)
+"""
+
+import math
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+# chat 模板为每条消息额外添加的 token（<|im_start|>role\n ... <|im_end|>\n）
+MESSAGE_OVERHEAD = 4
+# 模板在末尾为助手回复添加的引导 token（<|im_start|>assistant\n）
+REPLY_PRIMING = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """不依赖分词器的 token 数估计（偏保守）"""
+    cjk = sum(1 for ch in text if ord(ch) >= 0x2E80)
+    return cjk + math.ceil((len(text) - cjk) / 3.5)
+
+
+class TokenCounter:
+    """
+    带缓存的 token 计数器
+    """
+
+    def __init__(self, model_dir: Optional[str] = None, cache_size: int = 8192, background: bool = False):
+        """
+        Args:
+            model_dir: 本地模型目录（含 tokenizer.json 等文件），None 或不存在时使用估计值
+            cache_size: 缓存的文本条数
+            background: 在后台线程中加载分词器（加载期间 backend 为 'loading'）
+        """
+        self.backend = 'estimate'
+        self._encode: Callable[[str], int] = estimate_tokens
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._cache_size = cache_size
+        self._ready = threading.Event()
+        if not (model_dir and Path(model_dir).is_dir()):
+            self._ready.set()
+        elif background:
+            self.backend = 'loading'
+            threading.Thread(
+                target=self._load, args=(model_dir,), name="token-counter-load", daemon=True
+            ).start()
+        else:
+            self._load(model_dir)
+
+    def _load(self, model_dir: str):
+        """加载分词器：优先 tokenizers（轻量），其次 transformers"""
+        try:
+            self.backend = self._load_tokenizer(model_dir)
+        finally:
+            self._ready.set()
+
+    def _load_tokenizer(self, model_dir: str) -> str:
+        """设置 self._encode，返回分词器后端名"""
+        tokenizer_file = Path(model_dir) / 'tokenizer.json'
+        if tokenizer_file.exists():
+            try:
+                from tokenizers import Tokenizer
+                tokenizer = Tokenizer.from_file(str(tokenizer_file))
+                self._encode = lambda text: len(
+                    tokenizer.encode(text, add_special_tokens=False).ids
+                )
+                return 'tokenizers'
+            except Exception:
+                pass
+        try:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(model_dir, trust_remote_code=True)
+            self._encode = lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+            return 'transformers'
+        except Exception:
+            return 'estimate'
+
+    def count(self, text: str) -> int:
+        """文本的 token 数（命中缓存时不再分词；后台加载分词器时先等待加载完成）"""
+        if not self._ready.is_set():
+            self._ready.wait()
+        cached = self._cache.get(text)
+        if cached is not None:
+            self._cache.move_to_end(text)
+            return cached
+        tokens = self._encode(text)
+        self._cache[text] = tokens
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return tokens
+
+    def count_message(self, message: Dict[str, str]) -> int:
+        """单条消息的 token 数（含模板开销）"""
+        return self.count(message.get('content') or '') + MESSAGE_OVERHEAD
+
+
+class ContextBudget:
+    """
+    按 token 预算选择要发送的历史消息
+    system 消息始终保留；从最早的一轮（user + assistant）开始裁剪，最新一条消息始终保留
+    """
+
+    def __init__(
+        self,
+        counter: TokenCounter,
+        max_model_len: int = 4096,
+        safety_margin: int = 32,
+        trim_target: float = 0.75
+    ):
+        """
+        Args:
+            counter: token 计数器
+            max_model_len: 服务端的最大上下文长度
+            safety_margin: 额外预留的 token（弥补估计误差）
+            trim_target: 超出预算时裁剪到预算的多少比例
+        """
+        self.counter = counter
+        self.max_model_len = max_model_len
+        self.safety_margin = safety_margin
+        self.trim_target = trim_target
+
+        self.dropped = 0              # 已从前部裁掉的非 system 消息数
+        self.last_prompt_tokens = 0   # 最近一次 fit 得到的 prompt token 数
+
+    def reset(self):
+        """历史被清空或重新加载后调用"""
+        self.dropped = 0
+        self.last_prompt_tokens = 0
+
+    def budget(self, max_tokens: int) -> int:
+        """prompt 可用的 token 数"""
+        return self.max_model_len - max_tokens - self.safety_margin - REPLY_PRIMING
+
+    def fit(self, messages: List[Dict[str, str]], max_tokens: int) -> List[Dict[str, str]]:
+        """
+        选出本轮要发送的消息
+
+        Args:
+            messages: 完整对话历史（最后一条为本轮用户输入）
+            max_tokens: 本轮的最大生成 token 数
+
+        Returns:
+            裁剪后的消息列表（不修改传入的历史）
+
+        Raises:
+            ValueError: 仅 system 消息与最新一条消息就已超出预算
+        """
+        budget = self.budget(max_tokens)
+        system = [m for m in messages if m.get('role') == 'system']
+        dialog = [m for m in messages if m.get('role') != 'system']
+        dropped = self.dropped if self.dropped < len(dialog) else 0
+
+        count = self.counter.count_message
+        fixed = sum(count(m) for m in system)
+        counts = [count(m) for m in dialog]
+        total = fixed + sum(counts[dropped:])
+
+        if total > budget:
+            target = budget * self.trim_target
+            last = len(dialog) - 1
+            while dropped < last and total > target:
+                total -= counts[dropped]
+                dropped += 1
+            # 保证发送的对话以 user 消息开头
+            while dropped < last and dialog[dropped].get('role') != 'user':
+                total -= counts[dropped]
+                dropped += 1
+            if total > budget:
+                raise ValueError(
+                    f"消息过长：约 {total} tokens，超出上下文预算 {budget} tokens "
+                    f"(max_model_len={self.max_model_len}, max_tokens={max_tokens})"
+                )
+
+        self.dropped = dropped
+        self.last_prompt_tokens = total + REPLY_PRIMING
+        return system + dialog[self.dropped:]
@@ -0,0 +1,201 @@
+"""
+尾延迟控制 - 截止时间、对冲请求、退避重试与全局重试预算
+
+一个变慢或卡住的副本就能决定整体的 p99。VLLMClient 在副本选择之上提供三种手段:
+
+    截止时间（Deadline）
+        每次调用的总时限：HTTP 超时取剩余时间，重试与退避不会超出截止时间，
+        流式输出在截止时间后中止并抛出 DeadlineExceeded
+
+    对冲请求（HedgePolicy）
+        请求发出后，如果在最近 TTFT 的 p95（可配置）之内还没有收到首个 token，
+        就向另一个副本再发一份相同的请求，采用先返回首个 token 的一方；
+        落败的一方在收到首个片段（或出错）时立即关闭连接，vLLM 检测到断开后中止生成。
+        只有一个副本时不对冲
+
+    退避重试（RetryPolicy）
+        只重试首个 token 之前发生的错误（连接失败、超时、429 / 5xx）；已经开始输出的流不重试。
+        有未尝试过的副本时立即换副本，否则按指数退避 + 全抖动（full jitter）等待后重试
+
+    重试预算（RetryBudget）
+        重试与对冲都要先从全局预算中取得额度：每个请求存入 ratio 个额度，另外每秒补充
+        min_per_second 个，上限 burst。服务端整体过载时所有请求都在失败，预算很快耗尽，
+        额外流量被限制在原始流量的 ratio 左右，不会把过载放大成雪崩
+
+使用方法:
+    client = VLLMClient(
+        base_url=["http://localhost:9000", "http://localhost:9001"],
+        hedge=HedgePolicy(percentile=95),
+        retry=RetryPolicy(max_retries=2),
+        deadline=30.0
+    )
+    client.chat("你好", deadline=5.0)     # 单次调用的截止时间
+    print(client.retry_budget.stats(), client.hedge.stats())
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+
+class DeadlineExceeded(TimeoutError):
+    """调用超过截止时间"""
+
+
+class Deadline:
+    """单次调用的截止时间（seconds 为 None 表示不限时）"""
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.seconds = seconds
+        self.expires = None if seconds is None else time.perf_counter() + seconds
+
+    def remaining(self) -> Optional[float]:
+        """剩余秒数（不限时返回 None，已过期返回 0）"""
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - time.perf_counter())
+
+    @property
+    def expired(self) -> bool:
+        return self.expires is not None and time.perf_counter() >= self.expires
+
+    def check(self):
+        """已过期时抛出 DeadlineExceeded"""
+        if self.expired:
+            raise DeadlineExceeded(f"超过截止时间 {self.seconds}s")
+
+    def timeout(self, default: float) -> float:
+        """本次 HTTP 请求可用的超时：default 与剩余时间中较小的一个"""
+        remaining = self.remaining()
+        return default if remaining is None else max(min(default, remaining), 0.001)
+
+
+class RetryBudget:
+    """
+    全局重试预算（线程安全），重试与对冲共用
+    """
+
+    def __init__(self, ratio: float = 0.1, min_per_second: float = 1.0, burst: float = 10.0):
+        """
+        Args:
+            ratio: 每个请求存入的额度（长期来看重试 / 对冲最多占原始请求的这个比例）
+            min_per_second: 每秒固定补充的额度（流量很低时也能重试）
+            burst: 额度上限
+        """
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.burst = burst
+        self._balance = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._counters = {'requests': 0, 'spent': 0, 'denied': 0}
+
+    def _refill(self, now: float):
+        """按时间补充额度（调用方持有锁）"""
+        self._balance = min(self.burst, self._balance + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def record_request(self):
+        """记录一次原始请求，存入 ratio 个额度"""
+        with self._lock:
+            self._counters['requests'] += 1
+            self._balance = min(self.burst, self._balance + self.ratio)
+
+    def try_spend(self) -> bool:
+        """申请一次重试或对冲；额度不足时返回 False"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._balance >= 1.0:
+                self._balance -= 1.0
+                self._counters['spent'] += 1
+                return True
+            self._counters['denied'] += 1
+            return False
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            self._refill(time.monotonic())
+            return {**self._counters, 'balance': round(self._balance, 2)}
+
+
+class RetryPolicy:
+    """
+    首个 token 之前的错误的重试策略
+    """
+
+    def __init__(self, max_retries: int = 2, base_delay: float = 0.1, max_delay: float = 2.0):
+        """
+        Args:
+            max_retries: 单次调用最多重试几次
+            base_delay: 退避基数（秒），第 n 次重试最多等待 base_delay × 2^(n-1)
+            max_delay: 单次退避上限（秒）
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, retry: int) -> float:
+        """第 retry 次重试前的等待时间（全抖动：在 [0, 上限] 中均匀取值）"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (retry - 1)))
+
+
+class HedgePolicy:
+    """
+    对冲策略：记录最近的 TTFT，超过其分位数仍未收到首个 token 时发出对冲请求
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95,
+        window: int = 256,
+        min_samples: int = 20,
+        initial_delay: float = 1.0,
+        min_delay: float = 0.05,
+        max_delay: float = 10.0
+    ):
+        """
+        Args:
+            percentile: 对冲阈值取最近 TTFT 的哪个分位数（0-100）
+            window: 参与计算的最近 TTFT 样本数
+            min_samples: 样本不足时使用 initial_delay
+            initial_delay: 冷启动阶段的对冲阈值（秒）
+            min_delay: 阈值下限，避免 TTFT 很稳定时几乎每个请求都被对冲
+            max_delay: 阈值上限
+        """
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._counters = {'hedged': 0, 'hedge_wins': 0}   # 发出的对冲请求数、其中胜出的次数
+
+    def observe(self, ttft: float):
+        """记录一次请求的首 token 延迟"""
+        with self._lock:
+            self._samples.append(ttft)
+
+    def delay(self) -> float:
+        """当前的对冲阈值（秒）"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return self.initial_delay
+            samples = sorted(self._samples)
+        index = min(len(samples) - 1, int(len(samples) * self.percentile / 100))
+        return min(self.max_delay, max(self.min_delay, samples[index]))
+
+    def record(self, won: bool):
+        """记录一次对冲的结果，won 表示最终采用了对冲请求"""
+        with self._lock:
+            self._counters['hedged'] += 1
+            self._counters['hedge_wins'] += won
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats['samples'] = len(self._samples)
+        stats['delay'] = self.delay()
+        return stats
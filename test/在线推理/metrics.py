@@ -0,0 +1,483 @@
+"""
+客户端指标 - 进程内的 Counter / Gauge / Histogram + Prometheus 文本格式输出
+
+VLLMClient 传入 metrics=MetricsRegistry() 后记录（标签为 model、endpoint）：
+    vllm_client_requests_total               请求数（按是否流式）
+    vllm_client_request_latency_seconds      请求总耗时
+    vllm_client_ttft_seconds                 首 token 延迟（流式）
+    vllm_client_inter_token_latency_seconds  token 间隔（流式）
+    vllm_client_prompt_tokens_total          prompt token 数（来自服务端 usage）
+    vllm_client_completion_tokens_total      生成 token 数
+    vllm_client_errors_total                 失败数（按异常类型）
+    vllm_client_retries_total                首个 token 之前出错后的重试次数
+    vllm_client_requests_in_flight           在途请求数
+    vllm_client_cache_hits_total             本地响应缓存命中数
+    vllm_client_deduplicated_total           与同时进行的相同请求合并、未发往服务端的调用数
+    vllm_client_hedges_total                 对冲请求数（按对冲请求是否胜出）
+
+流式循环里每个 token 只做一次 perf_counter 和一次 list.append，
+token 间隔在流结束时一次性（一次加锁）写入直方图；不传 metrics 时使用空操作的记录器。
+
+可选启动本地 HTTP 服务，在 /metrics 以 Prometheus 文本格式暴露，供现有的抓取配置使用。
+parse_samples 逐行解析 Prometheus 文本，用于读取 vLLM 服务端自己的 /metrics（KV cache 占用、排队请求数等）。
+
+使用方法:
+    registry = MetricsRegistry()
+    client = VLLMClient(metrics=registry)
+    registry.serve(port=9400)          # curl http://127.0.0.1:9400/metrics
+    print(registry.render())
+"""
+
+import bisect
+import re
+import threading
+import time
+from typing import Collection, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+# 请求耗时 / TTFT 的直方图桶（秒）
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# token 间隔的直方图桶（秒）
+ITL_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.02, 0.04, 0.06, 0.08, 0.1, 0.25, 0.5, 1.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# ============ 指标类型 ============
+
+class _Metric:
+    """带标签的指标：每组标签值对应一个子指标，子指标在第一次使用时创建并缓存"""
+
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        """获取一组标签值对应的子指标（调用方可以缓存返回值，避免每次查字典）"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} 需要标签 {self.labelnames}，收到 {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self) -> List[str]:
+        """Prometheus 文本格式的各行"""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        for values, child in list(self._children.items()):
+            lines.extend(self._collect_child(values, child))
+        return lines
+
+    def _collect_child(self, values: Tuple[str, ...], child) -> List[str]:
+        labels = _format_labels(self.labelnames, values)
+        return [f"{self.name}{labels} {_format_value(child.value)}"]
+
+
+class _ValueChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    """只增不减的计数器（名称以 _total 结尾）"""
+
+    type_name = 'counter'
+
+    def _new_child(self):
+        return _ValueChild()
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值"""
+
+    type_name = 'gauge'
+
+    def _new_child(self):
+        return _ValueChild()
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # 最后一个桶为 +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def observe_many(self, values: Sequence[float]):
+        """一次加锁写入多个观测值（流式结束时批量写入 token 间隔）"""
+        bounds = self.bounds
+        indexes = [bisect.bisect_left(bounds, v) for v in values]
+        total = sum(values)
+        with self._lock:
+            for index in indexes:
+                self.counts[index] += 1
+            self.sum += total
+            self.count += len(indexes)
+
+
+class Histogram(_Metric):
+    """累计直方图"""
+
+    type_name = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _collect_child(self, values: Tuple[str, ...], child: _HistogramChild) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), child.counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(
+                f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}"
+            )
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+# ============ 注册表与 HTTP 输出 ============
+
+class MetricsRegistry:
+    """
+    指标注册表：创建指标、输出 Prometheus 文本、可选启动 /metrics HTTP 服务
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        self._server: Optional['ThreadingHTTPServer'] = None
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # 同名指标只注册一次（多个客户端共享同一个注册表）
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """全部指标的 Prometheus 文本格式"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port: int = 9400, host: str = '127.0.0.1') -> 'ThreadingHTTPServer':
+        """
+        在后台线程启动 HTTP 服务，GET /metrics 返回 Prometheus 文本
+
+        Args:
+            port: 监听端口（0 表示随机端口，实际端口见返回值的 server_address）
+            host: 监听地址，默认只监听本机
+
+        Returns:
+            HTTP 服务对象
+        """
+        if self._server is not None:
+            return self._server
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer   # 只有开启本地 /metrics 时才需要
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass   # 不在终端打印每次抓取
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(
+            target=self._server.serve_forever, name="vllm-metrics-http", daemon=True
+        ).start()
+        return self._server
+
+    def stop(self):
+        """停止 HTTP 服务"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+# ============ 客户端指标 ============
+
+class _NullRecorder:
+    """未启用指标时使用的空操作记录器"""
+
+    __slots__ = ()
+
+    def token(self):
+        pass
+
+    def finish(self, meta=None):
+        pass
+
+    def fail(self, error: BaseException, retry: bool = False):
+        pass
+
+    def cancel(self):
+        pass
+
+
+NULL_RECORDER = _NullRecorder()
+
+
+class RequestRecorder:
+    """
+    单次请求（在某个副本上的一次尝试）的记录器
+    finish / fail / cancel 只能调用一次
+    """
+
+    __slots__ = ('_metrics', '_labels', '_start', '_last', '_first', '_itl')
+
+    def __init__(self, metrics: "ClientMetrics", labels: Tuple[str, str]):
+        self._metrics = metrics
+        self._labels = labels
+        self._start = time.perf_counter()
+        self._last = 0.0
+        self._first = 0.0
+        self._itl: List[float] = []
+
+    def token(self):
+        """流式循环中每收到一个片段调用一次"""
+        now = time.perf_counter()
+        if self._last:
+            self._itl.append(now - self._last)
+        else:
+            self._first = now
+        self._last = now
+
+    def finish(self, meta=None):
+        """请求成功结束"""
+        self._metrics._finish(self, meta)
+
+    def fail(self, error: BaseException, retry: bool = False):
+        """请求失败；retry 表示随后会重试"""
+        self._metrics._fail(self, error, retry)
+
+    def cancel(self):
+        """请求被主动放弃（对冲落败），只减少在途数，不计入耗时与错误"""
+        self._metrics.in_flight.labels(*self._labels).dec()
+
+
+class ClientMetrics:
+    """
+    VLLMClient 使用的指标集合（标签：model、endpoint）
+    """
+
+    def __init__(self, registry: MetricsRegistry, model: str):
+        self.registry = registry
+        self.model = model
+        labels = ('model', 'endpoint')
+        self.requests = registry.counter(
+            'vllm_client_requests_total', '发出的请求数', labels + ('stream',))
+        self.latency = registry.histogram(
+            'vllm_client_request_latency_seconds', '请求总耗时', labels)
+        self.ttft = registry.histogram(
+            'vllm_client_ttft_seconds', '流式请求的首 token 延迟', labels)
+        self.itl = registry.histogram(
+            'vllm_client_inter_token_latency_seconds', '流式请求的 token 间隔', labels,
+            buckets=ITL_BUCKETS)
+        self.prompt_tokens = registry.counter(
+            'vllm_client_prompt_tokens_total', 'prompt token 数', labels)
+        self.completion_tokens = registry.counter(
+            'vllm_client_completion_tokens_total', '生成 token 数', labels)
+        self.errors = registry.counter(
+            'vllm_client_errors_total', '失败的请求数', labels + ('error',))
+        self.retries = registry.counter(
+            'vllm_client_retries_total', '首个 token 之前出错后重试的次数', labels)
+        self.in_flight = registry.gauge(
+            'vllm_client_requests_in_flight', '在途请求数', labels)
+        self.cache_hits = registry.counter(
+            'vllm_client_cache_hits_total', '本地响应缓存命中数', ('model',))
+        self.deduplicated = registry.counter(
+            'vllm_client_deduplicated_total', '与进行中的相同请求合并的调用数', ('model', 'stream'))
+        self.hedges = registry.counter(
+            'vllm_client_hedges_total', '对冲请求数', ('model', 'outcome'))
+
+    def start(self, endpoint: str, stream: bool) -> RequestRecorder:
+        """开始记录一次请求"""
+        labels = (self.model, endpoint)
+        self.requests.labels(*labels, 'true' if stream else 'false').inc()
+        self.in_flight.labels(*labels).inc()
+        return RequestRecorder(self, labels)
+
+    def cache_hit(self):
+        self.cache_hits.labels(self.model).inc()
+
+    def deduplicated_call(self, stream: bool):
+        self.deduplicated.labels(self.model, 'true' if stream else 'false').inc()
+
+    def hedge(self, won: bool):
+        self.hedges.labels(self.model, 'won' if won else 'lost').inc()
+
+    def _finish(self, recorder: RequestRecorder, meta):
+        labels = recorder._labels
+        self.in_flight.labels(*labels).dec()
+        self.latency.labels(*labels).observe(time.perf_counter() - recorder._start)
+        if recorder._first:
+            self.ttft.labels(*labels).observe(recorder._first - recorder._start)
+        if recorder._itl:
+            self.itl.labels(*labels).observe_many(recorder._itl)
+        if meta is not None:
+            if meta.prompt_tokens:
+                self.prompt_tokens.labels(*labels).inc(meta.prompt_tokens)
+            completion = meta.completion_tokens or meta.chunks
+            if completion:
+                self.completion_tokens.labels(*labels).inc(completion)
+
+    def _fail(self, recorder: RequestRecorder, error: BaseException, retry: bool):
+        labels = recorder._labels
+        self.in_flight.labels(*labels).dec()
+        self.errors.labels(*labels, type(error).__name__).inc()
+        if retry:
+            self.retries.labels(*labels).inc()
+
+
+# ============ 解析 Prometheus 文本 ============
+
+_SAMPLE_RE = re.compile(r'([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)')
+_LABEL_RE = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+_UNESCAPE_RE = re.compile(r'\\(.)')
+
+
+def _unescape(value: str) -> str:
+    return _UNESCAPE_RE.sub(lambda m: '\n' if m.group(1) == 'n' else m.group(1), value)
+
+
+def parse_samples(
+    lines: Iterable[Union[str, bytes]],
+    names: Optional[Collection[str]] = None
+) -> Iterator[Tuple[str, Dict[str, str], float]]:
+    """
+    逐行解析 Prometheus 文本格式（例如 vLLM 服务端的 /metrics），不需要先读完整个响应
+
+    Args:
+        lines: 文本行（str 或 bytes），可以直接传入 response.iter_lines()
+        names: 只解析这些指标名（直方图的 _sum / _count / _bucket 需分别列出）；
+            其余行只看一眼指标名就跳过，不做正则匹配。vLLM 的 /metrics 大部分是直方图的 _bucket 行
+
+    Yields:
+        (指标名, 标签字典, 数值)；注释行、空行和无法解析的行被跳过
+
+    Example:
+        >>> for name, labels, value in parse_samples(text.splitlines()):
+        ...     if name == 'vllm:num_requests_waiting':
+        ...         print(labels.get('model_name'), value)
+    """
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', 'replace')
+        line = line.strip()
+        if not line or line[0] == '#':
+            continue
+        if names is not None:
+            end = len(line)
+            for sep in '{ ':
+                index = line.find(sep, 0, end)
+                if index >= 0:
+                    end = index
+            if line[:end] not in names:
+                continue
+        match = _SAMPLE_RE.match(line)
+        if match is None:
+            continue
+        name, raw_labels, raw_value = match.groups()
+        try:
+            value = float(raw_value)
+        except ValueError:
+            continue
+        labels = {key: _unescape(val) for key, val in _LABEL_RE.findall(raw_labels)} if raw_labels else {}
+        yield name, labels, value
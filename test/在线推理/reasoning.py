@@ -0,0 +1,195 @@
+"""
+推理模型输出拆分 - 把 <think>...</think> 中的思考过程与最终回答分开
+
+DeepSeek-R1、Qwen3 等推理模型先输出 <think> 思考过程 </think>，再输出回答。
+ThinkSplitter 逐个接收流式片段，实时区分两个通道:
+    - reasoning  思考过程（<think> 与 </think> 之间）
+    - answer     最终回答
+标签可能被拆在多个片段中（例如 "</th" + "ink>"），可能组成标签的末尾几个字符会暂时保留，
+等下一个片段到达后再判断，不会把半个标签当作正文输出。
+
+提示词末尾已经强制加入 "<think>\\n"（DeepSeek-R1 的推荐用法）时，模型输出中没有开始标签，
+只有 </think>：用 start_in_reasoning=True 从思考通道开始；未指定时，遇到没有开始标签的
+</think> 也会把此前的内容归入思考过程（此前已按回答流式产出的片段无法撤回）。
+
+服务端以 --reasoning-parser 启动时，思考过程放在 reasoning_content 字段，content 中只有回答，
+此时拆分器原样产出回答，不需要额外配置。
+
+多轮对话只应把回答写入历史：思考过程通常比回答长数倍，留在历史里每轮都要重新 prefill。
+
+使用方法:
+    splitter = ThinkSplitter()
+    for chunk in client.chat_stream_with_history(messages):
+        for channel, text in splitter.feed(chunk):
+            ...
+    splitter.flush()
+    messages.append({"role": "assistant", "content": splitter.answer})
+
+    reasoning, answer = split_reasoning(client.chat("9.11 和 9.9 哪个大？"))
+"""
+
+from typing import Iterable, Iterator, List, Tuple
+
+REASONING = 'reasoning'
+ANSWER = 'answer'
+
+OPEN_TAG = '<think>'
+CLOSE_TAG = '</think>'
+
+
+class ThinkSplitter:
+    """
+    流式思考过程 / 回答拆分器
+    """
+
+    def __init__(
+        self,
+        start_in_reasoning: bool = False,
+        open_tag: str = OPEN_TAG,
+        close_tag: str = CLOSE_TAG
+    ):
+        """
+        Args:
+            start_in_reasoning: 输出是否从思考过程开始（提示词末尾已有开始标签时为 True）
+            open_tag: 思考开始标签
+            close_tag: 思考结束标签
+        """
+        self.open_tag = open_tag
+        self.close_tag = close_tag
+        self.in_reasoning = start_in_reasoning
+        self._seen_tag = start_in_reasoning
+        self._held = ''                 # 末尾可能是半个标签的文本
+        self._strip = True              # 通道切换后去掉开头的空白（标签后的换行）
+        self._reasoning: List[str] = []
+        self._answer: List[str] = []
+
+    @property
+    def channel(self) -> str:
+        """当前所在的通道"""
+        return REASONING if self.in_reasoning else ANSWER
+
+    @property
+    def reasoning(self) -> str:
+        """目前为止的思考过程"""
+        return ''.join(self._reasoning).rstrip()
+
+    @property
+    def answer(self) -> str:
+        """目前为止的回答"""
+        return ''.join(self._answer).rstrip()
+
+    def _emit(self, out: List[Tuple[str, str]], text: str):
+        """把文本计入当前通道，并与上一段同通道输出合并"""
+        if self._strip:
+            text = text.lstrip()
+            if text:
+                self._strip = False
+        if not text:
+            return      # 不产出空事件（例如标签前后没有内容）
+        channel = self.channel
+        (self._reasoning if self.in_reasoning else self._answer).append(text)
+        if out and out[-1][0] == channel:
+            out[-1] = (channel, out[-1][1] + text)
+        else:
+            out.append((channel, text))
+
+    def _partial_tag(self, data: str) -> int:
+        """data 末尾与某个标签开头重合的最长长度"""
+        tags = (self.close_tag,) if self.in_reasoning else (self.open_tag, self.close_tag)
+        longest = max(len(tag) for tag in tags) - 1
+        tail = data[-longest:]
+        if '<' not in tail:
+            return 0
+        for size in range(min(longest, len(data)), 0, -1):
+            if any(tag.startswith(data[-size:]) for tag in tags):
+                return size
+        return 0
+
+    def feed(self, text: str) -> List[Tuple[str, str]]:
+        """
+        接收一个流式片段
+
+        Args:
+            text: 文本片段
+
+        Returns:
+            [(通道, 文本), ...]，通道为 'reasoning' 或 'answer'；可能为空（片段被暂存）
+        """
+        data = self._held + text
+        self._held = ''
+        out: List[Tuple[str, str]] = []
+
+        while data:
+            if self.in_reasoning:
+                index = data.find(self.close_tag)
+                if index < 0:
+                    break
+                self._emit(out, data[:index])
+                data = data[index + len(self.close_tag):]
+                self.in_reasoning = False
+                self._strip = True
+                continue
+
+            index = data.find(self.open_tag)
+            stray = -1 if self._seen_tag else data.find(self.close_tag)
+            if 0 <= stray and (index < 0 or stray < index):
+                # 没有开始标签的 </think>：此前的内容都是思考过程
+                self.in_reasoning = True
+                self._emit(out, data[:stray])
+                self._reasoning[:0] = self._answer
+                self._answer.clear()
+                self._seen_tag = True
+                self.in_reasoning = False
+                self._strip = True
+                data = data[stray + len(self.close_tag):]
+                continue
+            if index < 0:
+                break
+            self._emit(out, data[:index])
+            data = data[index + len(self.open_tag):]
+            self.in_reasoning = True
+            self._seen_tag = True
+            self._strip = True
+
+        size = self._partial_tag(data)
+        if size:
+            self._held = data[-size:]
+            data = data[:-size]
+        if data:
+            self._emit(out, data)
+        return out
+
+    def flush(self) -> List[Tuple[str, str]]:
+        """流结束时调用：输出暂存的文本（结尾的半个标签按正文处理）"""
+        out: List[Tuple[str, str]] = []
+        if self._held:
+            self._emit(out, self._held)
+            self._held = ''
+        return out
+
+
+def iter_channels(chunks: Iterable[str], start_in_reasoning: bool = False) -> Iterator[Tuple[str, str]]:
+    """
+    把流式片段转换为 (通道, 文本) 序列
+
+    Example:
+        >>> for channel, text in iter_channels(client.chat_stream("你好")):
+        ...     print(text, end="") if channel == ANSWER else None
+    """
+    splitter = ThinkSplitter(start_in_reasoning)
+    for chunk in chunks:
+        yield from splitter.feed(chunk)
+    yield from splitter.flush()
+
+
+def split_reasoning(text: str, start_in_reasoning: bool = False) -> Tuple[str, str]:
+    """
+    拆分完整回复
+
+    Returns:
+        (思考过程, 回答)；没有思考标签时思考过程为空字符串
+    """
+    splitter = ThinkSplitter(start_in_reasoning)
+    splitter.feed(text)
+    splitter.flush()
+    return splitter.reasoning, splitter.answer
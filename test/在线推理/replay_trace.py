@@ -0,0 +1,288 @@
+"""
+请求轨迹开环回放 - 按真实流量的到达时间重发请求，统计 SLO 达成率
+
+读取 traffic_trace.TraceRecorder 记录的轨迹（JSONL），开环发送：每个请求到点就发，
+不等待之前的请求完成，突发流量会原样压到服务端。三种到达方式:
+    - 原始时间（默认）：按记录的到达间隔发送
+    - --speedup N：到达间隔缩短为 1/N（N=2 即两倍流量）
+    - --qps R：忽略记录的时间，按平均 R req/s 的泊松过程发送
+
+每个请求保留记录中的 prompt 长度、输出长度与采样参数：
+    - 记录了 messages（redact=False）时重发原始消息，否则按会话哈希生成合成文本，
+      同一会话的后续轮次与前一轮共享前缀（一个英文单词约一个 token）
+    - 默认以记录的实际输出长度作为 max_tokens 并设置 ignore_eos，输出长度与记录一致；
+      --output-len max_tokens 改为使用记录中请求的 max_tokens，由模型自然结束
+
+结果沿用 benchmark_serving.py 的 TTFT / TPOT / ITL / E2E 汇总，另外报告 SLO 达成率
+（TTFT 与 E2E 低于阈值的请求比例，失败的请求算作未达成），用于检查新的
+max_model_len、gpu_memory_utilization 等设置在真实形状的流量下是否仍然满足要求
+
+使用方法:
+    python replay_trace.py traces/prod.jsonl --slo-ttft-ms 1000 --slo-e2e-ms 20000
+
+    # 两倍速回放，写出汇总
+    python replay_trace.py traces/prod.jsonl --speedup 2 \\
+        --output-json results/gmu0.9.json --metadata gpu_memory_utilization=0.9
+
+    # 按 8 req/s 泊松到达，只回放前 500 个请求
+    python replay_trace.py traces/prod.jsonl --qps 8 --limit 500
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmark_serving import (
+    _WORDS, RequestRecord, build_report, metadata_item, percentile, print_report, send_request
+)
+from connection_pool_httpx import TunnelSafeAsyncTransport
+from context_budget import MESSAGE_OVERHEAD, REPLY_PRIMING
+from traffic_trace import TraceEntry, load_trace
+
+
+# ============ 到达时间 ============
+
+def arrival_offsets(
+    entries: List[TraceEntry],
+    speedup: float = 1.0,
+    qps: Optional[float] = None,
+    seed: int = 0
+) -> List[float]:
+    """
+    每个请求相对回放开始的发送时间（秒）
+
+    Args:
+        entries: 按到达时间排序的记录
+        speedup: 原始时间的加速倍数
+        qps: 给出时按该平均速率的泊松过程生成到达时间，忽略记录的时间
+        seed: 泊松过程的随机种子
+    """
+    if qps is not None:
+        rng = random.Random(seed)
+        offsets, now = [], 0.0
+        for _ in entries:
+            offsets.append(now)
+            now += rng.expovariate(qps)
+        return offsets
+    if not entries:
+        return []
+    first = entries[0].t
+    return [(entry.t - first) / speedup for entry in entries]
+
+
+def peak_rate(offsets: List[float], window: float = 1.0) -> float:
+    """滑动窗口内的最大到达速率（req/s），衡量流量的突发程度"""
+    peak, low = 0, 0
+    for high, offset in enumerate(offsets):
+        while offset - offsets[low] >= window:
+            low += 1
+        peak = max(peak, high - low + 1)
+    return peak / window
+
+
+# ============ 请求构造 ============
+
+class PromptSynthesizer:
+    """
+    为脱敏的记录生成合成 prompt
+    每个会话一段确定的单词序列，长度为 N 的 prompt 取其前 N 个词：
+    同一会话的各轮互为前缀，服务端前缀缓存的命中情况与真实多轮对话接近
+    """
+
+    def __init__(self, seed: int = 0):
+        self.seed = seed
+        self._sessions: Dict[str, List[str]] = {}
+
+    def messages(self, entry: TraceEntry, index: int) -> List[Dict[str, str]]:
+        session = entry.session or f"#{index}"
+        words = self._sessions.setdefault(session, [])
+        length = max(1, entry.prompt_tokens - MESSAGE_OVERHEAD - REPLY_PRIMING)
+        if len(words) < length:
+            rng = random.Random(f"{self.seed}:{session}:{len(words)}")
+            words.extend(rng.choice(_WORDS) for _ in range(length - len(words)))
+        return [{"role": "user", "content": f"[{session}] " + " ".join(words[:length])}]
+
+
+def build_request(
+    entry: TraceEntry,
+    model: str,
+    output_len: str = 'recorded'
+) -> Dict:
+    """
+    按记录构造请求体（不含 messages）
+
+    Args:
+        entry: 轨迹记录
+        model: 服务端模型名
+        output_len: 'recorded' 固定生成记录中的实际输出长度（ignore_eos），
+            'max_tokens' 使用记录中请求的 max_tokens
+    """
+    payload = {
+        **entry.sampling,
+        "model": model,
+        "stream": True,
+        "stream_options": {"include_usage": True},
+    }
+    if output_len == 'recorded':
+        payload["max_tokens"] = max(1, entry.output_tokens)
+        payload["ignore_eos"] = True   # vLLM 扩展参数：固定生成 max_tokens 个 token
+    else:
+        payload["max_tokens"] = entry.max_tokens or max(1, entry.output_tokens)
+    return payload
+
+
+# ============ 回放 ============
+
+async def replay(
+    args,
+    entries: List[TraceEntry],
+    offsets: List[float]
+) -> Tuple[List[RequestRecord], List[float], float]:
+    """
+    开环发送全部请求
+
+    Returns:
+        (每个请求的测量结果, 每个请求的发送滞后（秒）, 总耗时)
+    """
+    synthesizer = PromptSynthesizer(args.seed)
+    requests = [
+        (build_request(entry, args.model, args.output_len),
+         entry.messages if entry.messages and not args.synthetic else synthesizer.messages(entry, i))
+        for i, entry in enumerate(entries)
+    ]
+
+    http = httpx.AsyncClient(
+        base_url=args.base_url.rstrip('/'),
+        headers={"Authorization": f"Bearer {args.api_key}"},
+        timeout=httpx.Timeout(args.timeout, connect=10.0, pool=None),
+        transport=TunnelSafeAsyncTransport(
+            pool_size=args.max_connections, max_connections=args.max_connections
+        )
+    )
+    lags = []
+    async with http:
+        start = time.perf_counter()
+        tasks = []
+        for (payload, messages), offset in zip(requests, offsets):
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            lags.append(max(0.0, time.perf_counter() - start - offset))
+            tasks.append(asyncio.create_task(send_request(http, payload, messages)))
+        records = await asyncio.gather(*tasks)
+        duration = time.perf_counter() - start
+    return records, lags, duration
+
+
+def slo_report(records: List[RequestRecord], ttft_slo: float, e2e_slo: float, duration: float) -> Dict:
+    """
+    SLO 达成率：TTFT、E2E 分别以及同时低于阈值的请求比例（失败或没有收到任何 token 的请求算作未达成）
+
+    Args:
+        ttft_slo / e2e_slo: 阈值（秒）
+    """
+    total = len(records) or 1
+    ok = [r for r in records if r.error is None]
+    ttft_ok = [r for r in ok if r.ttft is not None and r.ttft <= ttft_slo]
+    e2e_ok = sum(1 for r in ok if r.e2e <= e2e_slo)
+    both = sum(1 for r in ttft_ok if r.e2e <= e2e_slo)
+    return {
+        'ttft_slo_ms': ttft_slo * 1000,
+        'e2e_slo_ms': e2e_slo * 1000,
+        'ttft_attainment': len(ttft_ok) / total,
+        'e2e_attainment': e2e_ok / total,
+        'attainment': both / total,
+        'goodput': both / duration if duration else 0.0,   # 满足 SLO 的请求吞吐（req/s）
+    }
+
+
+def print_slo(slo: Dict, lags: List[float]):
+    """打印 SLO 达成率与发送滞后"""
+    print(f"SLO 达成率:      {slo['attainment']:.1%}  "
+          f"(TTFT ≤ {slo['ttft_slo_ms']:.0f}ms: {slo['ttft_attainment']:.1%}, "
+          f"E2E ≤ {slo['e2e_slo_ms']:.0f}ms: {slo['e2e_attainment']:.1%})")
+    print(f"有效吞吐:        {slo['goodput']:.2f} req/s（满足 SLO）")
+    lag_p99 = percentile(lags, 99) if lags else 0.0
+    if lag_p99 > 0.05:
+        print(f"⚠️  发送滞后 p99 {lag_p99 * 1000:.0f}ms：客户端跟不上目标到达速率，实际流量低于轨迹")
+    print("=" * 60)
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="请求轨迹开环回放")
+    parser.add_argument("trace", help="TraceRecorder 记录的 JSONL 轨迹文件")
+    parser.add_argument("--base-url", default="http://localhost:9000")
+    parser.add_argument("--api-key", default="muyu")
+    parser.add_argument("--model", default="Medical_Qwen3_8B_Large_Language_Model")
+    timing = parser.add_mutually_exclusive_group()
+    timing.add_argument("--speedup", type=float, default=1.0, help="原始到达时间的加速倍数")
+    timing.add_argument("--qps", type=float, default=None, help="改为按平均 req/s 的泊松过程到达")
+    parser.add_argument("--limit", type=int, default=None, help="只回放前 N 个请求")
+    parser.add_argument("--include-cached", action="store_true",
+                        help="同时回放由客户端缓存返回 / 合并的请求（它们当时没有到达服务端）")
+    parser.add_argument("--output-len", choices=['recorded', 'max_tokens'], default='recorded',
+                        help="recorded: 固定生成记录的实际输出长度；max_tokens: 使用请求的 max_tokens")
+    parser.add_argument("--synthetic", action="store_true", help="即使记录了消息内容也使用合成 prompt")
+    parser.add_argument("--slo-ttft-ms", type=float, default=1000.0)
+    parser.add_argument("--slo-e2e-ms", type=float, default=30000.0)
+    parser.add_argument("--max-connections", type=int, default=1000, help="连接池上限（开环回放不限制在途请求数）")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output-json", help="写出 JSON 汇总的路径")
+    parser.add_argument("--metadata", nargs="*", default=[], type=metadata_item,
+                        help="附加到 JSON 汇总中的 key=value，例如 max_model_len=8192")
+    args = parser.parse_args(argv)
+    if args.speedup <= 0 or (args.qps is not None and args.qps <= 0):
+        parser.error("--speedup / --qps 必须大于 0")
+    return args
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    entries = load_trace(args.trace)
+    if not args.include_cached:
+        entries = [e for e in entries if not (e.from_cache or e.shared)]
+    entries = entries[:args.limit]
+    if not entries:
+        print(f"❌ 轨迹中没有可回放的请求: {args.trace}")
+        return
+
+    offsets = arrival_offsets(entries, args.speedup, args.qps, args.seed)
+    span = offsets[-1]
+    mode = f"泊松 {args.qps} req/s" if args.qps is not None else f"原始时间 x{args.speedup:g}"
+    print(f"🚀 回放 {args.trace} → {args.base_url}：{len(entries)} 个请求，{mode}")
+    print(f"   时长 {span:.1f}s，平均 {len(entries) / span if span else float('inf'):.2f} req/s，"
+          f"1s 峰值 {peak_rate(offsets):.0f} req/s，"
+          f"输入/输出 token {sum(e.prompt_tokens for e in entries)} / {sum(e.output_tokens for e in entries)}")
+
+    records, lags, duration = asyncio.run(replay(args, entries, offsets))
+    report = build_report(records, duration)
+    slo = slo_report(records, args.slo_ttft_ms / 1000, args.slo_e2e_ms / 1000, duration)
+    report['slo'] = slo
+    report['send_lag_p99_ms'] = percentile(lags, 99) * 1000
+    print_report(report)
+    print_slo(slo, lags)
+
+    if args.output_json:
+        summary = {
+            'timestamp': datetime.now().isoformat(),
+            'config': {k: v for k, v in vars(args).items() if k not in ('api_key', 'metadata')},
+            'metadata': dict(args.metadata),
+            'metrics': report,
+        }
+        output = Path(args.output_json)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"✅ 汇总已写入: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+多副本负载均衡 - 最少在途请求（或 token）路由 + 健康检查 + 熔断
+
+每个 `vllm serve` 副本（通常一张 GPU 一个）对应一个 Replica。
+选择副本时跳过被健康检查判定为不健康、或熔断器处于打开状态的副本，
+在剩下的副本中选在途请求数（或在途 token 数）最少的一个。
+
+熔断器状态:
+    closed     正常接收请求
+    open       连续失败达到阈值后打开，cooldown 秒内不再分配请求
+    half_open  冷却结束后放行一个试探请求：成功则关闭，失败则重新打开
+只有试探请求本身成功才会关闭熔断器：acquire 真正选中冷却结束的副本时才转入 half_open，
+并在返回的 Lease 上标记 probe；熔断器打开前发出、之后才成功的请求不会把它关闭
+
+所有副本都不可用时，退化为在全部副本中按负载选择，而不是直接拒绝请求
+（单副本部署时行为与之前一致）。
+
+会话亲和（affinity_key）:
+    vLLM 的自动前缀缓存只在同一副本上生效。传入会话稳定前缀的哈希作为 affinity_key 时，
+    用一致性哈希环把同一会话固定到同一副本；该副本不可用或负载超过平均值的
+    load_factor 倍（有界负载一致性哈希）时，沿哈希环顺延到下一个副本。
+    副本增减只影响哈希环上相邻的一小部分会话。
+
+使用方法:
+    pool = ReplicaPool(["http://localhost:9000", "http://localhost:9001"])
+    lease = pool.acquire()
+    try:
+        ...  # 向 lease.base_url 发送请求
+        pool.release(lease)
+    except ConnectionError:
+        pool.release(lease, failed=True)
+    except ValueError:
+        pool.release(lease, neutral=True)      # 客户端参数错误与副本状态无关，只归还负载
+"""
+
+import bisect
+import hashlib
+import math
+import threading
+import time
+from typing import Callable, Collection, Dict, List, Literal, Optional, Tuple
+
+
+class Replica:
+    """单个 vLLM 服务副本的运行状态"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip('/')
+        self.in_flight = 0              # 在途请求数
+        self.in_flight_tokens = 0       # 在途请求的估计 token 数
+        self.healthy = True             # 最近一次健康检查结果
+        self.state = 'closed'           # 熔断器状态
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.total_requests = 0
+        self.total_failures = 0
+
+    def snapshot(self) -> Dict:
+        """当前状态（用于展示与调试）"""
+        return {
+            'base_url': self.base_url,
+            'in_flight': self.in_flight,
+            'in_flight_tokens': self.in_flight_tokens,
+            'healthy': self.healthy,
+            'state': self.state,
+            'total_requests': self.total_requests,
+            'total_failures': self.total_failures,
+        }
+
+
+class Lease:
+    """一次 acquire 的结果：选中的副本、计入的 token 数，以及是否为半开状态的试探请求"""
+
+    __slots__ = ('replica', 'tokens', 'probe')
+
+    def __init__(self, replica: Replica, tokens: int = 0, probe: bool = False):
+        self.replica = replica
+        self.tokens = tokens
+        self.probe = probe
+
+    @property
+    def base_url(self) -> str:
+        return self.replica.base_url
+
+
+def _hash(text: str) -> int:
+    return int.from_bytes(hashlib.md5(text.encode('utf-8')).digest()[:8], 'big')
+
+
+class ConsistentHashRing:
+    """一致性哈希环（每个副本放置若干虚拟节点，使会话分布更均匀）"""
+
+    def __init__(self, replicas: List[Replica], virtual_nodes: int = 100):
+        points = sorted(
+            (_hash(f"{replica.base_url}#{i}"), index)
+            for index, replica in enumerate(replicas)
+            for i in range(virtual_nodes)
+        )
+        self._hashes = [h for h, _ in points]
+        self._owners = [index for _, index in points]
+        self._replicas = replicas
+
+    def walk(self, key: str) -> List[Replica]:
+        """从 key 在环上的位置开始，按顺时针顺序返回各副本（不重复）"""
+        start = bisect.bisect(self._hashes, _hash(key))
+        order = []
+        seen = set()
+        for i in range(len(self._owners)):
+            index = self._owners[(start + i) % len(self._owners)]
+            if index not in seen:
+                seen.add(index)
+                order.append(self._replicas[index])
+                if len(order) == len(self._replicas):
+                    break
+        return order
+
+
+class ReplicaPool:
+    """
+    副本池：负责选择副本、记录成败、驱动熔断器与后台健康检查
+    """
+
+    def __init__(
+        self,
+        base_urls: List[str],
+        balance: Literal['requests', 'tokens'] = 'requests',
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        load_factor: float = 1.25
+    ):
+        """
+        Args:
+            base_urls: 各副本的服务地址
+            balance: 负载指标，'requests' 按在途请求数，'tokens' 按在途 token 数
+            failure_threshold: 连续失败多少次后打开熔断器
+            cooldown: 熔断器打开后的冷却时间（秒）
+            load_factor: 会话亲和路由时，单个副本的在途请求数最多为平均值的多少倍
+        """
+        if not base_urls:
+            raise ValueError("至少需要一个副本地址")
+        self.replicas = [Replica(url) for url in base_urls]
+        self.balance = balance
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.load_factor = load_factor
+        self.ring = ConsistentHashRing(self.replicas)
+        self.affinity_requests = 0      # 带 affinity_key 的请求数
+        self.affinity_hits = 0          # 其中落在哈希环首选副本上的请求数
+
+        self._rotation = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._health_thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self.replicas)
+
+    def _load(self, replica: Replica):
+        if self.balance == 'tokens':
+            return (replica.in_flight_tokens, replica.in_flight)
+        return (replica.in_flight, replica.in_flight_tokens)
+
+    def _available(self, replica: Replica, now: float) -> bool:
+        """
+        副本当前能否接收请求（调用方持有锁）
+        只做判断、不改变熔断器状态：冷却结束的副本在 acquire 真正选中时才转入 half_open
+        """
+        if not replica.healthy:
+            return False
+        if replica.state == 'open':
+            return now - replica.opened_at >= self.cooldown
+        # half_open 表示试探请求正在进行，只放行这一个
+        return replica.state == 'closed'
+
+    def _pick_affine(
+        self, key: str, available: List[Replica]
+    ) -> Tuple[Optional[Replica], bool]:
+        """
+        沿哈希环选择第一个可用且未过载的副本（调用方持有锁）
+
+        Returns:
+            (副本, 是否为哈希环上的首选副本)；全部过载时副本为 None
+        """
+        total = sum(r.in_flight for r in available) + 1
+        capacity = max(1, math.ceil(self.load_factor * total / len(available)))
+        usable = set(map(id, available))
+        for rank, replica in enumerate(self.ring.walk(key)):
+            if id(replica) in usable and replica.in_flight < capacity:
+                return replica, rank == 0
+        return None, False
+
+    def acquire(
+        self,
+        exclude: Collection[Replica] = (),
+        tokens: int = 0,
+        affinity_key: Optional[str] = None
+    ) -> Lease:
+        """
+        选择副本并计入在途
+        默认选负载最低的可用副本；给出 affinity_key 时优先选哈希环上的首选副本
+
+        Args:
+            exclude: 本次不考虑的副本（例如已经失败过的副本）
+            tokens: 本次请求的估计 token 数（balance='tokens' 时使用）
+            affinity_key: 会话亲和键（通常是会话稳定前缀的哈希）
+
+        Returns:
+            Lease（选中的副本；选中冷却结束的副本时为试探请求，probe=True）
+
+        Raises:
+            RuntimeError: exclude 排除了全部副本
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = [r for r in self.replicas if r not in exclude]
+            if not candidates:
+                raise RuntimeError("没有可用的 vLLM 副本（全部已尝试失败）")
+            available = [r for r in candidates if self._available(r, now)] or candidates
+
+            replica = None
+            if affinity_key is not None:
+                replica, primary = self._pick_affine(affinity_key, available)
+                self.affinity_requests += 1
+                self.affinity_hits += primary
+            if replica is None:
+                # 负载相同时轮转起点，避免顺序请求全部落到第一个副本
+                self._rotation = (self._rotation + 1) % len(available)
+                rotated = available[self._rotation:] + available[:self._rotation]
+                replica = min(rotated, key=self._load)
+            # 选中冷却结束的副本：这个请求就是试探请求（全部不可用时退化选中的 open 副本不算）
+            probe = replica.state == 'open' and self._available(replica, now)
+            if probe:
+                replica.state = 'half_open'
+            replica.in_flight += 1
+            replica.in_flight_tokens += tokens
+            replica.total_requests += 1
+            return Lease(replica, tokens, probe)
+
+    def release(self, lease: Lease, failed: bool = False, neutral: bool = False):
+        """
+        请求结束后归还副本，并更新熔断器
+
+        Args:
+            lease: acquire 的返回值
+            failed: 是否因副本故障失败（客户端参数错误等不应计入）
+            neutral: 请求结果不反映副本状态（客户端参数错误、被放弃的对冲请求、调用方中断），
+                只归还负载，不更新熔断器；试探请求以此结束时副本回到 open，下一个请求重新试探
+        """
+        replica = lease.replica
+        with self._lock:
+            replica.in_flight -= 1
+            replica.in_flight_tokens -= lease.tokens
+            if lease.probe and replica.state == 'half_open' and (neutral or not failed):
+                # 试探成功则关闭；没有结论时回到 open（opened_at 不变，冷却已结束）
+                replica.state = 'open' if neutral else 'closed'
+            if neutral:
+                return
+            if not failed:
+                replica.consecutive_failures = 0
+                return
+            replica.total_failures += 1
+            replica.consecutive_failures += 1
+            # 试探失败重新打开；打开之前发出的请求失败不延长冷却
+            if lease.probe or (replica.state == 'closed'
+                               and replica.consecutive_failures >= self.failure_threshold):
+                replica.state = 'open'
+                replica.opened_at = time.monotonic()
+
+    def mark_health(self, replica: Replica, healthy: bool):
+        """记录健康检查结果；恢复健康的副本同时重置熔断器"""
+        with self._lock:
+            if healthy and not replica.healthy:
+                replica.consecutive_failures = 0
+                replica.state = 'closed'
+            replica.healthy = healthy
+
+    def start_health_checks(self, probe: Callable[[str], bool], interval: float = 10.0):
+        """
+        启动后台健康检查线程
+
+        Args:
+            probe: 输入副本地址，返回是否健康（例如请求 /v1/models）
+            interval: 检查间隔（秒）
+        """
+        if self._health_thread is not None:
+            return
+        self._stop.clear()   # 之前 stop_health_checks 设置的停止标志
+
+        def loop():
+            while not self._stop.wait(interval):
+                for replica in self.replicas:
+                    try:
+                        healthy = probe(replica.base_url)
+                    except Exception:
+                        healthy = False
+                    self.mark_health(replica, healthy)
+
+        self._health_thread = threading.Thread(
+            target=loop, name="vllm-health-check", daemon=True
+        )
+        self._health_thread.start()
+
+    def stop_health_checks(self):
+        """停止后台健康检查"""
+        self._stop.set()
+        if self._health_thread is not None:
+            self._health_thread.join(timeout=1.0)
+            self._health_thread = None
+
+    def affinity_stats(self) -> Dict:
+        """会话亲和命中情况：命中指请求落在了会话在哈希环上的首选副本"""
+        with self._lock:
+            requests, hits = self.affinity_requests, self.affinity_hits
+        return {
+            'requests': requests,
+            'hits': hits,
+            'hit_rate': hits / requests if requests else 0.0,
+        }
+
+    def snapshot(self) -> List[Dict]:
+        """所有副本的当前状态"""
+        with self._lock:
+            return [r.snapshot() for r in self.replicas]
@@ -0,0 +1,220 @@
+"""
+确定性请求的响应缓存 - 内存 LRU + 磁盘持久层（sqlite）
+
+只有结果可复现的请求才会被缓存：temperature=0，或显式指定了 seed。
+缓存键是模型、消息与全部采样参数的规范化哈希（与是否流式无关），
+因此同一问题的流式 / 非流式调用共享缓存，流式调用命中时按片段回放。
+
+使用方法:
+    from response_cache import ResponseCache
+    from vllm_client import VLLMClient
+
+    cache = ResponseCache(max_entries=2048, ttl=24 * 3600, disk_path="chat_cache/responses.db")
+    client = VLLMClient(cache=cache)
+    client.chat("什么是高血压？", temperature=0)   # 第一次：请求服务端
+    client.chat("什么是高血压？", temperature=0)   # 第二次：直接命中缓存
+    print(cache.stats())
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+# 不影响生成结果的请求字段，不参与缓存键
+_NON_SEMANTIC_FIELDS = ('stream', 'stream_options')
+
+# 磁盘层每写入多少次检查一次容量（避免每次写入都 COUNT 全表）
+_TRIM_INTERVAL = 256
+
+
+def is_deterministic(payload: Dict) -> bool:
+    """请求结果是否可复现（temperature=0 或指定了 seed）"""
+    return payload.get('temperature') == 0 or payload.get('seed') is not None
+
+
+def make_cache_key(payload: Dict) -> str:
+    """
+    计算请求体的规范化哈希
+
+    Args:
+        payload: /v1/chat/completions 请求体（含 model、messages 与采样参数）
+
+    Returns:
+        sha256 十六进制字符串
+    """
+    canonical = {k: v for k, v in payload.items() if k not in _NON_SEMANTIC_FIELDS}
+    text = json.dumps(canonical, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def replay_stream(text: str, chunk_size: int = 16) -> Iterator[str]:
+    """把缓存的完整回复按片段产出，模拟流式输出"""
+    for i in range(0, len(text), chunk_size):
+        yield text[i:i + chunk_size]
+
+
+class ResponseCache:
+    """
+    两级响应缓存
+    第一级：内存 LRU，按条目数限制大小
+    第二级（可选）：sqlite 文件，重启后仍然有效，按最近访问时间淘汰
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: Optional[float] = None,
+        disk_path: Optional[str] = None,
+        max_disk_entries: int = 100_000
+    ):
+        """
+        Args:
+            max_entries: 内存中最多保留的条目数
+            ttl: 条目有效期（秒），None 表示永不过期
+            disk_path: sqlite 文件路径，None 表示只使用内存
+            max_disk_entries: 磁盘中最多保留的条目数（每 256 次写入检查一次）
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'evictions': 0,
+            'expired': 0,
+        }
+
+        self._db: Optional[sqlite3.Connection] = None
+        self._puts_since_trim = 0
+        if disk_path is not None:
+            Path(disk_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)"
+            )
+            self._db.commit()
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl is not None and now - created > self.ttl
+
+    def _remember(self, key: str, value: str, created: float):
+        """写入内存层并按 LRU 淘汰（调用方持有锁）"""
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._counters['evictions'] += 1
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        查询缓存
+
+        Returns:
+            缓存的回复；未命中或已过期时返回 None
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created = entry
+                if not self._expired(created, now):
+                    self._memory.move_to_end(key)
+                    self._counters['hits'] += 1
+                    self._counters['memory_hits'] += 1
+                    return value
+                del self._memory[key]
+                self._counters['expired'] += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, created = row
+                    if not self._expired(created, now):
+                        self._db.execute(
+                            "UPDATE responses SET accessed = ? WHERE key = ?", (now, key)
+                        )
+                        self._db.commit()
+                        self._remember(key, value, created)
+                        self._counters['hits'] += 1
+                        self._counters['disk_hits'] += 1
+                        return value
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._counters['expired'] += 1
+
+            self._counters['misses'] += 1
+            return None
+
+    def put(self, key: str, value: str):
+        """写入缓存（内存层与磁盘层）"""
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            self._puts_since_trim += 1
+            if self._puts_since_trim >= _TRIM_INTERVAL:
+                self._puts_since_trim = 0
+                self._trim_disk()
+            self._db.commit()
+
+    def _trim_disk(self):
+        """按最近访问时间淘汰超出容量的磁盘条目（调用方持有锁）"""
+        count = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        overflow = count - self.max_disk_entries
+        if overflow > 0:
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY accessed LIMIT ?)",
+                (overflow,)
+            )
+            self._counters['evictions'] += overflow
+
+    def clear(self):
+        """清空两级缓存（计数器保留）"""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self) -> Dict:
+        """命中 / 未命中等计数与当前条目数"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['memory_entries'] = len(self._memory)
+            if self._db is not None:
+                stats['disk_entries'] = self._db.execute(
+                    "SELECT COUNT(*) FROM responses"
+                ).fetchone()[0]
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def close(self):
+        """关闭磁盘层"""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
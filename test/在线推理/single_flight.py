@@ -0,0 +1,212 @@
+"""
+并发相同请求合并（single-flight）
+
+多个线程同时发出完全相同的请求时（热门问题、失败后重跑的任务），只向服务端发送一次，
+其余调用等待这一次的结果，不再各自占用一份 GPU 算力:
+    - 非流式：领头的调用执行请求，其余调用阻塞等待，拿到同一个结果（或同一个异常）
+    - 流式：上游只有一条流，收到的片段追加到共享缓冲区，每个消费者按自己的进度读取；
+      哪个消费者先需要下一个片段，就由它从上游读取（不额外起线程），
+      中途加入的消费者从第一个片段开始回放，全部消费者都提前退出时关闭上游连接
+只在请求进行期间合并，请求结束后相同的请求会重新发送（需要复用结果请配合 response_cache.py）。
+
+合并键由调用方给出；VLLMClient 使用与响应缓存相同的规范化哈希（模型、消息、全部采样参数），
+并且只合并结果可复现的请求（temperature=0 或指定 seed），否则多个调用方会拿到同一个采样结果。
+
+使用方法:
+    client = VLLMClient(single_flight=True)
+    # 多个线程同时调用 client.chat("什么是高血压？", temperature=0) 只会产生一次上游请求
+    print(client.single_flight.stats())
+
+    flights = SingleFlight()
+    result, shared = flights.do(key, lambda: expensive_call())
+"""
+
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+
+class _Call:
+    """进行中的非流式调用"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class _StreamFlight:
+    """进行中的流式调用：上游迭代器 + 已收到的片段"""
+
+    def __init__(self, upstream: Iterator[str], context: Any):
+        self.upstream = upstream
+        self.context = context
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.pumping = False            # 是否有消费者正在从上游读取
+        self.consumers = 0
+        self.cond = threading.Condition()
+
+
+class SingleFlight:
+    """
+    相同请求合并器（线程安全）
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _StreamFlight] = {}
+        self._counters = {
+            'calls': 0,             # 实际发出的非流式请求
+            'saved_calls': 0,       # 合并掉的非流式请求
+            'streams': 0,           # 实际发出的流式请求
+            'saved_streams': 0,     # 合并掉的流式请求
+        }
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        执行或加入一次非流式调用
+
+        Args:
+            key: 合并键
+            fn: 实际发送请求的函数（只有领头的调用会执行）
+
+        Returns:
+            (结果, 是否复用了其他调用的结果)
+
+        Raises:
+            fn 抛出的异常（所有等待者都会收到）
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            shared = call is not None
+            if shared:
+                self._counters['saved_calls'] += 1
+            else:
+                call = self._calls[key] = _Call()
+                self._counters['calls'] += 1
+
+        if shared:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+        return call.result, False
+
+    def stream(
+        self,
+        key: str,
+        open_stream: Callable[[], Tuple[Iterator[str], Any]]
+    ) -> Tuple[Iterator[str], Any, bool]:
+        """
+        发起或加入一次流式调用
+
+        Args:
+            key: 合并键
+            open_stream: 返回 (上游片段迭代器, 上下文) 的函数，只有领头的调用会执行；
+                上下文原样返回给每个消费者（例如随上游流一起填充的用量元数据）
+
+        Returns:
+            (本消费者的片段迭代器, 上下文, 是否加入了其他调用的流)
+        """
+        with self._lock:
+            flight = self._streams.get(key)
+            if flight is not None:
+                with flight.cond:
+                    # 已失败或已被放弃的流不再加入（正常结束的流可以完整回放）
+                    if flight.done and flight.error is not None:
+                        flight = None
+                    else:
+                        flight.consumers += 1
+            shared = flight is not None
+            if shared:
+                self._counters['saved_streams'] += 1
+            else:
+                # open_stream 只创建迭代器，真正的请求在第一次读取时发出
+                upstream, context = open_stream()
+                flight = self._streams[key] = _StreamFlight(upstream, context)
+                flight.consumers = 1
+                self._counters['streams'] += 1
+        return self._consume(key, flight), flight.context, shared
+
+    def _forget(self, key: str, flight: _StreamFlight):
+        """上游已结束：从进行中的流中移除，之后相同的请求重新发送"""
+        with self._lock:
+            if self._streams.get(key) is flight:
+                del self._streams[key]
+
+    def _consume(self, key: str, flight: _StreamFlight) -> Iterator[str]:
+        """单个消费者：从共享缓冲区读取，缓冲区读完时由自己从上游取下一个片段"""
+        index = 0
+        try:
+            while True:
+                with flight.cond:
+                    while index >= len(flight.chunks) and not flight.done and flight.pumping:
+                        flight.cond.wait()
+                    if index < len(flight.chunks):
+                        chunk = flight.chunks[index]
+                        index += 1
+                    elif flight.done:
+                        if flight.error is not None:
+                            raise flight.error
+                        return
+                    else:
+                        chunk = None
+                        flight.pumping = True
+
+                if chunk is not None:
+                    yield chunk
+                    continue
+
+                # 缓冲区已读完：由当前消费者从上游读取一个片段
+                finished = False
+                try:
+                    chunk = next(flight.upstream)
+                except StopIteration:
+                    finished = True
+                except BaseException as e:
+                    finished = True
+                    flight.error = e
+                finally:
+                    with flight.cond:
+                        if finished:
+                            flight.done = True
+                        else:
+                            flight.chunks.append(chunk)
+                        flight.pumping = False
+                        flight.cond.notify_all()
+                if finished:
+                    self._forget(key, flight)
+        finally:
+            with flight.cond:
+                flight.consumers -= 1
+                abandoned = flight.consumers == 0 and not flight.done
+                if abandoned:
+                    flight.done = True
+                    flight.error = RuntimeError("所有消费者都已退出，上游流已关闭")
+            if abandoned:
+                self._forget(key, flight)
+                flight.upstream.close()
+
+    def in_flight(self) -> int:
+        """当前进行中的（合并后的）请求数"""
+        with self._lock:
+            return len(self._calls) + len(self._streams)
+
+    def stats(self) -> Dict[str, int]:
+        """计数：实际请求数、合并掉的请求数（即节省的上游调用）"""
+        with self._lock:
+            stats = dict(self._counters)
+        stats['saved'] = stats['saved_calls'] + stats['saved_streams']
+        return stats
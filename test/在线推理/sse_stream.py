@@ -0,0 +1,176 @@
+"""
+轻量 Server-Sent-Events 解析器 - 用于 /v1/chat/completions 流式响应
+
+OpenAI SDK 会把每个 chunk 反序列化成 pydantic 对象，并发流较多时每个 token
+都要付出可观的 CPU 开销。这里只解析真正需要的两样东西：
+    - choices[0].delta.content：定位字段后用 json.decoder.scanstring 只解码这一个字符串
+      （压测统计 TTFT 时还会用同样的方法取 delta 中的思考过程）
+    - 最后一个 chunk 中的 usage（以及 finish_reason）
+
+使用方法:
+    response = requests.post(url, json=data, stream=True)
+    stream = SSEChatStream(response.iter_lines(), close=response.close)
+    for text in stream:
+        print(text, end="", flush=True)
+    print(stream.usage, stream.finish_reason)
+
+    # 异步（httpx）：逐个 data 交给 SSEChatParser
+    parser = SSEChatParser()
+    async for data in aiter_sse_data(response.aiter_lines()):
+        text = parser.feed(data)
+        if parser.done:
+            break
+"""
+
+import json
+import re
+from typing import AsyncIterable, AsyncIterator, Callable, Dict, Iterable, Iterator, Optional, Union
+
+# delta 中的 "content" 字段（前面必须是 { 或 ,，避免误匹配 "reasoning_content"）
+_CONTENT_RE = re.compile(r'[{,]\s*"content"\s*:\s*')
+# 推理解析器输出的思考过程（vLLM 旧版本为 reasoning_content，新版本为 reasoning）
+_REASONING_RE = re.compile(r'"reasoning(?:_content)?"\s*:\s*')
+_FINISH_RE = re.compile(r'"finish_reason"\s*:\s*"([^"]*)"')
+_USAGE_RE = re.compile(r'"usage"\s*:\s*\{')
+_scanstring = json.decoder.scanstring
+
+
+def iter_sse_data(lines: Iterable[Union[bytes, str]]) -> Iterator[str]:
+    """
+    从 SSE 行流中提取 data 字段
+
+    Args:
+        lines: 按行切分的响应体（requests 的 iter_lines / httpx 的 iter_lines）
+
+    Yields:
+        每个事件 "data:" 之后的内容（已去掉前导空白）
+    """
+    for line in lines:
+        data = _sse_data(line)
+        if data is not None:
+            yield data
+
+
+async def aiter_sse_data(lines: AsyncIterable[Union[bytes, str]]) -> AsyncIterator[str]:
+    """iter_sse_data 的异步版本（httpx 的 aiter_lines）"""
+    async for line in lines:
+        data = _sse_data(line)
+        if data is not None:
+            yield data
+
+
+def _sse_data(line: Union[bytes, str]) -> Optional[str]:
+    """一行中 "data:" 之后的内容；不是 data 行时返回 None"""
+    if not line:
+        return None
+    if isinstance(line, bytes):
+        line = line.decode('utf-8')
+    if line.startswith('data:'):
+        return line[5:].lstrip()
+    return None
+
+
+def extract_delta_content(data: str) -> Optional[str]:
+    """
+    从单个 chunk 的 JSON 文本中取出 choices[0].delta.content
+
+    Returns:
+        文本片段；没有 content 或值为 null 时返回 None
+    """
+    return _extract_delta_field(data, _CONTENT_RE)
+
+
+def extract_delta_reasoning(data: str) -> Optional[str]:
+    """
+    从单个 chunk 的 JSON 文本中取出 choices[0].delta 的思考过程（reasoning_content / reasoning）
+
+    Returns:
+        文本片段；没有该字段或值为 null 时返回 None
+    """
+    return _extract_delta_field(data, _REASONING_RE)
+
+
+def _extract_delta_field(data: str, pattern: re.Pattern) -> Optional[str]:
+    start = data.find('"delta"')
+    if start < 0:
+        return None
+    match = pattern.search(data, start)
+    if match is None:
+        return None
+    end = match.end()
+    if data.startswith('"', end):
+        return _scanstring(data, end + 1)[0]
+    return None
+
+
+class SSEChatParser:
+    """
+    逐个处理流式响应的 data 字段，记录 usage 与 finish_reason
+    SSEChatStream（同步）与 AsyncVLLMClient（异步）共用
+    """
+
+    def __init__(self):
+        self.usage: Optional[Dict] = None
+        self.finish_reason: Optional[str] = None
+        self.done = False               # 是否已收到 [DONE]
+
+    def feed(self, data: str) -> Optional[str]:
+        """
+        处理一个事件的 data 字段
+
+        Returns:
+            文本片段；没有文本时返回 None（收到 [DONE] 时同时把 done 置为 True）
+
+        Raises:
+            RuntimeError: 服务端在流中返回了错误
+        """
+        if data == '[DONE]':
+            self.done = True
+            return None
+        if data.startswith('{"error"'):
+            raise RuntimeError(f"流式响应出错: {json.loads(data)['error']}")
+
+        content = extract_delta_content(data)
+        # 普通 token chunk 不带 finish_reason / usage，跳过后续检查
+        if content and '"finish_reason":null' in data:
+            return content
+
+        finish = _FINISH_RE.search(data)
+        if finish:
+            self.finish_reason = finish.group(1)
+        if _USAGE_RE.search(data):
+            self.usage = json.loads(data)['usage']
+        return content or None
+
+
+class SSEChatStream(SSEChatParser):
+    """
+    流式对话响应的迭代器
+    逐个产出文本片段；迭代结束后可读取 usage 与 finish_reason
+    """
+
+    def __init__(
+        self,
+        lines: Iterable[Union[bytes, str]],
+        close: Optional[Callable[[], None]] = None
+    ):
+        """
+        Args:
+            lines: 按行切分的 SSE 响应体
+            close: 迭代结束（或提前中断）时调用，用于释放底层连接
+        """
+        super().__init__()
+        self._lines = lines
+        self._close = close
+
+    def __iter__(self) -> Iterator[str]:
+        try:
+            for data in iter_sse_data(self._lines):
+                content = self.feed(data)
+                if self.done:
+                    break
+                if content:
+                    yield content
+        finally:
+            if self._close is not None:
+                self._close()
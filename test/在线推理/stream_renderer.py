@@ -0,0 +1,238 @@
+"""
+流式输出渲染器 - 合并写终端 + 实时状态行
+
+逐 token 执行 print(chunk, flush=True) 意味着每个 token 一次系统调用，
+在 tmux 等终端复用器里大量 flush 会明显拖慢客户端；用 += 拼接回复在长回答上是二次复杂度。
+渲染器位于 chat_stream_with_history 与终端之间：
+
+    - 文本片段先放入缓冲区，按帧率（默认 20 帧/秒）合并为一次写入
+    - 完整回复由片段列表一次 join 得到
+    - 终端为 TTY 时，在当前文本之后显示一段状态：首 token 延迟（TTFT）、tokens/s、已用时间；
+      状态只在当前行剩余宽度内显示，不会换行，下一帧写入前擦除
+    - 输出被重定向到文件或管道时只做合并写入，不输出控制字符
+    - 推理模型的 <think> 思考过程与回答分开显示（见 reasoning.py）：
+      show 以暗色显示思考过程，collapse 思考时只在状态中显示进度、结束后折叠为一行，
+      hide 完全不显示；render 只返回回答，思考过程保存在 .reasoning
+
+使用方法:
+    renderer = StreamRenderer(reasoning='collapse')
+    answer = renderer.render(client.chat_stream_with_history(messages))
+    print(renderer.stats, len(renderer.reasoning))
+"""
+
+import re
+import shutil
+import sys
+import time
+import unicodedata
+from typing import Dict, Iterable, Optional, TextIO
+
+from reasoning import REASONING, ThinkSplitter
+
+# ANSI 控制序列
+_SAVE_CURSOR = "\0337"
+_RESTORE_CURSOR = "\0338"
+_ERASE_TO_END = "\033[J"
+_DIM = "\033[2m"
+_RESET = "\033[0m"
+_ANSI_RE = re.compile(r'\033(\[[0-9;]*[A-Za-z]|[78])')
+
+# 思考过程的显示方式
+REASONING_MODES = ('show', 'collapse', 'hide')
+
+
+def _char_width(ch: str) -> int:
+    """字符在终端中占的列数（中文等全角字符占 2 列）"""
+    if unicodedata.combining(ch):
+        return 0
+    return 2 if unicodedata.east_asian_width(ch) in ('W', 'F') else 1
+
+
+class StreamRenderer:
+    """
+    流式文本渲染器
+    """
+
+    def __init__(
+        self,
+        out: Optional[TextIO] = None,
+        fps: float = 20.0,
+        show_status: Optional[bool] = None,
+        reasoning: str = 'show',
+        start_in_reasoning: bool = False
+    ):
+        """
+        Args:
+            out: 输出流，默认 sys.stdout
+            fps: 每秒最多写入终端的次数
+            show_status: 是否显示实时状态，None 表示仅在输出为 TTY 时显示
+            reasoning: 思考过程的显示方式 'show' / 'collapse' / 'hide'
+            start_in_reasoning: 输出是否从思考过程开始（提示词末尾已强制加入 <think>）
+        """
+        if reasoning not in REASONING_MODES:
+            raise ValueError(f"reasoning 必须是 {REASONING_MODES} 之一: {reasoning}")
+        self.out = out or sys.stdout
+        self.interval = 1.0 / fps
+        self.is_tty = hasattr(self.out, 'isatty') and self.out.isatty()
+        if show_status is None:
+            show_status = self.is_tty
+        self.show_status = show_status
+        self.reasoning_mode = reasoning
+        self.start_in_reasoning = start_in_reasoning
+        self.stats: Dict[str, float] = {}
+        self.reasoning = ''             # 最近一次渲染的思考过程
+
+        self._column = 0
+        self._status_shown = False
+
+    def _advance(self, text: str, width: int):
+        """根据写出的文本更新光标所在列（忽略颜色等控制序列）"""
+        for ch in _ANSI_RE.sub('', text):
+            if ch == '\n' or ch == '\r':
+                self._column = 0
+            else:
+                self._column += _char_width(ch)
+                if self._column >= width:
+                    self._column %= width
+
+    def _status_text(
+        self,
+        start: float,
+        first: Optional[float],
+        tokens: int,
+        now: float,
+        thinking: int = 0
+    ) -> str:
+        if first is None:
+            return "⏳ 等待首个 token…"
+        if thinking:
+            return f"💭 思考中… {thinking} 字 · {now - start:.1f}s"
+        decode = now - first
+        rate = (tokens - 1) / decode if tokens > 1 and decode > 0 else 0.0
+        return f"TTFT {first - start:.2f}s · {rate:.1f} tok/s · {now - start:.1f}s"
+
+    def _frame(self, pending: str, status: str):
+        """写出一帧：擦除上一帧的状态，写入新文本，再在当前行剩余宽度内画状态"""
+        if not self.show_status:
+            if pending:
+                self.out.write(pending)
+                self.out.flush()
+            return
+
+        width = shutil.get_terminal_size().columns
+        parts = []
+        if self._status_shown:
+            parts.append(_ERASE_TO_END)
+        parts.append(pending)
+        self._advance(pending, width)
+
+        room = width - self._column - 3
+        # 状态多为 CJK 与 emoji（双宽），按显示宽度判断，避免换行后恢复光标时擦错行
+        status = status if sum(_char_width(ch) for ch in status) + 2 <= room else ''
+        if status:
+            parts.append(f"{_SAVE_CURSOR}  {_DIM}{status}{_RESET}{_RESTORE_CURSOR}")
+        self._status_shown = bool(status)
+        self.out.write(''.join(parts))
+        self.out.flush()
+
+    def _style(self, code: str) -> str:
+        """颜色控制序列，输出不是 TTY 时为空"""
+        return code if self.is_tty else ''
+
+    def render(self, chunks: Iterable[str]) -> str:
+        """
+        消费流式片段并渲染到终端
+
+        Args:
+            chunks: 文本片段迭代器（例如 chat_stream_with_history 的返回值）
+
+        Returns:
+            回复文本，不含思考过程（被 Ctrl+C 中断时，已收到的部分会先写出再抛出 KeyboardInterrupt）
+        """
+        start = time.perf_counter()
+        first: Optional[float] = None
+        tokens = 0
+        pending = []
+        last_frame = start
+        splitter = ThinkSplitter(self.start_in_reasoning)
+        thinking = 0                    # 已收到的思考过程字数
+        thinking_end = start
+        reasoning_open = False          # 思考过程已开始、尚未结束
+        trailing = ''                   # show 模式下暂缓写出的思考过程末尾空白
+        self.reasoning = ''
+        self._column = 0
+        self._status_shown = False
+        self._frame('', self._status_text(start, None, 0, start))
+
+        def end_reasoning(finished: bool):
+            """思考过程结束（或流提前结束）时收尾"""
+            nonlocal reasoning_open, trailing
+            trailing = ''
+            if self.reasoning_mode == 'show':
+                pending.append(self._style(_RESET) + ('\n\n' if finished else '\n'))
+            elif self.reasoning_mode == 'collapse':
+                state = "已折叠思考过程" if finished else "思考过程未结束"
+                took = thinking_end - (first or start)
+                line = f"💭 {state}（{len(splitter.reasoning)} 字，{took:.1f}s）"
+                pending.append(self._style(_DIM) + line + self._style(_RESET)
+                               + ('\n\n' if finished else '\n'))
+            reasoning_open = False
+
+        def write(events):
+            nonlocal thinking, thinking_end, reasoning_open, trailing
+            for channel, text in events:
+                if channel == REASONING:
+                    thinking += len(text)
+                    thinking_end = time.perf_counter()
+                    if self.reasoning_mode == 'show':
+                        if not reasoning_open:
+                            pending.append(self._style(_DIM) + "💭 ")
+                        body = (trailing + text).rstrip()
+                        trailing = (trailing + text)[len(body):]
+                        pending.append(body)
+                    reasoning_open = True
+                    continue
+                if reasoning_open:
+                    end_reasoning(finished=True)
+                pending.append(text)
+
+        try:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                now = time.perf_counter()
+                if first is None:
+                    first = now
+                tokens += 1
+                write(splitter.feed(chunk))
+                if now - last_frame >= self.interval:
+                    collapsed = self.reasoning_mode == 'collapse' and splitter.in_reasoning
+                    status = self._status_text(start, first, tokens, now, thinking if collapsed else 0)
+                    self._frame(''.join(pending), status)
+                    pending.clear()
+                    last_frame = now
+        finally:
+            end = time.perf_counter()
+            write(splitter.flush())
+            if reasoning_open:
+                end_reasoning(finished=False)
+            # 写出剩余文本并擦除状态
+            self._frame(''.join(pending), '')
+            self.reasoning = splitter.reasoning
+            decode = end - first if first is not None else 0.0
+            self.stats = {
+                'ttft': first - start if first is not None else None,
+                'tokens': tokens,
+                'elapsed': end - start,
+                'tokens_per_s': (tokens - 1) / decode if tokens > 1 and decode > 0 else 0.0,
+                'reasoning_chars': len(self.reasoning),
+            }
+
+        return splitter.answer
+
+    def summary(self) -> str:
+        """最近一次渲染的统计摘要（一行）"""
+        if not self.stats or self.stats['ttft'] is None:
+            return ''
+        return (f"TTFT {self.stats['ttft']:.2f}s · {self.stats['tokens_per_s']:.1f} tok/s · "
+                f"{self.stats['tokens']} tokens · {self.stats['elapsed']:.1f}s")
@@ -0,0 +1,176 @@
+"""
+请求轨迹记录 - 记录真实流量的形状，供 replay_trace.py 开环回放
+
+闭环压测（固定并发、一个请求完成再发下一个）无法复现真实流量的突发。
+VLLMClient(trace=TraceRecorder(...)) 为每次调用追加一行 JSON（JSONL）：
+
+    t               到达时间（Unix 时间戳，流式调用为开始迭代的时间）
+    prompt_tokens   输入 token 数（服务端 usage；请求失败时按字符估计，此时 estimated=true）
+    max_tokens      请求的最大生成 token 数
+    output_tokens   实际生成的 token 数
+    sampling        采样参数（temperature、top_p、seed 等）
+    stream / ttft / latency / finish_reason / cached_tokens / error
+    from_cache / shared   由客户端响应缓存返回、与相同请求合并（这两类没有到达服务端）
+    session         会话前缀（system + 第一条对话消息）的短哈希：同一会话的各轮相同
+    messages        完整消息，仅在 redact=False 时记录
+
+默认脱敏（redact=True）：不记录任何文本内容，只有长度与会话哈希。
+回放时按会话哈希生成确定的合成文本，同一会话的后续轮次与前一轮共享前缀，
+服务端的前缀缓存命中情况与真实流量接近。
+
+使用方法:
+    with TraceRecorder("traces/prod.jsonl") as trace:
+        client = VLLMClient(trace=trace)
+        client.chat("你好")
+
+    entries = load_trace("traces/prod.jsonl")
+    print(len(entries), entries[0].prompt_tokens, entries[0].sampling)
+"""
+
+import hashlib
+import json
+import threading
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from chat_result import ChatMeta
+from context_budget import MESSAGE_OVERHEAD, REPLY_PRIMING, estimate_tokens
+
+# 请求体中不属于采样参数的字段
+_NON_SAMPLING_KEYS = frozenset({'model', 'messages', 'max_tokens', 'stream', 'stream_options'})
+
+
+def session_hash(messages: List[Dict[str, str]]) -> str:
+    """会话前缀（system 消息 + 第一条对话消息）的短哈希，同一会话的各轮相同"""
+    prefix = [m for m in messages if m.get('role') == 'system']
+    prefix += [m for m in messages if m.get('role') != 'system'][:1]
+    data = json.dumps(prefix, ensure_ascii=False, sort_keys=True).encode('utf-8')
+    return hashlib.sha1(data).hexdigest()[:12]
+
+
+def estimate_prompt_tokens(messages: List[Dict[str, str]]) -> int:
+    """按字符估计 prompt 的 token 数（含 chat 模板开销），没有服务端 usage 时使用"""
+    return sum(estimate_tokens(m.get('content') or '') + MESSAGE_OVERHEAD for m in messages) + REPLY_PRIMING
+
+
+@dataclass
+class TraceEntry:
+    """一次调用的记录"""
+    t: float                                    # 到达时间（Unix 时间戳）
+    prompt_tokens: int = 0
+    max_tokens: Optional[int] = None
+    output_tokens: int = 0
+    sampling: Dict[str, Any] = field(default_factory=dict)
+    stream: bool = False
+    ttft: Optional[float] = None
+    latency: Optional[float] = None
+    finish_reason: Optional[str] = None
+    cached_tokens: int = 0
+    error: Optional[str] = None
+    from_cache: bool = False
+    shared: bool = False
+    estimated: bool = False                     # prompt_tokens 为估计值
+    session: Optional[str] = None
+    messages: Optional[List[Dict[str, str]]] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化为紧凑的字典（省略空值与默认的 False / 0）"""
+        return {k: v for k, v in asdict(self).items() if v not in (None, False, {}) or k == 't'}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'TraceEntry':
+        known = cls.__dataclass_fields__
+        return cls(**{k: v for k, v in data.items() if k in known})
+
+
+class TraceRecorder:
+    """
+    把每次调用追加写入 JSONL 文件（线程安全，每行写完即刷新）
+    """
+
+    def __init__(self, path: Union[str, Path], redact: bool = True):
+        """
+        Args:
+            path: 轨迹文件路径（追加写入，目录不存在时自动创建）
+            redact: 是否省略消息内容；False 时记录完整 messages，回放可以重发原始请求
+        """
+        self.path = Path(path)
+        self.redact = redact
+        self.count = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'a', encoding='utf-8', buffering=1)
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        payload: Dict,
+        meta: ChatMeta,
+        arrival: float,
+        ttft: Optional[float] = None,
+        latency: Optional[float] = None,
+        error: Optional[BaseException] = None
+    ):
+        """
+        记录一次调用
+
+        Args:
+            payload: 请求体（/v1/chat/completions 的 JSON）
+            meta: 调用结束时的元数据
+            arrival: 到达时间（time.time()）
+            ttft: 首个片段的延迟（秒），非流式为 None
+            latency: 总耗时（秒）
+            error: 调用失败时的异常
+        """
+        messages = payload.get('messages') or []
+        entry = TraceEntry(
+            t=round(arrival, 4),
+            prompt_tokens=meta.prompt_tokens,
+            max_tokens=payload.get('max_tokens'),
+            output_tokens=meta.completion_tokens or meta.chunks,
+            sampling={k: v for k, v in payload.items() if k not in _NON_SAMPLING_KEYS},
+            stream=bool(payload.get('stream')),
+            ttft=round(ttft, 4) if ttft is not None else None,
+            latency=round(latency, 4) if latency is not None else None,
+            finish_reason=meta.finish_reason,
+            cached_tokens=meta.cached_tokens,
+            error=type(error).__name__ if error is not None else None,
+            from_cache=meta.from_cache,
+            shared=meta.shared,
+            session=session_hash(messages),
+            messages=None if self.redact else messages,
+        )
+        if not entry.prompt_tokens:
+            entry.prompt_tokens = estimate_prompt_tokens(messages)
+            entry.estimated = True
+        line = json.dumps(entry.to_dict(), ensure_ascii=False, separators=(',', ':'))
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(line + '\n')
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def load_trace(path: Union[str, Path]) -> List[TraceEntry]:
+    """读取轨迹文件，按到达时间排序（跳过写到一半的末行）"""
+    entries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                entries.append(TraceEntry.from_dict(json.loads(line)))
+            except (ValueError, TypeError):
+                continue
+    entries.sort(key=lambda e: e.t)
+    return entries
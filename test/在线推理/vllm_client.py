@@ -8,20 +8,104 @@ vLLM 客户端封装 - 支持 SSH 隧道环境
     client = VLLMClient(backend='requests')
     response = client.chat("你好")
     
-    # 方式2: OpenAI 后端（支持流式输出）
+    # 方式2: OpenAI 后端
     client = VLLMClient(backend='openai')
+
+    # 流式输出（两种后端均支持，requests 后端使用轻量 SSE 解析，CPU 开销更低）
     for chunk in client.chat_stream("讲个故事"):
         print(chunk, end="", flush=True)
 
+    # 方式3: 长连接池（两种后端均支持，省去每次请求经隧道重新握手）
+    client = VLLMClient(backend='requests', keep_alive=True)
+    
+    # 方式4: 多副本（按在途请求数负载均衡，故障副本自动摘除并换副本重试）
+    client = VLLMClient(base_url=["http://localhost:9000", "http://localhost:9001"])
+    
+    # 方式5: 多副本 + 会话亲和（同一会话固定到同一副本，复用该副本上的前缀缓存）
+    client = VLLMClient(base_url=[...], routing='affinity')
+
+    # 方式6: 客户端指标（延迟 / TTFT / token 间隔直方图等），可在本地 /metrics 暴露给 Prometheus
+    registry = MetricsRegistry()
+    client = VLLMClient(metrics=registry)
+    registry.serve(port=9400)
+
+    # 方式7: 合并同时发出的相同请求（只合并 temperature=0 或指定 seed 的请求，流式同样适用）
+    client = VLLMClient(single_flight=True)
+    print(client.single_flight.stats())          # saved 为节省的上游调用数
+
+    # 方式8: 截止时间 + 对冲请求 + 退避重试（重试与对冲共用全局预算，见 hedging.py）
+    client = VLLMClient(base_url=[...], hedge=HedgePolicy(percentile=95), deadline=30.0)
+    client.chat("你好", deadline=5.0)
+
+    # 方式9: 自适应并发（按 TTFT / 排队与服务端 KV cache 压力自动调整批量并发数，见 concurrency_limiter.py）
+    limiter = AdaptiveLimiter(initial=8, max_limit=256)
+    results = client.chat_batch(batch, limiter=limiter)
+    print(limiter.limit, limiter.history())
+
+    # 方式10: 记录请求轨迹（到达时间、token 长度、采样参数，默认不含内容），用 replay_trace.py 开环回放
+    client = VLLMClient(trace=TraceRecorder("traces/prod.jsonl"))
+
+    # 用量与时延：返回值带 .meta（token 数、finish_reason、TTFT、耗时、tokens/s）
+    response = client.chat("你好")
+    print(response.meta.completion_tokens, response.meta.latency)
+
+    # 推理模型：拆分 <think> 思考过程与回答（流式用 ThinkSplitter 逐片段拆分，见 reasoning.py）
+    from reasoning import split_reasoning
+    reasoning, answer = split_reasoning(client.chat("9.11 和 9.9 哪个大？"))
+
 作者: AI Assistant & 用户实践总结
 日期: 2025-10-05
 """
 
-import requests
-from openai import OpenAI
-import httpx
-from typing import List, Dict, Iterator, Optional, Literal
+# requests / openai / httpx 只在用到对应后端时导入（见 __init__），未使用的后端不增加启动时间
+from typing import Callable, List, Dict, Iterable, Iterator, Optional, Literal, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
 import json
+import socket
+import sys
+import threading
+import time
+
+from chat_result import ChatMeta, ChatResult, ChatStream
+from concurrency_limiter import AdaptiveLimiter, is_overload, latency_signal
+from hedging import Deadline, DeadlineExceeded, HedgePolicy, RetryBudget, RetryPolicy
+from metrics import NULL_RECORDER, ClientMetrics, MetricsRegistry
+from replica_pool import Lease, Replica, ReplicaPool
+from response_cache import ResponseCache, is_deterministic, make_cache_key, replay_stream
+from single_flight import SingleFlight
+from sse_stream import SSEChatStream
+from traffic_trace import TraceRecorder
+
+
+@dataclass
+class BatchResult:
+    """chat_batch 的单条结果"""
+    index: int                          # 在输入列表中的位置
+    response: Optional[ChatResult] = None   # 模型回复（失败时为 None）
+    error: Optional[Exception] = None   # 该条请求的异常（成功时为 None）
+    
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _is_replica_failure(error: Exception) -> bool:
+    """错误是否由副本本身引起（连接失败、超时、5xx / 429），这类错误可以换副本重试"""
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None) or getattr(error, 'status_code', None)
+    if status is not None:
+        return status >= 500 or status == 429
+    # 只检查已导入的后端模块：没有导入的模块不可能抛出这个异常
+    transport_errors = []
+    if 'requests' in sys.modules:
+        requests = sys.modules['requests']
+        transport_errors += [requests.ConnectionError, requests.Timeout]
+    if 'httpx' in sys.modules:
+        transport_errors.append(sys.modules['httpx'].TransportError)
+    if 'openai' in sys.modules:
+        transport_errors.append(sys.modules['openai'].APIConnectionError)
+    return isinstance(error, tuple(transport_errors))
 
 
 class VLLMClient:
@@ -32,56 +116,132 @@ class VLLMClient:
     
     def __init__(
         self,
-        base_url: str = "http://localhost:9000",
+        base_url: Union[str, List[str]] = "http://localhost:9000",
         api_key: str = "muyu",
         # model: str = "Qwen3-4B",
         model: str = "Medical_Qwen3_8B_Large_Language_Model",
         backend: Literal['requests', 'openai'] = 'requests',
-        timeout: float = 120.0
+        timeout: float = 120.0,
+        keep_alive: bool = False,
+        max_idle: float = 15.0,
+        pool_size: int = 100,
+        cache: Optional[ResponseCache] = None,
+        balance: Literal['requests', 'tokens'] = 'requests',
+        health_check_interval: float = 10.0,
+        routing: Literal['least_loaded', 'affinity'] = 'least_loaded',
+        affinity_turns: int = 1,
+        metrics: Optional[MetricsRegistry] = None,
+        single_flight: bool = False,
+        deadline: Optional[float] = None,
+        hedge: Optional[HedgePolicy] = None,
+        retry: Optional[RetryPolicy] = None,
+        retry_budget: Optional[RetryBudget] = None,
+        trace: Optional[TraceRecorder] = None
     ):
         """
         初始化客户端
         
         Args:
-            base_url: vLLM API 服务地址
+            base_url: vLLM API 服务地址；传入列表时在多个副本间负载均衡
             api_key: API 密钥
             model: 模型名称
             backend: 后端实现 ('requests' 或 'openai')
             timeout: 请求超时时间（秒）
+            keep_alive: 是否启用隧道安全的长连接池（见 connection_pool.py）
+            max_idle: 长连接最长空闲时间（秒），超过后重新建立连接
+            pool_size: 长连接池大小
+            cache: 响应缓存（见 response_cache.py），只缓存 temperature=0 或指定 seed 的请求
+            balance: 多副本负载指标，'requests' 按在途请求数，'tokens' 按在途 token 数
+            health_check_interval: 多副本时后台健康检查（/v1/models）的间隔（秒）
+            routing: 多副本路由方式，'least_loaded' 选负载最低的副本，
+                'affinity' 按会话稳定前缀一致性哈希到固定副本（过载或故障时顺延）
+            affinity_turns: 会话稳定前缀包含的最早几条非 system 消息
+            metrics: 指标注册表（见 metrics.py），传入后记录请求耗时、TTFT、token 间隔等
+            single_flight: 是否合并同时进行的相同请求（见 single_flight.py），
+                只对结果可复现的请求生效（temperature=0 或指定 seed）
+            deadline: 每次调用的默认截止时间（秒），None 表示只受 timeout 限制；
+                单次调用可用 deadline= 参数覆盖
+            hedge: 对冲策略（见 hedging.py），超过最近 TTFT 的分位数仍未收到首个 token 时
+                向另一个副本再发一份请求；启用后非流式调用也按流式请求发送
+            retry: 首个 token 之前出错时的重试策略，默认最多重试 2 次
+            retry_budget: 重试与对冲共用的全局预算，多个客户端可以共用同一个预算
+            trace: 请求轨迹记录器（见 traffic_trace.py），每次调用追加一条记录（由调用方关闭）
         
         Example:
             >>> client = VLLMClient(backend='requests')
             >>> client = VLLMClient(backend='openai')
+            >>> client = VLLMClient(backend='openai', keep_alive=True)
+            >>> client = VLLMClient(base_url=["http://localhost:9000", "http://localhost:9001"])
         """
-        self.base_url = base_url.rstrip('/')
+        base_urls = [base_url] if isinstance(base_url, str) else list(base_url)
+        self.replicas = ReplicaPool(base_urls, balance=balance)
+        self.base_url = self.replicas.replicas[0].base_url
         self.api_key = api_key
         self.model = model
         self.backend = backend
         self.timeout = timeout
+        self.keep_alive = keep_alive
+        self.cache = cache
+        self.routing = routing
+        self.affinity_turns = affinity_turns
+        self.metrics = ClientMetrics(metrics, model) if metrics is not None else None
+        self.single_flight = SingleFlight() if single_flight else None
+        self.deadline = deadline
+        self.hedge = hedge
+        self.retry = retry or RetryPolicy()
+        self.retry_budget = retry_budget or RetryBudget()
+        self.trace = trace
+        self._hedge_pool: Optional[ThreadPoolExecutor] = None
+        self._pool_size = pool_size
         
         if backend == 'openai':
             # OpenAI SDK 后端（需要特殊配置以支持 SSH 隧道）
-            # 关键：四项配置缺一不可！
-            http_client = httpx.Client(
-                timeout=timeout,
-                limits=httpx.Limits(
-                    max_keepalive_connections=0,  # 不保持长连接
-                    max_connections=100,           # 最大连接数
-                    keepalive_expiry=0             # 连接立即过期
-                ),
-                transport=httpx.HTTPTransport(retries=0)  # 禁用重试
-            )
-            self._openai_client = OpenAI(
-                base_url=f"{base_url}/v1",
-                api_key=api_key,
-                http_client=http_client
-            )
+            import httpx
+            from openai import OpenAI
+            if keep_alive:
+                from connection_pool_httpx import TunnelSafeTransport
+                # 长连接模式：空闲超时 + 存活探测 + 一次性重连，见 connection_pool.py
+                http_client = httpx.Client(
+                    timeout=timeout,
+                    transport=TunnelSafeTransport(max_idle=max_idle, pool_size=pool_size)
+                )
+            else:
+                # 关键：四项配置缺一不可！
+                http_client = httpx.Client(
+                    timeout=timeout,
+                    limits=httpx.Limits(
+                        max_keepalive_connections=0,  # 不保持长连接
+                        max_connections=100,           # 最大连接数
+                        keepalive_expiry=0             # 连接立即过期
+                    ),
+                    transport=httpx.HTTPTransport(retries=0)  # 禁用重试
+                )
+            # 每个副本一个 OpenAI 客户端，共享同一个连接池
+            self._openai_clients = {
+                replica.base_url: OpenAI(
+                    base_url=f"{replica.base_url}/v1",
+                    api_key=api_key,
+                    http_client=http_client
+                )
+                for replica in self.replicas.replicas
+            }
+            self._openai_client = self._openai_clients[self.base_url]
         else:
             # requests 后端（默认，最稳定）
             self._headers = {
                 "Content-Type": "application/json",
                 "Authorization": f"Bearer {api_key}"
             }
+            # 长连接模式复用 Session 中的连接；否则每次请求新建连接
+            if keep_alive:
+                from connection_pool_requests import TunnelSafeSession
+                self._http = TunnelSafeSession(max_idle=max_idle, pool_size=pool_size)
+            else:
+                import requests
+                self._http = requests
+        
+        if len(self.replicas) > 1:
+            self.replicas.start_health_checks(self._probe, interval=health_check_interval)
     
     def chat(
         self,
@@ -90,7 +250,7 @@ class VLLMClient:
         temperature: float = 0.7,
         top_p: float = 0.95,
         **kwargs
-    ) -> str:
+    ) -> ChatResult:
         """
         简单对话接口
         
@@ -102,12 +262,13 @@ class VLLMClient:
             **kwargs: 其他API参数
         
         Returns:
-            模型回复内容
+            模型回复内容（str 子类，.meta 为本次调用的用量与时延）
         
         Example:
             >>> client = VLLMClient()
             >>> response = client.chat("你好，请介绍一下你自己")
             >>> print(response)
+            >>> print(response.meta.completion_tokens)
         """
         messages = [{"role": "user", "content": message}]
         return self.chat_with_history(messages, max_tokens, temperature, top_p, **kwargs)
@@ -118,8 +279,9 @@ class VLLMClient:
         max_tokens: int = 512,
         temperature: float = 0.7,
         top_p: float = 0.95,
+        deadline: Optional[float] = None,
         **kwargs
-    ) -> str:
+    ) -> ChatResult:
         """
         多轮对话接口
         
@@ -130,10 +292,13 @@ class VLLMClient:
             max_tokens: 最大生成token数
             temperature: 温度参数
             top_p: top_p采样参数
+            deadline: 本次调用的截止时间（秒），默认使用客户端的 deadline
             **kwargs: 其他API参数
         
         Returns:
-            模型回复内容
+            模型回复内容（str 子类，.meta 为本次调用的用量与时延；
+            配置了缓存且请求可复现时，优先返回缓存结果，此时 meta.from_cache 为 True；
+            启用 single_flight 时与进行中的相同请求共用一次调用，此时 meta.shared 为 True）
         
         Example:
             >>> messages = [
@@ -143,34 +308,50 @@ class VLLMClient:
             ... ]
             >>> response = client.chat_with_history(messages)
         """
-        if self.backend == 'openai':
-            completion = self._openai_client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=temperature,
-                top_p=top_p,
-                **kwargs
-            )
-            return completion.choices[0].message.content
-        else:
-            url = f"{self.base_url}/v1/chat/completions"
-            data = {
-                "model": self.model,
-                "messages": messages,
-                "max_tokens": max_tokens,
-                "temperature": temperature,
-                "top_p": top_p,
-                **kwargs
-            }
-            response = requests.post(
-                url,
-                headers=self._headers,
-                json=data,
-                timeout=self.timeout
-            )
-            response.raise_for_status()
-            return response.json()['choices'][0]['message']['content']
+        payload = self._build_payload(messages, max_tokens, temperature, top_p, **kwargs)
+        arrival = time.time()
+        cache_key = self._cache_key(payload)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                if self.metrics is not None:
+                    self.metrics.cache_hit()
+                meta = ChatMeta(from_cache=True)
+                if self.trace is not None:
+                    self.trace.record(payload, meta, arrival, latency=0.0)
+                return ChatResult(cached, meta)
+        
+        def fetch():
+            meta = ChatMeta()
+            if self.hedge is not None:
+                # 对冲以首个 token 为准，非流式调用在内部按流式请求发送
+                stream_payload = {'stream': True, 'stream_options': {'include_usage': True}, **payload}
+                response = "".join(self._stream(stream_payload, meta, deadline))
+            else:
+                response = self._complete(payload, meta, deadline)
+            if cache_key is not None:
+                self.cache.put(cache_key, response)
+            return response, meta
+        
+        start = time.perf_counter()
+        flight_key = self._flight_key(payload)
+        try:
+            if flight_key is None:
+                response, meta = fetch()
+            else:
+                (response, upstream), shared = self.single_flight.do(flight_key, fetch)
+                meta = ChatMeta(shared=shared)
+                meta.adopt(upstream)
+                if shared and self.metrics is not None:
+                    self.metrics.deduplicated_call(stream=False)
+        except Exception as e:
+            if self.trace is not None:
+                self.trace.record(payload, ChatMeta(), arrival, latency=time.perf_counter() - start, error=e)
+            raise
+        meta.latency = time.perf_counter() - start
+        if self.trace is not None:
+            self.trace.record(payload, meta, arrival, latency=meta.latency)
+        return ChatResult(response, meta)
     
     def chat_stream(
         self,
@@ -179,10 +360,9 @@ class VLLMClient:
         temperature: float = 0.7,
         top_p: float = 0.95,
         **kwargs
-    ) -> Iterator[str]:
+    ) -> ChatStream:
         """
         流式对话接口（实时输出）
-        注意：仅 OpenAI 后端支持
         
         Args:
             message: 用户输入
@@ -191,36 +371,18 @@ class VLLMClient:
             top_p: top_p采样参数
             **kwargs: 其他API参数
         
-        Yields:
-            每次生成的文本片段
-        
-        Raises:
-            NotImplementedError: 如果使用 requests 后端
+        Returns:
+            文本片段迭代器；迭代结束后 .meta 为本次调用的用量与时延
         
         Example:
-            >>> client = VLLMClient(backend='openai')
-            >>> for chunk in client.chat_stream("讲个故事"):
+            >>> client = VLLMClient()
+            >>> stream = client.chat_stream("讲个故事")
+            >>> for chunk in stream:
             ...     print(chunk, end="", flush=True)
+            >>> print(stream.meta.ttft, stream.meta.decode_tokens_per_s)
         """
-        if self.backend != 'openai':
-            raise NotImplementedError(
-                "流式输出仅支持 'openai' 后端。"
-                "请使用: VLLMClient(backend='openai')"
-            )
-        
-        stream = self._openai_client.chat.completions.create(
-            model=self.model,
-            messages=[{"role": "user", "content": message}],
-            max_tokens=max_tokens,
-            temperature=temperature,
-            top_p=top_p,
-            stream=True,
-            **kwargs
-        )
-        
-        for chunk in stream:
-            if chunk.choices[0].delta.content:
-                yield chunk.choices[0].delta.content
+        messages = [{"role": "user", "content": message}]
+        return self.chat_stream_with_history(messages, max_tokens, temperature, top_p, **kwargs)
     
     def chat_stream_with_history(
         self,
@@ -228,44 +390,140 @@ class VLLMClient:
         max_tokens: int = 512,
         temperature: float = 0.7,
         top_p: float = 0.95,
+        deadline: Optional[float] = None,
         **kwargs
-    ) -> Iterator[str]:
+    ) -> ChatStream:
         """
         流式多轮对话接口
-        注意：仅 OpenAI 后端支持
+        requests 后端直接解析 SSE 字节流，只解码 delta.content 与最终 usage；
+        openai 后端由 SDK 为每个 chunk 构造对象。
+        默认请求 stream_options.include_usage，由最后一个 chunk 得到 token 用量。
+        命中响应缓存时按片段回放缓存的回复；
+        启用 single_flight 时，同时进行的相同请求共用一条上游流，各自从头读取全部片段
         
         Args:
             messages: 对话历史列表
             max_tokens: 最大生成token数
             temperature: 温度参数
             top_p: top_p采样参数
+            deadline: 本次调用的截止时间（秒，从开始迭代算起），超过后抛出 DeadlineExceeded
             **kwargs: 其他API参数
         
-        Yields:
-            每次生成的文本片段
+        Returns:
+            文本片段迭代器；迭代结束后 .meta 为本次调用的用量与时延
+        """
+        kwargs.setdefault('stream_options', {'include_usage': True})
+        payload = self._build_payload(
+            messages, max_tokens, temperature, top_p, stream=True, **kwargs
+        )
+        meta = ChatMeta()
+        chunks = self._stream_cached(payload, meta, deadline)
+        if self.trace is not None:
+            chunks = self._traced(chunks, payload, meta)
+        return ChatStream(chunks, meta)
+    
+    def chat_batch(
+        self,
+        batch: Iterable[List[Dict[str, str]]],
+        max_concurrency: int = 32,
+        limiter: Optional[AdaptiveLimiter] = None,
+        **sampling
+    ) -> List[BatchResult]:
+        """
+        批量对话接口：并发发送多组对话，按输入顺序返回结果
+        单条失败不会中断整个批次，异常记录在对应 BatchResult.error 中
         
-        Raises:
-            NotImplementedError: 如果使用 requests 后端
+        Args:
+            batch: 多组对话历史，每组格式同 chat_with_history 的 messages
+            max_concurrency: 同时在途的最大请求数
+            limiter: 自适应并发限制器；给出时由它决定在途请求数，忽略 max_concurrency
+            **sampling: 采样参数（max_tokens、temperature、top_p 等），对每条请求生效
+        
+        Returns:
+            与输入一一对应的 BatchResult 列表
+        
+        Example:
+            >>> client = VLLMClient(keep_alive=True)
+            >>> batch = [[{"role": "user", "content": q}] for q in questions]
+            >>> results = client.chat_batch(batch, max_concurrency=64, max_tokens=256)
+            >>> answers = [r.response for r in results if r.ok]
         """
-        if self.backend != 'openai':
-            raise NotImplementedError(
-                "流式输出仅支持 'openai' 后端。"
-                "请使用: VLLMClient(backend='openai')"
-            )
+        results = list(self.chat_batch_iter(batch, max_concurrency, limiter, **sampling))
+        results.sort(key=lambda r: r.index)
+        return results
+    
+    def chat_batch_iter(
+        self,
+        batch: Iterable[List[Dict[str, str]]],
+        max_concurrency: int = 32,
+        limiter: Optional[AdaptiveLimiter] = None,
+        **sampling
+    ) -> Iterator[BatchResult]:
+        """
+        批量对话接口（按完成顺序产出结果）
+        始终保持 max_concurrency 个请求在途，让服务端的 continuous batching 保持满载；
+        输入可以是生成器，只按需读取，不会一次性提交全部任务
         
-        stream = self._openai_client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            top_p=top_p,
-            stream=True,
-            **kwargs
-        )
+        Args:
+            batch: 多组对话历史
+            max_concurrency: 同时在途的最大请求数
+            limiter: 自适应并发限制器；给出时在途请求数随延迟与服务端压力调整，
+                每个请求完成后把延迟信号（非流式为 总耗时 / 输出 token 数）交给限制器
+            **sampling: 采样参数
+        
+        Yields:
+            完成的 BatchResult（通过 index 对应输入位置）
+        
+        Example:
+            >>> for result in client.chat_batch_iter(batch, max_concurrency=64):
+            ...     print(result.index, result.response if result.ok else result.error)
+            >>> limiter = AdaptiveLimiter(initial=8)
+            >>> for result in client.chat_batch_iter(batch, limiter=limiter):
+            ...     print(result.index, limiter.limit)
+        """
+        def run(index: int, messages: List[Dict[str, str]]) -> BatchResult:
+            try:
+                response = self.chat_with_history(messages, **sampling)
+            except Exception as e:
+                if limiter is not None:
+                    limiter.release(overload=is_overload(e))
+                return BatchResult(index, error=e)
+            if limiter is not None:
+                limiter.release(latency_signal(response.meta))
+            return BatchResult(index, response=response)
         
-        for chunk in stream:
-            if chunk.choices[0].delta.content:
-                yield chunk.choices[0].delta.content
+        workers = max_concurrency if limiter is None else limiter.max_limit
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vllm-batch")
+        pending = set()
+        try:
+            for index, messages in enumerate(batch):
+                if limiter is None:
+                    if len(pending) >= max_concurrency:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            yield future.result()
+                else:
+                    # 等待许可期间继续产出已完成的结果
+                    while not limiter.try_acquire():
+                        if not pending:
+                            limiter.acquire()   # 许可被其他调用方占用
+                            break
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            yield future.result()
+                pending.add(pool.submit(run, index, messages))
+            
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        finally:
+            # 调用方提前停止迭代时，取消尚未开始的请求
+            pool.shutdown(wait=True, cancel_futures=True)
+            if limiter is not None:
+                for future in pending:
+                    if future.cancelled():
+                        limiter.release()
     
     def get_models(self) -> List[str]:
         """
@@ -279,20 +537,21 @@ class VLLMClient:
             >>> models = client.get_models()
             >>> print(models)
         """
-        if self.backend == 'openai':
-            models = self._openai_client.models.list()
-            return [model.id for model in models.data]
-        else:
-            url = f"{self.base_url}/v1/models"
-            response = requests.get(url, headers=self._headers, timeout=10)
-            response.raise_for_status()
-            result = response.json()
-            return [model['id'] for model in result['data']]
+        lease = self.replicas.acquire()
+        try:
+            return self._get_models_on(lease.base_url)
+        finally:
+            self.replicas.release(lease)
     
     def close(self):
         """关闭客户端连接"""
+        self.replicas.stop_health_checks()
+        if self._hedge_pool is not None:
+            self._hedge_pool.shutdown(wait=False, cancel_futures=True)
         if self.backend == 'openai':
             self._openai_client.close()
+        elif self.keep_alive:
+            self._http.close()
     
     def __enter__(self):
         """支持上下文管理器"""
@@ -301,6 +560,533 @@ class VLLMClient:
     def __exit__(self, exc_type, exc_val, exc_tb):
         """自动关闭连接"""
         self.close()
+    
+    # ============ 内部实现 ============
+    
+    def _build_payload(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        top_p: float,
+        **kwargs
+    ) -> Dict:
+        """构造 /v1/chat/completions 请求体"""
+        return {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "top_p": top_p,
+            **kwargs
+        }
+    
+    def _cache_key(self, payload: Dict) -> Optional[str]:
+        """可缓存的请求返回缓存键，否则返回 None"""
+        if self.cache is None or not is_deterministic(payload):
+            return None
+        return make_cache_key(payload)
+    
+    def _affinity_key(self, payload: Dict) -> Optional[str]:
+        """
+        会话亲和键：模型名 + system 消息 + 最早 affinity_turns 条对话
+        同一会话的后续轮次只在末尾追加消息，因此这部分保持不变
+        """
+        if self.routing != 'affinity' or len(self.replicas) == 1:
+            return None
+        messages = payload['messages']
+        prefix = [m for m in messages if m.get('role') == 'system']
+        prefix += [m for m in messages if m.get('role') != 'system'][:self.affinity_turns]
+        return json.dumps([payload['model'], prefix], ensure_ascii=False, sort_keys=True)
+    
+    @staticmethod
+    def _estimate_tokens(payload: Dict) -> int:
+        """粗略估计请求占用的 token 数（输入按 3 字符/token，加上 max_tokens），仅用于负载均衡"""
+        chars = sum(len(m.get('content') or '') for m in payload['messages'])
+        return chars // 3 + payload.get('max_tokens', 0)
+    
+    def _flight_key(self, payload: Dict) -> Optional[str]:
+        """可以合并的请求返回合并键（与缓存键相同的规范化哈希），否则返回 None"""
+        if self.single_flight is None or not is_deterministic(payload):
+            return None
+        return make_cache_key(payload)
+    
+    def _stream_cached(
+        self,
+        payload: Dict,
+        meta: ChatMeta,
+        deadline: Optional[float] = None
+    ) -> Iterator[str]:
+        """流式请求：先查响应缓存，未命中时加入进行中的相同请求或请求服务端，并写入缓存"""
+        cache_key = self._cache_key(payload)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                if self.metrics is not None:
+                    self.metrics.cache_hit()
+                meta.from_cache = True
+                yield from replay_stream(cached)
+                return
+        
+        flight_key = self._flight_key(payload)
+        if flight_key is None:
+            yield from self._stream_to_cache(payload, cache_key, meta, deadline)
+            return
+        
+        def open_stream():
+            upstream = ChatMeta()
+            return self._stream_to_cache(payload, cache_key, upstream, deadline), upstream
+        
+        chunks, upstream, shared = self.single_flight.stream(flight_key, open_stream)
+        meta.shared = shared
+        if shared and self.metrics is not None:
+            self.metrics.deduplicated_call(stream=True)
+        yield from chunks
+        meta.adopt(upstream)
+    
+    def _traced(self, chunks: Iterator[str], payload: Dict, meta: ChatMeta) -> Iterator[str]:
+        """流式调用结束（读完、出错或被提前关闭）时写入一条轨迹记录"""
+        arrival = time.time()
+        start = time.perf_counter()
+        ttft = None
+        error = None
+        try:
+            for chunk in chunks:
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                yield chunk
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.trace.record(payload, meta, arrival, ttft, time.perf_counter() - start, error)
+    
+    def _stream_to_cache(
+        self,
+        payload: Dict,
+        cache_key: Optional[str],
+        meta: ChatMeta,
+        deadline: Optional[float] = None
+    ) -> Iterator[str]:
+        """请求服务端并逐个产出片段，完整读取后写入响应缓存"""
+        parts = []
+        for chunk in self._stream(payload, meta, deadline):
+            parts.append(chunk)
+            yield chunk
+        if cache_key is not None:
+            self.cache.put(cache_key, "".join(parts))
+    
+    def _complete_on(self, base_url: str, payload: Dict, meta: ChatMeta, timeout: float) -> str:
+        """
+        向指定副本发送非流式请求，返回回复内容，并把 usage 与 finish_reason 写入 meta
+        content 为 null（输出全部被推理解析器放入 reasoning_content，或在思考中途截断）时返回 ''，
+        原因见 meta.finish_reason
+        """
+        if self.backend == 'openai':
+            completion = self._openai_clients[base_url].chat.completions.create(
+                **payload, timeout=timeout
+            )
+            choice = completion.choices[0]
+            meta.finish_reason = choice.finish_reason
+            if completion.usage is not None:
+                meta.update_usage(completion.usage.model_dump())
+            return choice.message.content or ''
+        
+        response = self._http.post(
+            f"{base_url}/v1/chat/completions",
+            headers=self._headers,
+            json=payload,
+            timeout=timeout
+        )
+        response.raise_for_status()
+        data = response.json()
+        choice = data['choices'][0]
+        meta.finish_reason = choice.get('finish_reason')
+        meta.update_usage(data.get('usage'))
+        return choice['message']['content'] or ''
+    
+    def _stream_on(
+        self,
+        base_url: str,
+        payload: Dict,
+        meta: ChatMeta,
+        timeout: float,
+        on_response: Optional[Callable[[object], None]] = None
+    ) -> Iterator[str]:
+        """
+        向指定副本发送流式请求，逐个产出文本片段；流结束时把 usage 与 finish_reason 写入 meta
+        提前关闭迭代器会关闭连接，服务端随之中止生成
+        on_response 在收到响应头后以 HTTP 响应对象调用，供其他线程中止这次请求（见 _Attempt.abort）
+        """
+        if self.backend == 'openai':
+            stream = self._openai_clients[base_url].chat.completions.create(
+                **payload, timeout=timeout
+            )
+            if on_response is not None:
+                on_response(stream.response)
+            try:
+                for chunk in stream:
+                    if chunk.usage is not None:
+                        meta.update_usage(chunk.usage.model_dump())
+                    if not chunk.choices:
+                        continue
+                    choice = chunk.choices[0]
+                    if choice.finish_reason:
+                        meta.finish_reason = choice.finish_reason
+                    if choice.delta.content:
+                        yield choice.delta.content
+            finally:
+                stream.close()
+            return
+        
+        response = self._http.post(
+            f"{base_url}/v1/chat/completions",
+            headers=self._headers,
+            json=payload,
+            timeout=timeout,
+            stream=True
+        )
+        if on_response is not None:
+            on_response(response)
+        response.raise_for_status()
+        stream = SSEChatStream(response.iter_lines(), close=response.close)
+        yield from stream
+        meta.finish_reason = stream.finish_reason
+        meta.update_usage(stream.usage)
+    
+    def _get_models_on(self, base_url: str) -> List[str]:
+        """查询指定副本的模型列表"""
+        if self.backend == 'openai':
+            models = self._openai_clients[base_url].models.list()
+            return [model.id for model in models.data]
+        
+        response = self._http.get(f"{base_url}/v1/models", headers=self._headers, timeout=10)
+        response.raise_for_status()
+        return [model['id'] for model in response.json()['data']]
+    
+    def _probe(self, base_url: str) -> bool:
+        """健康检查：副本能正常返回模型列表即视为健康"""
+        return bool(self._get_models_on(base_url))
+    
+    def _recorder(self, endpoint: str, stream: bool):
+        """为一次请求创建指标记录器；未启用指标时返回空操作的记录器"""
+        if self.metrics is None:
+            return NULL_RECORDER
+        return self.metrics.start(endpoint, stream)
+    
+    def _release_failed(self, lease: Lease, error: Exception):
+        """归还出错请求的副本：副本故障计入熔断，客户端错误（如 400 超出上下文）只归还负载"""
+        failed = _is_replica_failure(error)
+        self.replicas.release(lease, failed=failed, neutral=not failed)
+    
+    def _acquire(self, tried: List[Replica], tokens: int, affinity_key: Optional[str]) -> Lease:
+        """选择副本：优先未尝试过的副本，全部尝试过后不再排除（单副本也可以重试）"""
+        exclude = tried if len(set(tried)) < len(self.replicas) else ()
+        return self.replicas.acquire(exclude=exclude, tokens=tokens, affinity_key=affinity_key)
+    
+    def _should_retry(self, error: Exception, retries: int, deadline: Deadline) -> bool:
+        """首个 token 之前的错误是否重试：错误可重试、次数未用完、未到截止时间，且预算有额度"""
+        if retries >= self.retry.max_retries or not _is_replica_failure(error) or deadline.expired:
+            return False
+        return self.retry_budget.try_spend()
+    
+    def _backoff(self, retries: int, tried: List[Replica], deadline: Deadline):
+        """还有未尝试过的副本时立即重试，否则退避等待（不超过截止时间）"""
+        if len(set(tried)) < len(self.replicas):
+            return
+        delay = self.retry.backoff(retries)
+        remaining = deadline.remaining()
+        time.sleep(delay if remaining is None else min(delay, remaining))
+    
+    @staticmethod
+    def _give_up(error: Exception, deadline: Deadline):
+        """不再重试：截止时间导致的超时转换为 DeadlineExceeded，其他错误原样抛出"""
+        if deadline.expired and _is_replica_failure(error):
+            raise DeadlineExceeded(f"超过截止时间 {deadline.seconds}s: {error}") from error
+        raise error
+    
+    def _complete(self, payload: Dict, meta: ChatMeta, deadline: Optional[float] = None) -> str:
+        """
+        在负载最低的副本上发送非流式请求
+        可重试的错误（连接失败、超时、429 / 5xx）按重试策略换副本或退避后重试
+        """
+        tokens = self._estimate_tokens(payload)
+        affinity_key = self._affinity_key(payload)
+        deadline = Deadline(deadline if deadline is not None else self.deadline)
+        self.retry_budget.record_request()
+        tried = []
+        retries = 0
+        while True:
+            deadline.check()
+            lease = self._acquire(tried, tokens, affinity_key)
+            recorder = self._recorder(lease.base_url, stream=False)
+            try:
+                response = self._complete_on(
+                    lease.base_url, payload, meta, deadline.timeout(self.timeout)
+                )
+            except Exception as e:
+                self._release_failed(lease, e)
+                tried.append(lease.replica)
+                retry = self._should_retry(e, retries, deadline)
+                recorder.fail(e, retry=retry)
+                if not retry:
+                    self._give_up(e, deadline)
+                retries += 1
+                self._backoff(retries, tried, deadline)
+                continue
+            except BaseException as e:
+                # 调用方中断（KeyboardInterrupt 等）不说明副本的状态
+                self.replicas.release(lease, neutral=True)
+                recorder.fail(e)
+                raise
+            self.replicas.release(lease)
+            recorder.finish(meta)
+            return response
+    
+    def _stream(self, payload: Dict, meta: ChatMeta, deadline: Optional[float] = None) -> Iterator[str]:
+        """
+        在负载最低的副本上发送流式请求
+        收到首个片段之前：出错按重试策略重试，启用对冲时等待过久会向另一个副本再发一份；
+        收到首个片段之后的错误直接抛给调用方
+        """
+        tokens = self._estimate_tokens(payload)
+        affinity_key = self._affinity_key(payload)
+        deadline = Deadline(deadline if deadline is not None else self.deadline)
+        self.retry_budget.record_request()
+        tried = []
+        retries = 0
+        while True:
+            deadline.check()
+            try:
+                attempt, first = self._first_chunk(payload, tokens, affinity_key, tried, deadline)
+                break
+            except _AttemptFailed as failure:
+                retry = self._should_retry(failure.error, retries, deadline)
+                failure.attempt.recorder.fail(failure.error, retry=retry)
+                if not retry:
+                    self._give_up(failure.error, deadline)
+                retries += 1
+                self._backoff(retries, tried, deadline)
+        if self.hedge is not None and retries == 0:
+            # 只统计胜出尝试自身的首片段延迟；重试过的请求含失败尝试与退避等待，不计入
+            self.hedge.observe(attempt.ttft)
+        
+        recorder = attempt.recorder
+        try:
+            if first is not None:
+                recorder.token()
+                yield first
+                for chunk in attempt.chunks:
+                    recorder.token()
+                    yield chunk
+                    if deadline.expires is not None:
+                        deadline.check()
+        except Exception as e:
+            attempt.chunks.close()
+            self._release_failed(attempt.lease, e)
+            recorder.fail(e)
+            raise
+        except BaseException:
+            # 调用方提前结束迭代（GeneratorExit）或手动中断，不算副本故障
+            attempt.chunks.close()
+            self.replicas.release(attempt.lease)
+            recorder.finish(attempt.meta)
+            meta.adopt(attempt.meta)
+            raise
+        self.replicas.release(attempt.lease)
+        recorder.finish(attempt.meta)
+        meta.adopt(attempt.meta)
+    
+    def _start_attempt(
+        self,
+        payload: Dict,
+        tokens: int,
+        affinity_key: Optional[str],
+        exclude: List[Replica],
+        deadline: Deadline
+    ) -> "_Attempt":
+        """选择副本并创建一次流式尝试（请求在第一次读取时发出）"""
+        lease = self._acquire(exclude, tokens, affinity_key)
+        attempt = _Attempt(lease, self._recorder(lease.base_url, stream=True), ChatMeta())
+        attempt.chunks = self._stream_on(
+            lease.base_url, payload, attempt.meta, deadline.timeout(self.timeout),
+            on_response=attempt.attach
+        )
+        return attempt
+    
+    def _attempt_failed(
+        self,
+        attempt: "_Attempt",
+        error: Exception,
+        tried: List[Replica]
+    ) -> "_AttemptFailed":
+        """归还失败尝试的副本并记入已尝试列表"""
+        self._release_failed(attempt.lease, error)
+        tried.append(attempt.lease.replica)
+        return _AttemptFailed(attempt, error)
+    
+    def _record_hedge(self, won: bool):
+        self.hedge.record(won)
+        if self.metrics is not None:
+            self.metrics.hedge(won)
+    
+    def _abandon(self, future, attempt: "_Attempt"):
+        """
+        放弃对冲中落败的一方：立即关闭它的连接（服务端随之中止生成），读取线程退出后再归还副本
+        被放弃的请求不说明副本的好坏，归还时不计入成功或失败
+        """
+        attempt.abort()
+        attempt.recorder.cancel()
+        
+        def finished(_):
+            attempt.chunks.close()
+            self.replicas.release(attempt.lease, neutral=True)
+        
+        future.add_done_callback(finished)
+    
+    def _first_chunk(
+        self,
+        payload: Dict,
+        tokens: int,
+        affinity_key: Optional[str],
+        tried: List[Replica],
+        deadline: Deadline
+    ) -> Tuple["_Attempt", Optional[str]]:
+        """
+        发出请求并等待首个片段
+        启用对冲时，超过阈值仍未收到首个片段且预算允许，就向另一个副本再发一份，采用先到的一方
+        
+        Returns:
+            (胜出的尝试, 首个片段)；回复为空时片段为 None
+        
+        Raises:
+            _AttemptFailed: 所有尝试都在首个片段之前失败（最后一个失败的尝试）
+            DeadlineExceeded: 等待首个片段时超过截止时间
+        """
+        primary = self._start_attempt(payload, tokens, affinity_key, tried, deadline)
+        if self.hedge is None or len(self.replicas) == 1:
+            try:
+                return primary, primary.first()
+            except Exception as e:
+                raise self._attempt_failed(primary, e, tried)
+            except BaseException as e:
+                self.replicas.release(primary.lease, neutral=True)
+                primary.recorder.fail(e)
+                raise
+        
+        if self._hedge_pool is None:
+            self._hedge_pool = ThreadPoolExecutor(
+                max_workers=2 * self._pool_size, thread_name_prefix="vllm-hedge"
+            )
+        futures = {self._hedge_pool.submit(primary.first): primary}
+        hedged = None
+        failure = None
+        try:
+            delay = self.hedge.delay()
+            remaining = deadline.remaining()
+            done, _ = wait(futures, timeout=delay if remaining is None else min(delay, remaining))
+            if (not done and len(set(tried) | {primary.lease.replica}) < len(self.replicas)
+                    and self.retry_budget.try_spend()):
+                hedged = self._start_attempt(
+                    payload, tokens, affinity_key, tried + [primary.lease.replica], deadline
+                )
+                futures[self._hedge_pool.submit(hedged.first)] = hedged
+            
+            while futures:
+                done, _ = wait(futures, timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+                if not done:
+                    deadline.check()
+                for future in done:
+                    attempt = futures.pop(future)
+                    try:
+                        first = future.result()
+                    except Exception as e:
+                        failure = self._attempt_failed(attempt, e, tried)
+                        if futures:
+                            # 另一份请求仍在进行，这次失败不触发重试
+                            attempt.recorder.fail(e)
+                        continue
+                    if hedged is not None:
+                        self._record_hedge(won=attempt is hedged)
+                    return attempt, first
+            if hedged is not None:
+                self._record_hedge(won=False)
+            raise failure
+        finally:
+            for future, attempt in futures.items():
+                self._abandon(future, attempt)
+
+
+def _abort_response(response):
+    """
+    从另一个线程中止正在读取的 HTTP 响应（requests 或 httpx）
+    先 shutdown 底层套接字唤醒阻塞中的读取，再关闭响应；只 close 不一定能唤醒另一个线程的 recv
+    """
+    sock = None
+    connection = getattr(getattr(response, 'raw', None), '_connection', None)   # requests / urllib3
+    if connection is not None:
+        sock = getattr(connection, 'sock', None)
+    else:
+        stream = getattr(response, 'extensions', {}).get('network_stream')      # httpx / httpcore
+        if stream is not None:
+            sock = stream.get_extra_info('socket')
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    try:
+        response.close()
+    except Exception:
+        pass   # 读取线程可能正在使用连接，它会在读取出错后自行清理
+
+
+@dataclass
+class _Attempt:
+    """流式请求在某个副本上的一次尝试"""
+    lease: Lease
+    recorder: object
+    meta: ChatMeta
+    chunks: Optional[Iterator[str]] = None
+    started: float = field(default_factory=time.perf_counter)
+    ttft: Optional[float] = None            # 本次尝试自身的首片段延迟（秒）
+    response: object = None                 # 收到响应头后的 HTTP 响应，用于中止
+    aborted: bool = False
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    
+    def first(self) -> Optional[str]:
+        """读取首个片段（回复为空时返回 None），并记录首片段延迟"""
+        first = next(self.chunks, None)
+        self.ttft = time.perf_counter() - self.started
+        return first
+    
+    def attach(self, response):
+        """收到响应头时调用；已被放弃的尝试立即中止"""
+        with self._lock:
+            self.response = response
+            aborted = self.aborted
+        if aborted:
+            _abort_response(response)
+    
+    def abort(self):
+        """
+        中止这次尝试（可在其他线程调用）
+        已收到响应头时立即关闭连接；仍在等待响应头时，收到后立即关闭
+        """
+        with self._lock:
+            self.aborted = True
+            response = self.response
+        if response is not None:
+            _abort_response(response)
+
+
+class _AttemptFailed(Exception):
+    """首个片段之前失败的尝试，由 _stream 决定是否重试"""
+    
+    def __init__(self, attempt: _Attempt, error: Exception):
+        super().__init__(str(error))
+        self.attempt = attempt
+        self.error = error
 
 
 # ============ 使用示例 ============
@@ -335,14 +1121,18 @@ def example_multi_turn():
 def example_stream():
     """示例3：流式输出"""
     print("=" * 60)
-    print("示例3：流式输出（OpenAI 后端）")
+    print("示例3：流式输出（requests 后端）")
     print("=" * 60)
     
-    client = VLLMClient(backend='openai')
+    client = VLLMClient(backend='requests')
     print("回复: ", end="", flush=True)
-    for chunk in client.chat_stream("用一句话介绍Python编程语言", max_tokens=200):
+    stream = client.chat_stream("用一句话介绍Python编程语言", max_tokens=200)
+    for chunk in stream:
         print(chunk, end="", flush=True)
     print("\n")
+    meta = stream.meta
+    print(f"用量: prompt={meta.prompt_tokens} completion={meta.completion_tokens} "
+          f"TTFT={meta.ttft:.2f}s 解码={meta.decode_tokens_per_s:.1f} tok/s\n")
     client.close()
 
 
@@ -393,6 +1183,24 @@ def example_models():
     print(f"可用模型: {models}\n")
 
 
+def example_batch():
+    """示例7：批量并发对话"""
+    print("=" * 60)
+    print("示例7：批量并发对话（长连接池 + 32 并发）")
+    print("=" * 60)
+    
+    with VLLMClient(backend='requests', keep_alive=True) as client:
+        batch = [
+            [{"role": "user", "content": f"用一句话解释数字 {i} 的含义"}]
+            for i in range(20)
+        ]
+        results = client.chat_batch(batch, max_concurrency=32, max_tokens=64)
+        for result in results[:3]:
+            print(f"[{result.index}] {result.response if result.ok else result.error}")
+        failed = sum(1 for r in results if not r.ok)
+        print(f"... 共 {len(results)} 条，失败 {failed} 条\n")
+
+
 def main():
     """运行所有示例"""
     try:
@@ -402,6 +1210,7 @@ def main():
         example_temperature()
         example_context_manager()
         example_models()
+        example_batch()
         
         print("=" * 60)
         print("✅ 所有示例运行完成！")
@@ -0,0 +1,440 @@
+"""
+vllm-top - 定时抓取 vLLM 服务端的 /metrics，实时显示服务端负载
+
+只看客户端是否超时，发现服务端饱和时已经晚了。vllm-top 每隔 interval 秒抓取一次服务端的
+Prometheus 指标，与上一次抓取相减得到区间内的速率:
+    运行 / 排队      正在生成与排队中的请求数（括号内为与上次相比的变化）
+    KV               KV cache 占用
+    前缀命中          区间内前缀缓存命中率（旧版 vLLM 为服务端给出的命中率）
+    输入 / 生成 tok/s prompt 与生成 token 吞吐
+    请求/s           完成的请求数
+    TTFT / 排队       区间内完成请求的平均首 token 延迟与平均排队时间
+    抢占/s           KV cache 不足导致的抢占（preemption）
+
+/metrics 中大部分是直方图的 _bucket 行，解析时逐行读取响应，只对关心的指标名做正则匹配，
+其余行看一眼指标名就跳过（见 metrics.parse_samples）。
+
+使用方法:
+    python vllm_top.py                                            # 终端刷新视图，每 2 秒
+    python vllm_top.py --url http://localhost:9000 http://localhost:9001 --interval 1
+    python vllm_top.py --json >> server_metrics.jsonl             # 每次抓取每个副本输出一行 JSON
+    python vllm_top.py --count 5 --no-clear
+
+    # 程序中使用：其他组件读取同一份服务端状态
+    monitor = ServerMonitor("http://localhost:9000", interval=2.0)
+    monitor.start()
+    print(monitor.total().waiting, monitor.total().kv_usage)
+    limiter = AdaptiveLimiter()
+    monitor.add_listener(lambda snapshots: limiter.observe_server(**monitor.pressure()))
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+import unicodedata
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import requests
+
+from metrics import parse_samples
+
+# 指标名 -> 字段（不同 vLLM 版本的命名不同，同一字段列出全部别名）
+GAUGE_FIELDS = {
+    'vllm:num_requests_running': 'running',
+    'vllm:num_requests_waiting': 'waiting',
+    'vllm:kv_cache_usage_perc': 'kv_usage',
+    'vllm:gpu_cache_usage_perc': 'kv_usage',
+    'vllm:gpu_prefix_cache_hit_rate': 'prefix_hit_rate',
+}
+COUNTER_FIELDS = {
+    'vllm:prompt_tokens_total': 'prompt_tokens',
+    'vllm:generation_tokens_total': 'generation_tokens',
+    'vllm:request_success_total': 'requests',
+    'vllm:num_preemptions_total': 'preemptions',
+    'vllm:prefix_cache_queries_total': 'prefix_queries',
+    'vllm:prefix_cache_hits_total': 'prefix_hits',
+    'vllm:gpu_prefix_cache_queries_total': 'prefix_queries',
+    'vllm:gpu_prefix_cache_hits_total': 'prefix_hits',
+    'vllm:time_to_first_token_seconds_sum': 'ttft_sum',
+    'vllm:time_to_first_token_seconds_count': 'ttft_count',
+    'vllm:request_queue_time_seconds_sum': 'queue_sum',
+    'vllm:request_queue_time_seconds_count': 'queue_count',
+}
+_TRACKED = frozenset(GAUGE_FIELDS) | frozenset(COUNTER_FIELDS)
+# 多个模型 / 标签组合时取最大值的字段（其余求和）
+_MAX_FIELDS = ('kv_usage', 'prefix_hit_rate')
+
+
+def read_metrics(lines) -> Dict[str, float]:
+    """
+    从 /metrics 文本行中读取 vllm-top 关心的原始值
+
+    Returns:
+        {字段: 值}，只包含服务端实际输出的字段
+    """
+    raw: Dict[str, float] = {}
+    for name, _, value in parse_samples(lines, _TRACKED):
+        key = GAUGE_FIELDS.get(name) or COUNTER_FIELDS[name]
+        if key in _MAX_FIELDS:
+            raw[key] = max(raw.get(key, 0.0), value)
+        else:
+            raw[key] = raw.get(key, 0.0) + value
+    return raw
+
+
+@dataclass
+class ServerSnapshot:
+    """一个副本的一次抓取结果（速率为与上一次抓取之间的平均值，第一次抓取时为 None）"""
+    url: str
+    timestamp: float
+    running: Optional[float] = None
+    waiting: Optional[float] = None
+    running_delta: Optional[float] = None
+    waiting_delta: Optional[float] = None
+    kv_usage: Optional[float] = None                 # 0-1
+    prefix_cache_hit_rate: Optional[float] = None    # 0-1
+    prompt_tokens_per_s: Optional[float] = None
+    generation_tokens_per_s: Optional[float] = None
+    requests_per_s: Optional[float] = None
+    preemptions_per_s: Optional[float] = None
+    mean_ttft: Optional[float] = None                # 区间内完成请求的平均值（秒）
+    mean_queue_time: Optional[float] = None
+    scrape_seconds: float = 0.0
+    payload_bytes: int = 0
+    error: Optional[str] = None
+    raw: Dict[str, float] = field(default_factory=dict, repr=False)
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        data.pop('raw')
+        return data
+
+    def pressure(self) -> Dict[str, Optional[float]]:
+        """AdaptiveLimiter.observe_server 所需的压力指标"""
+        return {
+            'kv_usage': self.kv_usage,
+            'waiting': self.waiting or 0.0,
+            'preemptions': self.raw.get('preemptions'),
+        }
+
+
+def _delta(current: Dict[str, float], previous: Dict[str, float], key: str) -> Optional[float]:
+    """计数器的增量；缺失或变小（服务端重启）时返回 None"""
+    if key not in current or key not in previous or current[key] < previous[key]:
+        return None
+    return current[key] - previous[key]
+
+
+def _ratio(numerator: Optional[float], denominator: Optional[float]) -> Optional[float]:
+    if numerator is None or not denominator:
+        return None
+    return numerator / denominator
+
+
+def build_snapshot(
+    url: str,
+    timestamp: float,
+    raw: Dict[str, float],
+    previous: Optional[Tuple[float, Dict[str, float]]] = None
+) -> ServerSnapshot:
+    """
+    由本次与上一次抓取的原始值计算快照
+
+    Args:
+        url: 副本地址
+        timestamp: 本次抓取时间
+        raw: read_metrics 的结果
+        previous: 上一次的 (时间, 原始值)
+    """
+    snapshot = ServerSnapshot(
+        url=url,
+        timestamp=timestamp,
+        running=raw.get('running'),
+        waiting=raw.get('waiting'),
+        kv_usage=raw.get('kv_usage'),
+        prefix_cache_hit_rate=raw.get('prefix_hit_rate'),
+        raw=raw
+    )
+    if previous is None:
+        return snapshot
+    before, old = previous
+    elapsed = timestamp - before
+    if elapsed <= 0:
+        return snapshot
+
+    for key in ('running', 'waiting'):
+        if key in raw and key in old:
+            setattr(snapshot, f'{key}_delta', raw[key] - old[key])
+    for key, name in (('prompt_tokens', 'prompt_tokens_per_s'),
+                      ('generation_tokens', 'generation_tokens_per_s'),
+                      ('requests', 'requests_per_s'),
+                      ('preemptions', 'preemptions_per_s')):
+        setattr(snapshot, name, _ratio(_delta(raw, old, key), elapsed))
+
+    hit_rate = _ratio(_delta(raw, old, 'prefix_hits'), _delta(raw, old, 'prefix_queries'))
+    if hit_rate is not None:
+        snapshot.prefix_cache_hit_rate = hit_rate
+    snapshot.mean_ttft = _ratio(_delta(raw, old, 'ttft_sum'), _delta(raw, old, 'ttft_count'))
+    snapshot.mean_queue_time = _ratio(_delta(raw, old, 'queue_sum'), _delta(raw, old, 'queue_count'))
+    return snapshot
+
+
+class ServerMonitor:
+    """
+    定时抓取一个或多个副本的 /metrics，保存最新快照与历史（线程安全）
+    """
+
+    def __init__(
+        self,
+        base_url: Union[str, List[str]] = "http://localhost:9000",
+        interval: float = 2.0,
+        timeout: float = 5.0,
+        history: int = 300
+    ):
+        """
+        Args:
+            base_url: vLLM 服务地址，或多个副本的地址列表（与客户端的 base_url 相同）
+            interval: 后台抓取间隔（秒）
+            timeout: 单次抓取超时（秒）
+            history: 每个副本保留的快照数
+        """
+        urls = [base_url] if isinstance(base_url, str) else list(base_url)
+        self.urls = [url.rstrip('/') for url in urls]
+        self.interval = interval
+        self.timeout = timeout
+        self._session = requests.Session()
+        self._lock = threading.Lock()
+        self._previous: Dict[str, Tuple[float, Dict[str, float]]] = {}
+        self._latest: Dict[str, ServerSnapshot] = {}
+        self._history: Dict[str, deque] = {url: deque(maxlen=history) for url in self.urls}
+        self._listeners: List[Callable[[List[ServerSnapshot]], None]] = []
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def _scrape(self, url: str) -> ServerSnapshot:
+        """抓取一个副本（逐行读取响应，不把整个响应读入内存）"""
+        start = time.perf_counter()
+        size = 0
+
+        def lines(response):
+            nonlocal size
+            for line in response.iter_lines(chunk_size=65536):
+                size += len(line) + 1
+                yield line
+
+        try:
+            with self._session.get(f"{url}/metrics", timeout=self.timeout, stream=True) as response:
+                response.raise_for_status()
+                raw = read_metrics(lines(response))
+        except Exception as e:
+            return ServerSnapshot(
+                url=url, timestamp=time.time(), error=f"{type(e).__name__}: {e}",
+                scrape_seconds=time.perf_counter() - start
+            )
+
+        now = time.time()
+        with self._lock:
+            previous = self._previous.get(url)
+            self._previous[url] = (now, raw)
+        snapshot = build_snapshot(url, now, raw, previous)
+        snapshot.scrape_seconds = time.perf_counter() - start
+        snapshot.payload_bytes = size
+        return snapshot
+
+    def poll(self) -> List[ServerSnapshot]:
+        """立即抓取全部副本一次，更新最新快照并通知监听者"""
+        snapshots = [self._scrape(url) for url in self.urls]
+        with self._lock:
+            for snapshot in snapshots:
+                self._latest[snapshot.url] = snapshot
+                self._history[snapshot.url].append(snapshot)
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(snapshots)
+        return snapshots
+
+    @property
+    def latest(self) -> Dict[str, ServerSnapshot]:
+        """各副本的最新快照 {url: ServerSnapshot}"""
+        with self._lock:
+            return dict(self._latest)
+
+    def history(self, url: Optional[str] = None) -> List[ServerSnapshot]:
+        """某个副本（默认第一个）的历史快照，从旧到新"""
+        with self._lock:
+            return list(self._history[(url or self.urls[0]).rstrip('/')])
+
+    def total(self) -> ServerSnapshot:
+        """
+        全部副本的汇总：请求数与速率求和，KV 占用取最大值，命中率与平均延迟取各副本的平均
+        """
+        snapshots = [s for s in self.latest.values() if s.error is None]
+        total = ServerSnapshot(url='total', timestamp=time.time())
+        if not snapshots:
+            total.error = "没有可用的抓取结果"
+            return total
+        for name in ('running', 'waiting', 'running_delta', 'waiting_delta', 'prompt_tokens_per_s',
+                     'generation_tokens_per_s', 'requests_per_s', 'preemptions_per_s'):
+            values = [getattr(s, name) for s in snapshots if getattr(s, name) is not None]
+            setattr(total, name, sum(values) if values else None)
+        kv = [s.kv_usage for s in snapshots if s.kv_usage is not None]
+        total.kv_usage = max(kv) if kv else None
+        for name in ('prefix_cache_hit_rate', 'mean_ttft', 'mean_queue_time'):
+            values = [getattr(s, name) for s in snapshots if getattr(s, name) is not None]
+            setattr(total, name, sum(values) / len(values) if values else None)
+        preemptions = [s.raw['preemptions'] for s in snapshots if 'preemptions' in s.raw]
+        if preemptions:
+            total.raw['preemptions'] = sum(preemptions)
+        return total
+
+    def pressure(self) -> Dict[str, Optional[float]]:
+        """全部副本的服务端压力，可直接传给 AdaptiveLimiter.observe_server(**pressure)"""
+        return self.total().pressure()
+
+    def add_listener(self, callback: Callable[[List[ServerSnapshot]], None]):
+        """每次抓取后以本次的快照列表调用 callback（在抓取线程中执行）"""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def start(self) -> "ServerMonitor":
+        """启动后台抓取线程"""
+        if self._thread is not None:
+            return self
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.is_set():
+                started = time.monotonic()
+                self.poll()
+                self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+        self._thread = threading.Thread(target=loop, name="vllm-top", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止后台抓取"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self._session.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+# ============ 终端显示 ============
+
+_CLEAR = "\033[H\033[J"
+
+COLUMNS = ('副本', '运行', '排队', 'KV', '前缀命中', '输入 tok/s', '生成 tok/s', '请求/s', 'TTFT', '排队时间', '抢占/s')
+
+
+def _width(text: str) -> int:
+    """终端显示宽度（中文占两列）"""
+    return sum(2 if unicodedata.east_asian_width(c) in 'WF' else 1 for c in text)
+
+
+def _pad(text: str, width: int, left: bool = False) -> str:
+    space = ' ' * max(0, width - _width(text))
+    return text + space if left else space + text
+
+
+def _number(value: Optional[float], spec: str = '.1f', suffix: str = '') -> str:
+    return '-' if value is None else f"{value:{spec}}{suffix}"
+
+
+def _count(value: Optional[float], delta: Optional[float]) -> str:
+    if value is None:
+        return '-'
+    text = f"{value:.0f}"
+    if delta:
+        text += f"({delta:+.0f})"
+    return text
+
+
+def _row(snapshot: ServerSnapshot) -> List[str]:
+    name = '合计' if snapshot.url == 'total' else snapshot.url.split('://', 1)[-1]
+    if snapshot.error is not None:
+        return [name, f"抓取失败: {snapshot.error[:80]}"]
+    percent = lambda v: None if v is None else v * 100
+    return [
+        name,
+        _count(snapshot.running, snapshot.running_delta),
+        _count(snapshot.waiting, snapshot.waiting_delta),
+        _number(percent(snapshot.kv_usage), '.1f', '%'),
+        _number(percent(snapshot.prefix_cache_hit_rate), '.1f', '%'),
+        _number(snapshot.prompt_tokens_per_s),
+        _number(snapshot.generation_tokens_per_s),
+        _number(snapshot.requests_per_s, '.2f'),
+        _number(snapshot.mean_ttft, '.3f', 's'),
+        _number(snapshot.mean_queue_time, '.3f', 's'),
+        _number(snapshot.preemptions_per_s, '.2f'),
+    ]
+
+
+def render_table(snapshots: List[ServerSnapshot], total: Optional[ServerSnapshot] = None) -> str:
+    """把快照渲染为对齐的表格文本（多个副本时最后一行为汇总）"""
+    rows = [list(COLUMNS)] + [_row(s) for s in snapshots]
+    if total is not None and len(snapshots) > 1:
+        rows.append(_row(total))
+    widths = [max(_width(row[i]) for row in rows if len(row) == len(COLUMNS)) for i in range(len(COLUMNS))]
+    lines = []
+    for row in rows:
+        if len(row) != len(COLUMNS):
+            lines.append(_pad(row[0], widths[0], left=True) + '  ' + row[1])
+            continue
+        cells = [_pad(row[0], widths[0], left=True)] + [_pad(c, w) for c, w in zip(row[1:], widths[1:])]
+        lines.append('  '.join(cells))
+    return '\n'.join(lines)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="vllm-top：实时显示 vLLM 服务端 /metrics")
+    parser.add_argument("--url", nargs="+", default=["http://localhost:9000"], help="一个或多个副本地址")
+    parser.add_argument("--interval", type=float, default=2.0, help="抓取间隔（秒）")
+    parser.add_argument("--timeout", type=float, default=5.0, help="单次抓取超时（秒）")
+    parser.add_argument("--count", type=int, default=0, help="抓取次数，0 表示一直运行")
+    parser.add_argument("--json", action="store_true", help="每次抓取每个副本输出一行 JSON，而不是表格")
+    parser.add_argument("--no-clear", action="store_true", help="不清屏，表格依次向下输出")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    monitor = ServerMonitor(args.url, interval=args.interval, timeout=args.timeout)
+    clear = sys.stdout.isatty() and not args.no_clear and not args.json
+    polls = 0
+    try:
+        while True:
+            started = time.monotonic()
+            snapshots = monitor.poll()
+            polls += 1
+            if args.json:
+                for snapshot in snapshots:
+                    print(json.dumps(snapshot.to_dict(), ensure_ascii=False), flush=True)
+            else:
+                header = (f"vllm-top  {datetime.now():%H:%M:%S}  每 {args.interval:g}s 抓取"
+                          f"  {len(monitor.urls)} 个副本")
+                text = f"{header}\n\n{render_table(snapshots, monitor.total())}\n"
+                print((_CLEAR if clear else '') + text, flush=True)
+            if args.count and polls >= args.count:
+                break
+            time.sleep(max(0.0, args.interval - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        monitor.stop()
+
+
+if __name__ == "__main__":
+    main()
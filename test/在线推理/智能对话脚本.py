@@ -6,10 +6,14 @@ vLLM 智能对话脚本
     - 🤖 多轮对话，自动维护上下文
     - 📝 对话历史记录
     - 🎨 彩色输出，美化界面
-    - 💾 保存/加载对话历史
+    - 💾 每轮自动追加写入会话日志，可按序号加载、只加载最近 N 轮
     - ⚙️ 动态调整参数（温度、长度等）
-    - 🔄 支持流式和非流式输出
-    - 📊 显示 token 使用统计
+    - 🔄 支持流式和非流式输出（流式输出按帧率合并写入，实时显示 TTFT 与 tokens/s）
+    - 📊 统计每个会话的真实 token 用量与速度（TTFT、tokens/s、前缀缓存命中）
+    - ✂️ 按 token 预算自动裁剪最早的轮次，避免超出 max_model_len
+    - 💭 推理模型的 <think> 思考过程可显示 / 折叠 / 隐藏，历史中默认只保存回答
+    - ⚡ 启动即显示提示符：客户端创建、连接检查与分词器加载都在后台进行，
+      连接检查结果缓存 5 分钟（chat_history/.connection_cache.json）
 
 使用方法:
     python 智能对话脚本.py
@@ -18,9 +22,12 @@ vLLM 智能对话脚本
         /help       - 显示帮助信息
         /clear      - 清空对话历史
         /history    - 显示对话历史
-        /save       - 保存对话到文件
+        /save       - 设置会话标题 / 导出为 JSON
         /load       - 加载对话历史
+        /list       - 列出最近的会话
         /config     - 查看/修改配置
+        /stats      - 查看本会话的 token 用量与性能统计
+        /think      - 查看上一轮的思考过程
         /stream     - 切换流式输出
         /quit       - 退出程序
 
@@ -32,12 +39,18 @@ import sys
 import os
 import json
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union
 from pathlib import Path
 
 # 添加父目录到路径以导入 vllm_client
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from vllm_client import VLLMClient
+from connection_check import CheckResult, ConnectionCheck
+from context_budget import ContextBudget, TokenCounter
+from chat_journal import ChatJournal
+from stream_renderer import REASONING_MODES, StreamRenderer
+from reasoning import split_reasoning
+from chat_result import ChatMeta, UsageTotals
 
 
 # ============ 颜色输出工具 ============
@@ -46,6 +59,7 @@ class Colors:
     """ANSI 颜色代码"""
     RESET = '\033[0m'
     BOLD = '\033[1m'
+    DIM = '\033[2m'
     
     # 前景色
     BLACK = '\033[30m'
@@ -91,18 +105,38 @@ class SmartChat:
     
     def __init__(
         self,
-        base_url: str = "http://localhost:9000",
+        base_url: Union[str, List[str]] = "http://localhost:9000",
         api_key: str = "muyu",
         model: str = "Medical_Qwen3_8B_Large_Language_Model",
-        backend: str = 'openai'  # 默认使用 openai 后端支持流式输出
+        backend: str = 'openai',
+        model_dir: Optional[str] = None,
+        max_model_len: int = 4096,
+        connection_ttl: float = 300.0
     ):
-        """初始化对话管理器"""
-        self.client = VLLMClient(
-            base_url=base_url,
-            api_key=api_key,
-            model=model,
-            backend=backend
-        )
+        """
+        初始化对话管理器
+        base_url 传入多个副本地址时使用会话亲和路由：同一会话始终发往同一副本，
+        每轮重发的历史可以直接命中该副本上的前缀缓存。
+        model_dir 为本地模型目录，用其分词器统计 token；不存在时按字符估计
+        客户端的创建与连接检查在后台进行，第一次使用 self.client 时才等待
+        """
+        self.history_dir = Path("chat_history")
+        self.history_dir.mkdir(exist_ok=True)
+        
+        urls = [base_url] if isinstance(base_url, str) else list(base_url)
+        self.connection = ConnectionCheck(
+            lambda: VLLMClient(
+                base_url=base_url,
+                api_key=api_key,
+                model=model,
+                backend=backend,
+                routing='affinity'
+            ),
+            key=f"{','.join(urls)}|{model}",
+            cache_path=self.history_dir / ".connection_cache.json",
+            ttl=connection_ttl
+        ).start()
+        self._connection_reported = False
         
         self.messages: List[Dict[str, str]] = []
         self.config = {
@@ -110,13 +144,53 @@ class SmartChat:
             'temperature': 0.7,
             'top_p': 0.95,
             'stream': True,  # 默认开启流式输出
-            'backend': backend
+            'backend': backend,
+            'max_model_len': max_model_len,  # 与服务端 --max-model-len 保持一致
+            'reasoning': 'collapse',  # 思考过程: show / collapse / hide
+            'keep_reasoning': False  # 是否把思考过程写入历史（每轮都会重新 prefill）
         }
+        # 分词器在后台加载，第一次裁剪上下文时才等待
+        self.context = ContextBudget(TokenCounter(model_dir, background=True), max_model_len=max_model_len)
+        self.renderer = StreamRenderer(reasoning=self.config['reasoning'])
+        self.last_reasoning = ''
         
-        self.history_dir = Path("chat_history")
-        self.history_dir.mkdir(exist_ok=True)
+        # 每轮对话结束后追加写入当前会话的日志（自动保存）
+        self.journal = ChatJournal(self.history_dir)
+        self.session_id = self.journal.new_session(config=self.config)
         
-        self.total_tokens_used = 0
+        # 本会话的累计用量（来自服务端返回的 usage）
+        self.usage = UsageTotals()
+    
+    @property
+    def client(self) -> VLLMClient:
+        """对话客户端（后台仍在创建时等待）"""
+        return self.connection.client()
+    
+    def report_connection(self, wait: bool = False) -> Optional[CheckResult]:
+        """
+        显示连接检查结果（每个结果只显示一次）
+        
+        Args:
+            wait: 检查尚未完成时是否等待
+        
+        Returns:
+            本次显示的检查结果；尚未完成或已经显示过时返回 None
+        """
+        if self._connection_reported or not (wait or self.connection.done()):
+            return None
+        result = self.connection.result()
+        self._connection_reported = True
+        if result.ok:
+            source = f"缓存, {result.age:.0f}s 前检查" if result.cached else f"{result.elapsed:.2f}s"
+            current = result.models[0] if result.models else '-'
+            print_colored(f"✅ 连接成功！当前模型: {current} ({source})", Colors.GREEN)
+        else:
+            print_colored(f"❌ 连接失败: {result.error}", Colors.RED)
+            print_colored("请确保:", Colors.YELLOW)
+            print_colored("  1. vLLM 服务已启动", Colors.YELLOW)
+            print_colored("  2. SSH 隧道已建立（如需要）", Colors.YELLOW)
+            print_colored("  3. 端口 9000 可访问", Colors.YELLOW)
+        return result
     
     def add_message(self, role: str, content: str):
         """添加消息到历史"""
@@ -128,7 +202,9 @@ class SmartChat:
     def clear_history(self):
         """清空对话历史"""
         self.messages.clear()
-        self.total_tokens_used = 0
+        self.context.reset()
+        self.usage = UsageTotals()
+        self.session_id = self.journal.new_session(config=self.config)
         print_colored("✅ 对话历史已清空", Colors.GREEN)
     
     def show_history(self):
@@ -154,62 +230,104 @@ class SmartChat:
         
         print_colored("\n" + "=" * 60 + "\n", Colors.CYAN)
     
-    def save_history(self, filename: Optional[str] = None):
-        """保存对话历史到文件"""
+    def save_history(self, name: Optional[str] = None):
+        """
+        保存对话
+        对话每轮都已自动写入会话日志，这里只设置会话标题；
+        name 以 .json 结尾时额外导出一份完整的 JSON 文件
+        """
         if not self.messages:
             print_colored("❌ 没有对话历史可保存", Colors.RED)
             return
         
-        if filename is None:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"chat_{timestamp}.json"
+        if name is None:
+            print_colored(f"✅ 对话已自动保存: {self.journal.path(self.session_id)}", Colors.GREEN)
+            return
+        
+        if not name.endswith('.json'):
+            self.journal.set_title(self.session_id, name)
+            print_colored(f"✅ 会话标题已设置为: {name}", Colors.GREEN)
+            return
         
-        filepath = self.history_dir / filename
+        filepath = self.history_dir / name
         
         data = {
             'timestamp': datetime.now().isoformat(),
             'config': self.config,
             'messages': self.messages,
-            'total_tokens': self.total_tokens_used
+            'total_tokens': self.usage.total_tokens,
+            'usage': self.usage.to_dict()
         }
         
         with open(filepath, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
         
-        print_colored(f"✅ 对话已保存到: {filepath}", Colors.GREEN)
+        print_colored(f"✅ 对话已导出到: {filepath}", Colors.GREEN)
     
-    def load_history(self, filename: str):
-        """从文件加载对话历史"""
-        filepath = self.history_dir / filename
+    def load_history(self, name: str, last_turns: Optional[int] = None):
+        """
+        加载对话历史
         
-        if not filepath.exists():
-            print_colored(f"❌ 文件不存在: {filepath}", Colors.RED)
-            return
+        Args:
+            name: /list 中的序号、会话ID，或旧版 JSON 文件名
+            last_turns: 只加载最近多少轮，None 表示全部
+        """
+        if name.isdigit():
+            entries = self.journal.recent(10)
+            if not 1 <= int(name) <= len(entries):
+                print_colored(f"❌ 序号超出范围: {name}", Colors.RED)
+                return
+            name = entries[int(name) - 1]['id']
         
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            if name.endswith('.json'):
+                # 旧版 JSON 文件：导入为一个新会话，之后的轮次追加到新会话中
+                filepath = self.history_dir / name
+                if not filepath.exists():
+                    print_colored(f"❌ 文件不存在: {filepath}", Colors.RED)
+                    return
+                with open(filepath, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                messages = data.get('messages', [])
+                if last_turns is not None:
+                    messages = messages[-2 * last_turns:] if last_turns > 0 else []
+                    while messages and messages[0]['role'] != 'user':
+                        messages.pop(0)
+                self.session_id = self.journal.new_session(config=self.config)
+                for message in messages:
+                    self.journal.append(self.session_id, message)
+                self.usage = UsageTotals.from_dict(data.get('usage'))
+            else:
+                # 会话日志：继续追加到同一个会话
+                messages = self.journal.load(name, last_turns=last_turns)
+                self.journal.close()
+                self.session_id = name
+                self.usage = UsageTotals.from_dict((self.journal.get(name) or {}).get('usage'))
             
-            self.messages = data.get('messages', [])
-            self.total_tokens_used = data.get('total_tokens', 0)
+            self.messages = messages
+            self.context.reset()
             
             print_colored(f"✅ 已加载 {len(self.messages)} 条对话记录", Colors.GREEN)
+        except FileNotFoundError:
+            print_colored(f"❌ 会话不存在: {name}", Colors.RED)
         except Exception as e:
             print_colored(f"❌ 加载失败: {e}", Colors.RED)
     
     def list_saved_chats(self):
-        """列出已保存的对话"""
-        files = sorted(self.history_dir.glob("chat_*.json"), reverse=True)
+        """列出最近的会话（读取内存中的索引，不逐个读取历史文件）"""
+        entries = self.journal.recent(10)  # 只显示最近10个
         
-        if not files:
+        if not entries:
             print_colored("📭 没有已保存的对话", Colors.YELLOW)
             return
         
-        print_colored("\n📚 已保存的对话:", Colors.CYAN, bold=True)
-        for i, file in enumerate(files[:10], 1):  # 只显示最近10个
-            size = file.stat().st_size
-            mtime = datetime.fromtimestamp(file.stat().st_mtime)
-            print(f"  {i}. {file.name} ({size} bytes, {mtime.strftime('%Y-%m-%d %H:%M')})")
+        print_colored("\n📚 最近的会话:", Colors.CYAN, bold=True)
+        for i, entry in enumerate(entries, 1):
+            mtime = datetime.fromtimestamp(entry['mtime'])
+            current = " ← 当前" if entry['id'] == self.session_id else ""
+            print(f"  {i}. {entry['title'] or '(无标题)'} "
+                  f"({entry['messages']} 条消息, {mtime.strftime('%Y-%m-%d %H:%M')}) "
+                  f"[{entry['id']}]{current}")
         print()
     
     def show_config(self):
@@ -218,6 +336,38 @@ class SmartChat:
         print_colored("─" * 40, Colors.CYAN)
         for key, value in self.config.items():
             print(f"  {key:15s} = {value}")
+        context = self.context
+        print(f"  {'context':15s} = {context.last_prompt_tokens}/"
+              f"{context.budget(self.config['max_tokens'])} tokens "
+              f"(计数: {context.counter.backend}, 已裁剪 {context.dropped} 条)")
+        print(f"  {'tokens_used':15s} = {self.usage.total_tokens} "
+              f"(prompt {self.usage.prompt_tokens} + completion {self.usage.completion_tokens})")
+        if len(self.client.replicas) > 1:
+            affinity = self.client.replicas.affinity_stats()
+            print(f"  {'replicas':15s} = {len(self.client.replicas)}")
+            print(f"  {'affinity_hit':15s} = {affinity['hit_rate']:.1%} "
+                  f"({affinity['hits']}/{affinity['requests']})")
+        print_colored("─" * 40 + "\n", Colors.CYAN)
+    
+    def show_stats(self):
+        """显示本会话的 token 用量与性能统计"""
+        summary = self.usage.summary()
+        
+        def seconds(value):
+            return f"{value:.2f}s" if value is not None else "-"
+        
+        print_colored("\n📊 会话统计:", Colors.CYAN, bold=True)
+        print_colored("─" * 40, Colors.CYAN)
+        print(f"  {'请求数':12s} {summary['requests']}")
+        print(f"  {'prompt':12s} {summary['prompt_tokens']} tokens "
+              f"(前缀缓存命中 {summary['cached_tokens']}, {summary['prefix_cache_hit_rate']:.1%})")
+        print(f"  {'completion':12s} {summary['completion_tokens']} tokens "
+              f"(被 max_tokens 截断 {summary['truncated']} 次)")
+        print(f"  {'合计':12s} {summary['total_tokens']} tokens")
+        print(f"  {'平均 TTFT':12s} {seconds(summary['avg_ttft'])}")
+        print(f"  {'平均耗时':12s} {seconds(summary['avg_latency'])}")
+        rate = summary['decode_tokens_per_s']
+        print(f"  {'解码速度':12s} {f'{rate:.1f} tok/s' if rate is not None else '-'}")
         print_colored("─" * 40 + "\n", Colors.CYAN)
     
     def update_config(self, key: str, value):
@@ -228,14 +378,20 @@ class SmartChat:
         
         # 类型转换
         try:
-            if key == 'max_tokens':
+            if key in ['max_tokens', 'max_model_len']:
                 value = int(value)
             elif key in ['temperature', 'top_p']:
                 value = float(value)
-            elif key == 'stream':
+            elif key in ['stream', 'keep_reasoning']:
                 value = value.lower() in ['true', '1', 'yes', 'on']
+            elif key == 'reasoning' and value not in REASONING_MODES:
+                raise ValueError(f"reasoning 只能是 {' / '.join(REASONING_MODES)}")
             
             self.config[key] = value
+            if key == 'max_model_len':
+                self.context.max_model_len = value
+            elif key == 'reasoning':
+                self.renderer.reasoning_mode = value
             print_colored(f"✅ 已更新: {key} = {value}", Colors.GREEN)
         except ValueError as e:
             print_colored(f"❌ 无效的值: {e}", Colors.RED)
@@ -245,44 +401,113 @@ class SmartChat:
         self.add_message("user", user_input)
         
         try:
-            if self.config['stream'] and self.config['backend'] == 'openai':
+            # 按 token 预算裁剪最早的轮次（完整历史仍保留在 self.messages 中）
+            messages = self.context.fit(self.messages, self.config['max_tokens'])
+            
+            if self.config['stream']:
                 # 流式输出
                 print_colored("\n🤖 助手: ", Colors.BRIGHT_GREEN, bold=True)
                 
-                response_text = ""
-                for chunk in self.client.chat_stream_with_history(
-                    self.messages,
+                stream = self.client.chat_stream_with_history(
+                    messages,
                     max_tokens=self.config['max_tokens'],
                     temperature=self.config['temperature'],
                     top_p=self.config['top_p']
-                ):
-                    print(chunk, end="", flush=True)
-                    response_text += chunk
+                )
+                # 按帧率合并写终端，并显示实时 TTFT / tokens/s；思考过程按配置显示或折叠
+                response_text = self.renderer.render(stream)
+                print()
                 
-                print("\n")
-                self.add_message("assistant", response_text)
+                self.last_reasoning = self.renderer.reasoning
+                self.add_message("assistant", self._history_content(response_text))
+                self._record_turn(stream.meta)
                 return response_text
             else:
                 # 非流式输出
                 response = self.client.chat_with_history(
-                    self.messages,
+                    messages,
                     max_tokens=self.config['max_tokens'],
                     temperature=self.config['temperature'],
                     top_p=self.config['top_p']
                 )
                 
-                self.add_message("assistant", response)
-                return response
+                self.last_reasoning, answer = split_reasoning(response)
+                self.add_message("assistant", self._history_content(answer))
+                self._record_turn(response.meta)
+                return answer
         
         except Exception as e:
             print_colored(f"\n❌ 错误: {e}", Colors.RED)
             # 移除失败的用户消息
             self.messages.pop()
+            # 缓存的连接检查结果可能已经失效，下次启动时重新检查
+            self.connection.invalidate()
             return ""
     
+    def _history_content(self, answer: str) -> str:
+        """
+        写入历史的回复内容
+        默认只保存回答：思考过程往往比回答长数倍，留在历史里之后每轮都要重新 prefill
+        """
+        if self.config['keep_reasoning'] and self.last_reasoning:
+            return f"<think>\n{self.last_reasoning}\n</think>\n\n{answer}"
+        return answer
+    
+    def show_reasoning(self, brief: bool = False):
+        """
+        显示上一轮的思考过程
+        
+        Args:
+            brief: 按 reasoning 配置显示（非流式输出时在回答前调用）；False 时总是完整显示
+        """
+        if not self.last_reasoning:
+            if not brief:
+                print_colored("📭 上一轮没有思考过程", Colors.YELLOW)
+            return
+        
+        mode = self.config['reasoning'] if brief else 'show'
+        if mode == 'show':
+            print_colored(f"💭 {self.last_reasoning}\n", Colors.DIM)
+        elif mode == 'collapse':
+            print_colored(f"💭 已折叠思考过程（{len(self.last_reasoning)} 字），/think 查看", Colors.DIM)
+    
+    def _record_turn(self, meta: ChatMeta):
+        """计入本轮用量，显示用量摘要，并把用户消息和回复追加到会话日志"""
+        self.usage.add(meta)
+        
+        line = f"{meta.prompt_tokens} → {meta.completion_tokens} tokens"
+        if meta.cached_tokens:
+            line += f" (缓存 {meta.cached_tokens})"
+        if meta.ttft is not None:
+            line += f" · TTFT {meta.ttft:.2f}s"
+        line += f" · {meta.decode_tokens_per_s:.1f} tok/s · {meta.latency:.1f}s"
+        if meta.from_cache:
+            line = "命中本地响应缓存"
+        print_colored(line, Colors.DIM)
+        if meta.finish_reason == 'length':
+            print_colored("⚠️  回复达到 max_tokens 上限被截断，可用 /config max_tokens 调大", Colors.YELLOW)
+        print()
+        
+        user, assistant = self.messages[-2:]
+        try:
+            self.journal.append(self.session_id, user, tokens=meta.prompt_tokens)
+            # 思考过程只随元数据保存在日志中，加载会话时不会进入上下文
+            record_meta = meta.to_dict()
+            if self.last_reasoning:
+                record_meta['reasoning'] = self.last_reasoning
+            self.journal.append(
+                self.session_id, assistant,
+                tokens=meta.completion_tokens,
+                meta=record_meta,
+                usage=self.usage.to_dict()
+            )
+        except OSError as e:
+            print_colored(f"⚠️  自动保存失败: {e}", Colors.YELLOW)
+    
     def close(self):
-        """关闭客户端"""
-        self.client.close()
+        """关闭客户端（不等待仍在进行的连接检查）"""
+        self.connection.close()
+        self.journal.close()
 
 
 # ============ 命令处理 ============
@@ -299,12 +524,15 @@ def show_help():
   /history        显示完整对话历史
 
 历史管理:
-  /save [文件名]  保存对话到文件（默认自动命名）
-  /load <文件名>  加载对话历史
-  /list           列出已保存的对话
+  /save [标题]            对话每轮自动保存；给出标题时设置会话标题，
+                          以 .json 结尾时导出完整 JSON 文件
+  /load <序号|会话ID> [N] 加载会话（序号见 /list），N 表示只加载最近 N 轮
+  /list                   列出最近的会话
 
 配置管理:
   /config                     查看当前配置
+  /stats                      查看本会话的 token 用量、TTFT 与解码速度
+  /think                      查看上一轮的完整思考过程
   /config <参数> <值>         修改配置参数
   /stream                     切换流式输出模式
 
@@ -313,18 +541,21 @@ def show_help():
   temperature     温度参数 0-2 (默认: 0.7)
   top_p           top_p采样 0-1 (默认: 0.95)
   stream          流式输出 true/false (默认: false)
+  max_model_len   上下文长度，超出时自动裁剪最早的轮次 (默认: 4096)
+  reasoning       思考过程 show/collapse/hide (默认: collapse)
+  keep_reasoning  思考过程写入历史 true/false (默认: false)
 
 示例:
   /config max_tokens 1000     设置最大token数为1000
   /config temperature 0.5     设置温度为0.5
-  /save my_chat.json          保存对话
-  /load my_chat.json          加载对话
+  /save 感冒用药咨询          设置会话标题
+  /load 1 20                  加载最近一个会话的最后 20 轮
 
 使用技巧:
   • 直接输入文本即可开始对话
   • 支持多轮对话，自动维护上下文
   • 使用 Ctrl+C 可以中断当前输出
-  • 流式输出需要 OpenAI 后端支持
+  • requests / openai 两种后端均支持流式输出
 """
     print_colored(help_text, Colors.CYAN)
 
@@ -374,10 +605,14 @@ def process_command(chat: SmartChat, command: str) -> bool:
         chat.save_history(filename)
     
     elif cmd == '/load':
-        if not args:
-            print_colored("❌ 请指定文件名: /load <文件名>", Colors.RED)
+        parts = args.split()
+        if not parts:
+            print_colored("❌ 请指定会话: /load <序号|会话ID> [N]", Colors.RED)
+        elif len(parts) > 1 and not parts[-1].isdigit():
+            print_colored("❌ 轮数必须是整数: /load <序号|会话ID> [N]", Colors.RED)
         else:
-            chat.load_history(args)
+            last_turns = int(parts[1]) if len(parts) > 1 else None
+            chat.load_history(parts[0], last_turns)
     
     elif cmd == '/list':
         chat.list_saved_chats()
@@ -393,14 +628,17 @@ def process_command(chat: SmartChat, command: str) -> bool:
                 key, value = config_parts
                 chat.update_config(key, value)
     
+    elif cmd == '/stats':
+        chat.show_stats()
+    
+    elif cmd == '/think':
+        chat.show_reasoning()
+    
     elif cmd == '/stream':
         current = chat.config['stream']
         chat.config['stream'] = not current
         status = "开启" if chat.config['stream'] else "关闭"
         print_colored(f"✅ 流式输出已{status}", Colors.GREEN)
-        
-        if chat.config['stream'] and chat.config['backend'] != 'openai':
-            print_colored("⚠️  警告: 流式输出需要 OpenAI 后端", Colors.YELLOW)
     
     else:
         print_colored(f"❌ 未知命令: {cmd}", Colors.RED)
@@ -415,33 +653,31 @@ def main():
     """主函数"""
     show_welcome()
     
-    # 初始化对话管理器
+    # 初始化对话管理器（客户端创建与连接检查在后台进行，不等待即可开始输入）
     try:
-        print_colored("🔄 正在连接 vLLM 服务...", Colors.YELLOW)
         chat = SmartChat(
             base_url="http://localhost:9000",
             api_key="muyu",
             model="Medical_Qwen3_8B_Large_Language_Model",
-            backend='openai'  # 使用 openai 后端支持流式输出
+            backend='openai',
+            model_dir="/root/autodl-tmp/vllm/zpeng1989/Medical_Qwen3_8B_Large_Language_Model",
+            max_model_len=4096
         )
-        
-        # 测试连接
-        models = chat.client.get_models()
-        print_colored(f"✅ 连接成功！当前模型: {models[0]}", Colors.GREEN)
-        print_colored("💬 流式输出: 已开启", Colors.GREEN)
-        print_colored("─" * 60 + "\n", Colors.CYAN)
-        
     except Exception as e:
-        print_colored(f"\n❌ 连接失败: {e}", Colors.RED)
-        print_colored("\n请确保:", Colors.YELLOW)
-        print_colored("  1. vLLM 服务已启动", Colors.YELLOW)
-        print_colored("  2. SSH 隧道已建立（如需要）", Colors.YELLOW)
-        print_colored("  3. 端口 9000 可访问", Colors.YELLOW)
+        print_colored(f"\n❌ 初始化失败: {e}", Colors.RED)
         return
     
+    if not chat.report_connection():
+        print_colored("🔄 正在后台连接 vLLM 服务，可以直接输入...", Colors.YELLOW)
+    print_colored("💬 流式输出: 已开启", Colors.GREEN)
+    print_colored("─" * 60 + "\n", Colors.CYAN)
+    
     # 主循环
     try:
         while True:
+            # 后台连接检查完成后，在下一个提示符之前显示结果
+            chat.report_connection()
+            
             # 获取用户输入
             try:
                 user_input = input(f"{Colors.BRIGHT_BLUE}👤 你: {Colors.RESET}").strip()
@@ -458,9 +694,10 @@ def main():
                     break
                 continue
             
-            # 普通对话
+            # 普通对话（检查尚未完成时这里等待，失败时先显示排查提示）
+            chat.report_connection(wait=True)
             try:
-                if chat.config['stream'] and chat.config['backend'] == 'openai':
+                if chat.config['stream']:
                     # 流式输出已在 chat 方法中处理
                     chat.chat(user_input)
                 else:
@@ -468,6 +705,7 @@ def main():
                     response = chat.chat(user_input)
                     if response:
                         print_colored("\n🤖 助手: ", Colors.BRIGHT_GREEN, bold=True)
+                        chat.show_reasoning(brief=True)
                         print(f"{response}\n")
             
             except KeyboardInterrupt:
@@ -0,0 +1,314 @@
+"""
+vLLM 离线批量推理 - 流式读取 JSONL、分块调用 LLM.generate、断点续跑
+
+适合上百万条 prompt 的离线任务：
+    - 按块（默认 256 条）从输入 JSONL 读取 prompt，一块调用一次 llm.generate，
+      由 vLLM 在块内做连续批处理；内存占用只与块大小有关，与输入文件大小无关
+    - 每块结束后立即把结果逐行写入输出 JSONL（文本、token 数、finish_reason）
+    - 每块写完并落盘后更新检查点（输入文件的字节偏移 + 输出文件的长度），
+      进程崩溃或被抢占后用同样的命令重新运行即可从上次完成的块继续；
+      检查点之后写了一半的输出会被截掉，不会重复或丢失
+    - 推理引擎只需要提供 generate(prompts, sampling_params)，--stub 使用不依赖 GPU 的回显引擎，
+      可以在没有 GPU 的机器上验证整条流水线
+
+输入格式（每行一个 JSON 对象）:
+    {"id": "q1", "prompt": "你好，请介绍一下你自己。"}
+    id 可省略，默认使用行号
+
+输出格式:
+    {"id": "q1", "text": "...", "prompt_tokens": 12, "completion_tokens": 256, "finish_reason": "stop"}
+
+使用方法:
+    python batch_generate.py --model /root/autodl-tmp/vllm/Qwen/Qwen3-4B \\
+        --input prompts.jsonl --output outputs.jsonl --max-tokens 512
+
+    # 不加载模型，验证读写与断点续跑
+    python batch_generate.py --stub --input prompts.jsonl --output outputs.jsonl
+"""
+
+import argparse
+import json
+import os
+import time
+from itertools import islice
+from pathlib import Path
+from types import SimpleNamespace
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+
+# ============ 推理引擎 ============
+
+class StubLLM:
+    """
+    不依赖 GPU 的回显引擎，返回与 vLLM RequestOutput 结构相同的对象
+    （prompt、prompt_token_ids、outputs[0].text / token_ids / finish_reason）
+    """
+
+    def generate(self, prompts: List[str], sampling_params=None, use_tqdm: bool = False):
+        max_tokens = getattr(sampling_params, 'max_tokens', None) or 16
+        outputs = []
+        for prompt in prompts:
+            tokens = prompt.split()[:max_tokens]
+            outputs.append(SimpleNamespace(
+                prompt=prompt,
+                prompt_token_ids=list(range(len(prompt.split()))),
+                outputs=[SimpleNamespace(
+                    text=" ".join(tokens),
+                    token_ids=list(range(len(tokens))),
+                    finish_reason="length" if len(prompt.split()) > max_tokens else "stop",
+                )],
+            ))
+        return outputs
+
+
+def load_engine(args: argparse.Namespace):
+    """
+    创建推理引擎与采样参数
+
+    Returns:
+        (llm, sampling_params)
+    """
+    sampling = dict(
+        temperature=args.temperature,
+        top_p=args.top_p,
+        max_tokens=args.max_tokens,
+        skip_special_tokens=True,
+    )
+    if args.stub:
+        return StubLLM(), SimpleNamespace(**sampling)
+
+    from vllm import LLM, SamplingParams
+    llm = LLM(
+        model=args.model,
+        trust_remote_code=True,
+        max_model_len=args.max_model_len,
+        gpu_memory_utilization=args.gpu_memory_utilization,
+    )
+    return llm, SamplingParams(**sampling)
+
+
+# ============ 检查点 ============
+
+class Checkpoint:
+    """
+    断点信息：已处理到输入文件的哪个字节、输出文件写到多长
+    保存在 <输出文件>.ckpt，先写临时文件再原子替换
+    """
+
+    def __init__(self, output_path: Path):
+        self.path = output_path.with_name(output_path.name + '.ckpt')
+        self.input = ''
+        self.input_offset = 0       # 下一块从输入文件的这个字节开始读
+        self.output_offset = 0      # 输出文件中已确认完成的长度
+        self.records = 0            # 已完成的 prompt 数
+        self.line_no = 0            # 已读取的输入行数（用于默认 id）
+
+    def load(self) -> bool:
+        """读取已有检查点；不存在时返回 False"""
+        if not self.path.exists():
+            return False
+        data = json.loads(self.path.read_text(encoding='utf-8'))
+        for key in ('input', 'input_offset', 'output_offset', 'records', 'line_no'):
+            setattr(self, key, data[key])
+        return True
+
+    def save(self):
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        data = {
+            'input': self.input,
+            'input_offset': self.input_offset,
+            'output_offset': self.output_offset,
+            'records': self.records,
+            'line_no': self.line_no,
+            'updated': time.time(),
+        }
+        tmp_path.write_text(json.dumps(data), encoding='utf-8')
+        os.replace(tmp_path, self.path)
+
+
+# ============ 读取与写出 ============
+
+def read_chunk(
+    f: BinaryIO,
+    chunk_size: int,
+    line_no: int,
+    prompt_field: str = 'prompt'
+) -> Tuple[List[Dict], int, int]:
+    """
+    从输入文件当前位置读取一块 prompt
+
+    Returns:
+        (记录列表 [{"id", "prompt"}], 读取的行数, 跳过的无效行数（JSON 或编码错误、prompt 缺失或不是字符串）)
+        读取的行数为 0 表示文件已读完
+    """
+    records = []
+    lines = 0
+    skipped = 0
+    for raw in islice(f, chunk_size):
+        lines += 1
+        if not raw.strip():
+            continue
+        try:
+            item = json.loads(raw)
+            prompt = item[prompt_field]
+        except (ValueError, KeyError, TypeError):
+            # ValueError 包括 JSON 格式错误与非 UTF-8 字节（UnicodeDecodeError）
+            skipped += 1
+            continue
+        if not isinstance(prompt, str):
+            skipped += 1    # 一条无效记录不能让整块 generate 失败
+            continue
+        records.append({'id': item.get('id', line_no + lines), 'prompt': prompt})
+    return records, lines, skipped
+
+
+def to_record(item: Dict, output) -> Dict:
+    """把一个 RequestOutput 转换为输出 JSONL 的一行"""
+    completion = output.outputs[0]
+    return {
+        'id': item['id'],
+        'text': completion.text,
+        'prompt_tokens': len(output.prompt_token_ids or []),
+        'completion_tokens': len(completion.token_ids),
+        'finish_reason': completion.finish_reason,
+    }
+
+
+# ============ 主流程 ============
+
+def run(
+    llm,
+    sampling_params,
+    input_path: Path,
+    output_path: Path,
+    chunk_size: int = 256,
+    prompt_field: str = 'prompt',
+    restart: bool = False,
+    limit: Optional[int] = None
+) -> Dict:
+    """
+    批量推理主循环
+
+    Args:
+        llm: 推理引擎（vllm.LLM 或 StubLLM）
+        sampling_params: 采样参数
+        input_path: 输入 JSONL
+        output_path: 输出 JSONL
+        chunk_size: 每次调用 generate 的 prompt 数
+        prompt_field: 输入中 prompt 所在的字段名
+        restart: 忽略已有检查点，从头开始
+        limit: 本次运行最多处理多少块（用于分段运行或测试），None 表示直到读完
+
+    Returns:
+        本次运行的统计
+    """
+    checkpoint = Checkpoint(output_path)
+    resumed = not restart and checkpoint.load()
+    if resumed and checkpoint.input != str(input_path.resolve()):
+        raise ValueError(
+            f"检查点对应的输入文件是 {checkpoint.input}，与本次输入不同；"
+            f"如需重新开始请加 --restart"
+        )
+    if not resumed:
+        if not restart and output_path.exists() and output_path.stat().st_size > 0:
+            raise ValueError(f"输出文件 {output_path} 已存在且没有检查点；如需覆盖请加 --restart")
+        checkpoint = Checkpoint(output_path)
+        checkpoint.input = str(input_path.resolve())
+
+    stats = {'prompts': 0, 'completion_tokens': 0, 'skipped': 0, 'generate_time': 0.0}
+    start = time.perf_counter()
+
+    with open(input_path, 'rb') as fin, open(output_path, 'ab') as fout:
+        # 截掉检查点之后未确认的输出（上次运行在块中途退出时留下的）
+        fout.truncate(checkpoint.output_offset)
+        fout.seek(checkpoint.output_offset)
+        fin.seek(checkpoint.input_offset)
+        if resumed:
+            print(f"从检查点继续：已完成 {checkpoint.records} 条")
+
+        chunks = 0
+        while limit is None or chunks < limit:
+            records, lines, skipped = read_chunk(
+                fin, chunk_size, checkpoint.line_no, prompt_field
+            )
+            if lines == 0:
+                break
+            stats['skipped'] += skipped
+
+            if records:
+                t0 = time.perf_counter()
+                outputs = llm.generate(
+                    [r['prompt'] for r in records], sampling_params, use_tqdm=False
+                )
+                stats['generate_time'] += time.perf_counter() - t0
+
+                buffer = []
+                for item, output in zip(records, outputs):
+                    record = to_record(item, output)
+                    stats['completion_tokens'] += record['completion_tokens']
+                    buffer.append(json.dumps(record, ensure_ascii=False))
+                fout.write(('\n'.join(buffer) + '\n').encode('utf-8'))
+                fout.flush()
+                os.fsync(fout.fileno())
+
+            # 输出落盘后才推进检查点
+            checkpoint.input_offset = fin.tell()
+            checkpoint.output_offset = fout.tell()
+            checkpoint.line_no += lines
+            checkpoint.records += len(records)
+            checkpoint.save()
+            stats['prompts'] += len(records)
+            chunks += 1
+
+            elapsed = time.perf_counter() - start
+            print(f"已完成 {checkpoint.records} 条 | 本次 {stats['prompts']} 条, "
+                  f"{stats['completion_tokens'] / max(elapsed, 1e-9):.1f} tok/s, "
+                  f"{elapsed:.1f}s", flush=True)
+
+    stats['elapsed'] = time.perf_counter() - start
+    stats['total_records'] = checkpoint.records
+    return stats
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="vLLM 离线批量推理（JSONL 输入输出，断点续跑）")
+    parser.add_argument("--model", help="本地模型目录（--stub 时可省略）")
+    parser.add_argument("--input", required=True, help="输入 JSONL，每行包含 prompt 字段")
+    parser.add_argument("--output", required=True, help="输出 JSONL")
+    parser.add_argument("--prompt-field", default="prompt")
+    parser.add_argument("--chunk-size", type=int, default=256, help="每次调用 generate 的 prompt 数")
+    parser.add_argument("--max-model-len", type=int, default=4096)
+    parser.add_argument("--gpu-memory-utilization", type=float, default=0.8)
+    parser.add_argument("--temperature", type=float, default=0.6)
+    parser.add_argument("--top-p", type=float, default=0.9)
+    parser.add_argument("--max-tokens", type=int, default=512)
+    parser.add_argument("--restart", action="store_true", help="忽略检查点，清空输出后从头开始")
+    parser.add_argument("--stub", action="store_true", help="使用回显引擎（不加载模型，用于测试）")
+    args = parser.parse_args()
+    if not args.stub and not args.model:
+        parser.error("需要 --model（或使用 --stub）")
+    return args
+
+
+def main():
+    args = parse_args()
+    llm, sampling_params = load_engine(args)
+    stats = run(
+        llm,
+        sampling_params,
+        Path(args.input),
+        Path(args.output),
+        chunk_size=args.chunk_size,
+        prompt_field=args.prompt_field,
+        restart=args.restart,
+    )
+    print("\n" + "=" * 50)
+    print(f"本次处理: {stats['prompts']} 条（跳过无效行 {stats['skipped']} 条），"
+          f"累计 {stats['total_records']} 条")
+    print(f"生成 tokens: {stats['completion_tokens']}，"
+          f"generate 耗时 {stats['generate_time']:.1f}s，总耗时 {stats['elapsed']:.1f}s")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    main()
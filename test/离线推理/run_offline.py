@@ -0,0 +1,255 @@
+"""
+vLLM 离线推理统一入口 - 按模型配置文件（YAML / TOML）运行
+
+每个模型一个配置文件（见 profiles/），包含:
+    model       本地模型目录
+    engine      传给 vllm.LLM(...) 的参数（max_model_len、gpu_memory_utilization 等）
+    sampling    传给 vllm.SamplingParams(...) 的参数
+    prompt      拼接在每条 prompt 前后的内容（例如 DeepSeek-R1 的 "<think>\\n"）
+    prompts     命令行没有给出 prompt 时使用的默认 prompt
+
+一次运行可以传入任意多条 prompt，全部放进同一次 llm.generate 调用，由 vLLM 批量处理，
+而不是每条 prompt 启动一次进程、加载一次模型。结束时输出模型加载耗时、生成耗时与 tokens/s。
+
+推理模型的输出按 </think> 拆分为思考过程与回答分别显示（suffix 以 <think> 结尾时，
+输出从思考过程开始），--output-json 中同时保存 reasoning 与 answer。
+
+使用方法:
+    python run_offline.py profiles/qwen3-4b.yaml
+    python run_offline.py profiles/qwen3-8b-yiliao.yaml "高血压患者饮食要注意什么？" "感冒了能吃头孢吗？"
+    python run_offline.py profiles/deepseek-r1-1.5b-think.yaml --prompts-file questions.txt
+    python run_offline.py profiles/qwen3-4b.yaml --set sampling.max_tokens=512 --set engine.gpu_memory_utilization=0.6
+
+    # 大规模离线任务（断点续跑、流式读写）使用 batch_generate.py
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+from batch_generate import StubLLM
+
+OPEN_TAG = '<think>'
+CLOSE_TAG = '</think>'
+
+
+# ============ 配置文件 ============
+
+def load_profile(path: Path) -> Dict:
+    """读取模型配置（.yaml / .yml 或 .toml）"""
+    if path.suffix == '.toml':
+        import tomllib
+        with open(path, 'rb') as f:
+            profile = tomllib.load(f)
+    else:
+        import yaml
+        with open(path, 'r', encoding='utf-8') as f:
+            profile = yaml.safe_load(f) or {}
+    if 'model' not in profile:
+        raise ValueError(f"配置文件 {path} 缺少 model 字段")
+    profile.setdefault('engine', {})
+    profile.setdefault('sampling', {})
+    profile.setdefault('prompt', {})
+    profile.setdefault('prompts', [])
+    return profile
+
+
+def apply_overrides(profile: Dict, overrides: List[str]):
+    """
+    应用命令行覆盖项
+
+    Args:
+        overrides: ["sampling.max_tokens=512", "engine.gpu_memory_utilization=0.6", ...]
+            值按 JSON 解析（数字、true/false），解析失败时当作字符串
+    """
+    for item in overrides:
+        key, sep, raw = item.partition('=')
+        if not sep:
+            raise ValueError(f"覆盖项格式应为 key=value: {item}")
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            value = raw
+        target = profile
+        *parents, leaf = key.split('.')
+        for name in parents:
+            target = target.setdefault(name, {})
+        target[leaf] = value
+
+
+def read_prompts(path: Path) -> List[str]:
+    """读取 prompt 文件：.jsonl 取每行的 prompt 字段，其他格式每行一条"""
+    prompts = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            prompts.append(json.loads(line)['prompt'] if path.suffix == '.jsonl' else line)
+    return prompts
+
+
+# ============ 输出拆分 ============
+
+def split_reasoning(text: str, start_in_reasoning: bool = False) -> Tuple[str, str]:
+    """
+    把完整输出拆分为思考过程与回答（规则与 在线推理/reasoning.py 相同，离线只需处理完整文本）
+
+    Args:
+        start_in_reasoning: 输出是否从思考过程开始（提示词末尾已有 <think>）
+
+    Returns:
+        (思考过程, 回答)；没有思考标签时思考过程为空字符串
+    """
+    head = ''
+    if not start_in_reasoning:
+        before, sep, rest = text.partition(OPEN_TAG)
+        if sep and CLOSE_TAG not in before:
+            head, text = before, rest
+        elif CLOSE_TAG not in text:
+            return '', text.strip()
+    # 没有 </think> 时输出在思考中途截断，全部归入思考过程
+    reasoning, _, tail = text.partition(CLOSE_TAG)
+    return reasoning.strip(), (head + tail.lstrip()).strip()
+
+
+# ============ 运行 ============
+
+def build_engine(profile: Dict, stub: bool = False) -> Tuple[object, object]:
+    """
+    按配置创建推理引擎与采样参数
+
+    Returns:
+        (llm, sampling_params)
+    """
+    if stub:
+        return StubLLM(), SimpleNamespace(**profile['sampling'])
+
+    from vllm import LLM, SamplingParams
+    llm = LLM(model=profile['model'], **profile['engine'])
+    return llm, SamplingParams(**profile['sampling'])
+
+
+def run(profile: Dict, prompts: List[str], stub: bool = False, show: bool = True) -> Dict:
+    """
+    加载模型并对全部 prompt 执行一次批量生成
+
+    Args:
+        profile: 模型配置
+        prompts: 原始 prompt（会拼接配置中的 prefix / suffix）
+        stub: 使用回显引擎（不加载模型）
+        show: 是否打印每条生成结果
+
+    Returns:
+        运行统计与各条结果
+    """
+    prefix = profile['prompt'].get('prefix', '')
+    suffix = profile['prompt'].get('suffix', '')
+    full_prompts = [f"{prefix}{p}{suffix}" for p in prompts]
+    # 提示词末尾已强制加入 <think> 时，输出从思考过程开始
+    think_start = suffix.rstrip().endswith('<think>')
+
+    t0 = time.perf_counter()
+    llm, sampling_params = build_engine(profile, stub)
+    load_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    outputs = llm.generate(full_prompts, sampling_params)
+    generate_time = time.perf_counter() - t0
+
+    results = []
+    for prompt, output in zip(prompts, outputs):
+        completion = output.outputs[0]
+        reasoning, answer = split_reasoning(completion.text, think_start)
+        results.append({
+            'prompt': prompt,
+            'text': completion.text,
+            'reasoning': reasoning,
+            'answer': answer,
+            'prompt_tokens': len(output.prompt_token_ids or []),
+            'completion_tokens': len(completion.token_ids),
+            'finish_reason': completion.finish_reason,
+        })
+        if show:
+            print(f"提示词: {prompt}")
+            if reasoning:
+                print(f"思考过程: {reasoning}")
+                print(f"回答: {answer}")
+            else:
+                print(f"生成结果: {completion.text}")
+            print(f"生成 tokens 数: {len(completion.token_ids)}")
+            print(f"结束原因: {completion.finish_reason}")
+            print("-" * 50)
+
+    prompt_tokens = sum(r['prompt_tokens'] for r in results)
+    completion_tokens = sum(r['completion_tokens'] for r in results)
+    return {
+        'model': profile['model'],
+        'prompts': len(results),
+        'load_time': load_time,
+        'generate_time': generate_time,
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'output_tokens_per_s': completion_tokens / generate_time if generate_time > 0 else 0.0,
+        'total_tokens_per_s':
+            (prompt_tokens + completion_tokens) / generate_time if generate_time > 0 else 0.0,
+        'results': results,
+    }
+
+
+def print_report(stats: Dict):
+    print("\n" + "=" * 50)
+    print(f"模型: {stats['model']}")
+    print(f"prompt 数: {stats['prompts']}")
+    print(f"模型加载耗时: {stats['load_time']:.1f}s")
+    print(f"生成耗时: {stats['generate_time']:.2f}s")
+    print(f"tokens: 输入 {stats['prompt_tokens']} / 输出 {stats['completion_tokens']}")
+    print(f"输出吞吐: {stats['output_tokens_per_s']:.1f} tok/s "
+          f"(含输入 {stats['total_tokens_per_s']:.1f} tok/s)")
+    print("=" * 50)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="按模型配置文件运行 vLLM 离线推理")
+    parser.add_argument("profile", help="模型配置文件（.yaml / .toml），见 profiles/")
+    parser.add_argument("prompts", nargs="*", help="prompt，可以给出多条；不给出时使用配置中的 prompts")
+    parser.add_argument("--prompts-file", help="prompt 文件：.jsonl 取 prompt 字段，其他格式每行一条")
+    parser.add_argument("--set", dest="overrides", action="append", default=[],
+                        metavar="KEY=VALUE", help="覆盖配置项，例如 sampling.max_tokens=512")
+    parser.add_argument("--output-json", help="把统计与全部结果写入 JSON 文件")
+    parser.add_argument("--quiet", action="store_true", help="不打印每条生成结果")
+    parser.add_argument("--stub", action="store_true", help="使用回显引擎（不加载模型，用于测试）")
+    return parser.parse_intermixed_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    profile = load_profile(Path(args.profile))
+    apply_overrides(profile, args.overrides)
+
+    prompts = list(args.prompts)
+    if args.prompts_file:
+        prompts += read_prompts(Path(args.prompts_file))
+    if not prompts:
+        prompts = list(profile['prompts'])
+    if not prompts:
+        raise SystemExit("没有 prompt：请在命令行、--prompts-file 或配置文件的 prompts 中给出")
+
+    print("\n" + "=" * 50)
+    print(f"开始推理测试...（{len(prompts)} 条 prompt，一次 generate）")
+    print("=" * 50 + "\n")
+
+    stats = run(profile, prompts, stub=args.stub, show=not args.quiet)
+    print_report(stats)
+
+    if args.output_json:
+        with open(args.output_json, 'w', encoding='utf-8') as f:
+            json.dump(stats, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入: {args.output_json}")
+
+
+if __name__ == "__main__":
+    main()
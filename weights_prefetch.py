@@ -0,0 +1,351 @@
+"""
+模型权重预热 - 把 safetensors 分片并行读入 page cache，缩短 LLM(...) / vllm serve 的冷启动
+
+数据盘（/root/autodl-tmp/...）上的模型第一次加载时，大部分时间花在从冷的 page cache 读取
+safetensors 分片。vLLM 通过 mmap 读取权重，只要分片已经在 page cache 中，加载就只剩内存拷贝。
+本脚本在切换模型前预先把分片读进 page cache:
+
+    - 每个分片 mmap 后 madvise(MADV_SEQUENTIAL)，按顺序读取的预读窗口更大
+    - 分片按 chunk 切块，多个线程并行用 madvise(MADV_POPULATE_READ) 把页读入并建立映射
+      （内核低于 5.14 不支持时改用 pread 读取，效果相同），系统调用期间不持有 GIL；
+      读取每一块之前先对下一块发出 posix_fadvise(WILLNEED)，让磁盘 I/O 与当前块的处理重叠
+    - 输出读取速度（GB/s）与预热前后驻留在 page cache 中的比例（mincore）
+
+--check 只报告模型有多少已经在 page cache 中，不读取数据；--evict 把模型移出 page cache，
+用于测量冷启动。模型大于可用内存时，先读入的页会被后读入的页挤出，预热效果有限。
+
+使用方法:
+    python weights_prefetch.py /root/autodl-tmp/vllm/zpeng1989/Medical_Qwen3_8B_Large_Language_Model
+    python weights_prefetch.py /root/autodl-tmp/vllm/Qwen/Qwen3-4B --check
+    python weights_prefetch.py <模型目录> --jobs 16 --chunk-mib 64 --json
+
+    # 预热完成后再切换服务端模型
+    python weights_prefetch.py <新模型目录> && vllm serve <新模型目录> ...
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import json
+import mmap
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+GiB = 1024 ** 3
+PAGE_SIZE = mmap.PAGESIZE
+MADV_POPULATE_READ = 22             # Linux 5.14+
+DEFAULT_PATTERNS = ('*.safetensors',)
+_LOW_BIT = bytes(i & 1 for i in range(256))
+
+
+# ============ libc 调用 ============
+
+class _Libc:
+    """通过 ctypes 调用 mmap / madvise / mincore（ctypes 调用期间释放 GIL，多线程可以并行）"""
+
+    MAP_FAILED = ctypes.c_void_p(-1).value
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.mmap = libc.mmap
+        self.mmap.restype = ctypes.c_void_p
+        self.mmap.argtypes = (ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int,
+                              ctypes.c_int, ctypes.c_int, ctypes.c_long)
+        self.munmap = libc.munmap
+        self.munmap.argtypes = (ctypes.c_void_p, ctypes.c_size_t)
+        self.madvise = libc.madvise
+        self.madvise.argtypes = (ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int)
+        self.mincore = libc.mincore
+        self.mincore.argtypes = (ctypes.c_void_p, ctypes.c_size_t, ctypes.POINTER(ctypes.c_ubyte))
+
+    def map(self, fd: int, size: int) -> int:
+        """只读共享映射整个文件，返回地址"""
+        address = self.mmap(None, size, mmap.PROT_READ, mmap.MAP_SHARED, fd, 0)
+        if address in (None, self.MAP_FAILED):
+            raise OSError(ctypes.get_errno(), "mmap 失败")
+        return address
+
+
+_libc: Optional[_Libc] = None
+
+
+def _get_libc() -> Optional[_Libc]:
+    """Linux 以外的平台（或找不到 libc）返回 None，此时只能用 pread 预热、无法检查驻留"""
+    global _libc
+    if _libc is None and hasattr(os, 'posix_fadvise'):
+        try:
+            _libc = _Libc()
+        except (OSError, AttributeError, TypeError):
+            return None
+    return _libc
+
+
+# ============ 驻留检查 ============
+
+def resident_bytes(path: Path) -> Optional[int]:
+    """
+    文件当前驻留在 page cache 中的字节数（mincore），不读取文件内容
+
+    Returns:
+        字节数；平台不支持时返回 None
+    """
+    libc = _get_libc()
+    size = path.stat().st_size
+    if libc is None:
+        return None
+    if size == 0:
+        return 0
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        address = libc.map(fd, size)
+        try:
+            pages = (size + PAGE_SIZE - 1) // PAGE_SIZE
+            vector = (ctypes.c_ubyte * pages)()
+            if libc.mincore(address, size, vector) != 0:
+                raise OSError(ctypes.get_errno(), f"mincore 失败: {path}")
+            # 每页一个字节，最低位表示是否驻留
+            resident = bytes(vector).translate(_LOW_BIT).count(1)
+        finally:
+            libc.munmap(address, size)
+    finally:
+        os.close(fd)
+    return min(size, resident * PAGE_SIZE)
+
+
+def evict(path: Path):
+    """把文件移出 page cache（POSIX_FADV_DONTNEED，只影响未被修改的干净页）"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+# ============ 预热 ============
+
+@dataclass
+class ShardReport:
+    """单个分片的预热结果"""
+    path: str
+    size: int
+    resident_before: Optional[int] = None
+    resident_after: Optional[int] = None
+    seconds: float = 0.0
+
+
+class _Shard:
+    """打开并映射好的分片，供多个线程分块预热"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.size = path.stat().st_size
+        self.fd = os.open(path, os.O_RDONLY)
+        self.address: Optional[int] = None
+        self.populate = True            # 内核不支持 MADV_POPULATE_READ 时改为 pread
+        self.started: Optional[float] = None
+        self.finished = 0.0
+        self.remaining = 0              # 尚未完成的块数
+        libc = _get_libc()
+        if libc is not None and self.size:
+            self.address = libc.map(self.fd, self.size)
+            libc.madvise(self.address, self.size, mmap.MADV_SEQUENTIAL)
+
+    def close(self):
+        libc = _get_libc()
+        if self.address is not None:
+            libc.munmap(self.address, self.size)
+            self.address = None
+        os.close(self.fd)
+
+
+class Prefetcher:
+    """
+    并行把模型分片读入 page cache
+    """
+
+    def __init__(self, jobs: int = 8, chunk_bytes: int = 64 * 1024 ** 2):
+        """
+        Args:
+            jobs: 并行线程数（NVMe / 云盘通常 8-16 个并发读取才能跑满带宽）
+            chunk_bytes: 每个任务处理的块大小
+        """
+        self.jobs = jobs
+        self.chunk_bytes = max(PAGE_SIZE, chunk_bytes // PAGE_SIZE * PAGE_SIZE)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _buffer(self) -> bytearray:
+        """pread 回退路径的线程私有缓冲区"""
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = bytearray(min(self.chunk_bytes, 16 * 1024 ** 2))
+        return buffer
+
+    def _load(self, shard: _Shard, offset: int, length: int):
+        """预热一个块：优先 MADV_POPULATE_READ，不支持时 pread"""
+        with self._lock:
+            if shard.started is None:
+                shard.started = time.perf_counter()
+        if offset + length < shard.size and hasattr(os, 'posix_fadvise'):
+            # 预读下一块：内核在后台发起 I/O
+            os.posix_fadvise(shard.fd, offset + length, self.chunk_bytes, os.POSIX_FADV_WILLNEED)
+        if shard.address is not None and shard.populate:
+            if _get_libc().madvise(shard.address + offset, length, MADV_POPULATE_READ) == 0:
+                self._done(shard)
+                return
+            shard.populate = False      # EINVAL：内核太旧，之后都走 pread
+
+        buffer = self._buffer()
+        view = memoryview(buffer)
+        end = offset + length
+        while offset < end:
+            read = os.preadv(shard.fd, [view[:min(len(buffer), end - offset)]], offset)
+            if read <= 0:
+                break
+            offset += read
+        self._done(shard)
+
+    def _done(self, shard: _Shard):
+        with self._lock:
+            shard.remaining -= 1
+            if shard.remaining == 0:
+                shard.finished = time.perf_counter()
+
+    def prefetch(self, paths: Sequence[Path]) -> Tuple[List[ShardReport], float]:
+        """
+        预热一组文件
+
+        Returns:
+            (各分片结果, 总耗时秒)
+        """
+        reports = [ShardReport(str(p), p.stat().st_size, resident_before=resident_bytes(p)) for p in paths]
+        start = time.perf_counter()
+        shards = [_Shard(p) for p in paths]
+        try:
+            with ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="prefetch") as pool:
+                futures = []
+                for shard in shards:
+                    offsets = range(0, shard.size, self.chunk_bytes)
+                    shard.remaining = len(offsets)
+                    for offset in offsets:
+                        length = min(self.chunk_bytes, shard.size - offset)
+                        futures.append(pool.submit(self._load, shard, offset, length))
+                for future in futures:
+                    future.result()
+        finally:
+            for shard in shards:
+                shard.close()
+        elapsed = time.perf_counter() - start
+
+        for report, shard in zip(reports, shards):
+            if shard.started is not None:
+                report.seconds = shard.finished - shard.started
+            report.resident_after = resident_bytes(Path(report.path))
+        return reports, elapsed
+
+
+# ============ 命令行 ============
+
+def find_shards(model_dir: Path, patterns: Sequence[str] = DEFAULT_PATTERNS) -> List[Path]:
+    """模型目录中的权重分片（按文件名排序）"""
+    shards = sorted({p for pattern in patterns for p in model_dir.glob(pattern) if p.is_file()})
+    if not shards:
+        raise FileNotFoundError(f"{model_dir} 中没有匹配 {', '.join(patterns)} 的文件")
+    return shards
+
+
+def available_memory() -> Optional[int]:
+    """/proc/meminfo 中的 MemAvailable（字节）"""
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _percent(value: Optional[int], total: int) -> str:
+    return '-' if value is None or not total else f"{value / total:.1%}"
+
+
+def print_report(model_dir: Path, reports: List[ShardReport], elapsed: Optional[float]):
+    total = sum(r.size for r in reports)
+    before = None if any(r.resident_before is None for r in reports) else sum(r.resident_before for r in reports)
+    after = None if any(r.resident_after is None for r in reports) else sum(r.resident_after for r in reports)
+
+    print("=" * 60)
+    print(f"模型: {model_dir}")
+    print(f"分片: {len(reports)} 个，共 {total / GiB:.2f} GiB")
+    print("-" * 60)
+    for r in reports:
+        line = f"  {Path(r.path).name:<40} {r.size / GiB:6.2f} GiB  已缓存 {_percent(r.resident_before, r.size):>6}"
+        if elapsed is not None:
+            line += f" → {_percent(r.resident_after, r.size):>6}  {r.seconds:5.1f}s"
+        print(line)
+    print("-" * 60)
+    if elapsed is None:
+        print(f"page cache 中已有: {_percent(before, total)}")
+    else:
+        loaded = total - (before or 0)
+        print(f"预热前 {_percent(before, total)} → 预热后 {_percent(after, total)}")
+        print(f"耗时 {elapsed:.1f}s，读取 {loaded / GiB:.2f} GiB，"
+              f"{loaded / 1e9 / max(elapsed, 1e-9):.2f} GB/s（总量 {total / 1e9 / max(elapsed, 1e-9):.2f} GB/s）")
+    memory = available_memory()
+    if memory is not None and total > memory:
+        print(f"⚠️  模型 {total / GiB:.1f} GiB 大于可用内存 {memory / GiB:.1f} GiB，部分分片会被挤出 page cache")
+    print("=" * 60)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="把模型权重并行读入 page cache，缩短冷启动")
+    parser.add_argument("model_dir", help="模型目录")
+    parser.add_argument("--check", action="store_true", help="只报告已驻留在 page cache 中的比例")
+    parser.add_argument("--evict", action="store_true", help="把模型移出 page cache（测量冷启动用）")
+    parser.add_argument("--jobs", type=int, default=8, help="并行线程数")
+    parser.add_argument("--chunk-mib", type=int, default=64, help="每个任务的块大小（MiB）")
+    parser.add_argument("--pattern", action="append", help="分片文件名模式，默认 *.safetensors（可重复）")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    model_dir = Path(args.model_dir)
+    shards = find_shards(model_dir, args.pattern or DEFAULT_PATTERNS)
+
+    if args.evict:
+        for shard in shards:
+            evict(shard)
+
+    elapsed = None
+    if args.check or args.evict:
+        reports = [ShardReport(str(p), p.stat().st_size, resident_before=resident_bytes(p)) for p in shards]
+    else:
+        reports, elapsed = Prefetcher(args.jobs, args.chunk_mib * 1024 ** 2).prefetch(shards)
+
+    if args.json:
+        total = sum(r.size for r in reports)
+        result: Dict = {
+            'model_dir': str(model_dir),
+            'total_bytes': total,
+            'seconds': elapsed,
+            'shards': [asdict(r) for r in reports],
+        }
+        residents = [r.resident_after if elapsed is not None else r.resident_before for r in reports]
+        result['resident_ratio'] = None if None in residents or not total else sum(residents) / total
+        if elapsed:
+            result['gb_per_s'] = total / 1e9 / elapsed
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print_report(model_dir, reports, elapsed)
+
+
+if __name__ == "__main__":
+    main()